@@ -0,0 +1,51 @@
+"""
+Time building the transitive closure of a random graph with the ParallelEngine
+for an increasing number of workers, next to Engine and SemiNaiveEngine.
+
+    python -m benchmarks.parallel [nodes] [edges] [most workers]
+
+By default the number of workers goes up to the number of CPUs.
+"""
+
+import sys
+import time
+import random
+import multiprocessing
+from eunomia.models import Rule, Atom, Term
+from eunomia.engine import Engine
+from eunomia.seminaive import SemiNaiveEngine
+from eunomia.parallel import ParallelEngine
+import eunomia.utils
+
+def transitive_closure(nodes, edges):
+    program = eunomia.utils.load_program('examples/path.lp')
+    rnd = random.Random(42)
+    for i in range(edges):
+        x, y = rnd.randint(0, nodes), rnd.randint(0, nodes)
+        program.add_fact(Rule(Atom(Term("edge"), [ Term("n%d" % x), Term("n%d" % y)]), []))
+    return program
+
+def timed(build):
+    start = time.time()
+    engine = build()
+    return time.time() - start, len(engine.get_facts())
+
+def main(nodes=300, edges=600, most=None):
+    program = transitive_closure(nodes, edges)
+
+    seconds, facts = timed(lambda: Engine(program))
+    print("%-24s %8.2fs  %d facts" % ("Engine", seconds, facts))
+    seconds, facts = timed(lambda: SemiNaiveEngine(program))
+    print("%-24s %8.2fs  %d facts" % ("SemiNaiveEngine", seconds, facts))
+
+    workers = 1
+    most = most or multiprocessing.cpu_count()
+    while True:
+        seconds, facts = timed(lambda: ParallelEngine(program, workers))
+        print("%-24s %8.2fs  %d facts" % ("ParallelEngine (%d)" % workers, seconds, facts))
+        if workers >= most:
+            break
+        workers = min(2 * workers, most)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
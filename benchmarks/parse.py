@@ -0,0 +1,52 @@
+"""
+Time parsing: the cold start (import and first parse in a fresh interpreter),
+the latency of parsing a small command the way eis does (a new Parser for
+every command), and the throughput on a large file of facts for the Parser
+and for eunomia.reader.
+
+    python -m benchmarks.parse [facts]
+"""
+
+import sys
+import time
+import subprocess
+from eunomia.parser import Parser
+from eunomia.reader import read_program
+
+COLD_START = """
+import time
+start = time.time()
+from eunomia.parser import Parser
+Parser().parse('path(a, ?x).')
+print(time.time() - start)
+"""
+
+def cold_start():
+    output = subprocess.check_output([sys.executable, '-c', COLD_START])
+    return float(output.decode().strip())
+
+def per_command(commands=1000):
+    start = time.time()
+    for i in range(commands):
+        Parser().parse('path(a, ?x) :- edge(a, ?y), path(?y, ?x).')
+    return (time.time() - start) / commands
+
+def large_file(facts):
+    text = ''.join(['edge(n%d, n%d).\n' % (i, (7 * i) % facts) for i in range(facts)])
+    start = time.time()
+    Parser().parse(text)
+    parser = time.time() - start
+    start = time.time()
+    read_program(text.splitlines(True))
+    reader = time.time() - start
+    return parser, reader
+
+def main(facts=100000):
+    print("cold start (import and first parse)  %8.2f ms" % (1000 * cold_start()))
+    print("per command (new Parser and parse)   %8.3f ms" % (1000 * per_command()))
+    parser, reader = large_file(facts)
+    print("%d facts with Parser              %8.2f s" % (facts, parser))
+    print("%d facts with eunomia.reader      %8.2f s" % (facts, reader))
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
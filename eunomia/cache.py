@@ -0,0 +1,121 @@
+"""
+A cache of query results for Engine.get_matching_facts: the facts that match
+a query atom are kept until a fact of the atom's predicate is added or
+removed, so asking the same query again between updates is one dictionary
+lookup.
+"""
+
+from collections import OrderedDict
+
+class QueryCache(object):
+    """
+    The results of at most max_queries queries, with together at most
+    max_facts facts; when there are more, the least recently used results
+    are dropped. A result with more than max_facts facts is not cached.
+
+    Queries are keyed by their pattern: the predicate and the arguments,
+    with the variables numbered in the order they appear, so p(?x, b) and
+    p(?y, b) share their result.
+    """
+
+    def __init__(self, max_queries=1024, max_facts=1000000):
+        self.max_queries = max_queries
+        self.max_facts = max_facts
+
+        # pattern -> list of facts, least recently used first
+        self.results = OrderedDict()
+
+        # predicate id -> set of the patterns with that predicate
+        self.by_predicate = {}
+
+        # the number of facts in all results
+        self.num_facts = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, atom):
+        """
+        The cached facts matching atom, or None.
+        """
+        key = _pattern(atom)
+        facts = self.results.pop(key, None)
+        if facts is None:
+            self.misses += 1
+            return None
+        # it is the most recently used now
+        self.results[key] = facts
+        self.hits += 1
+        return facts
+
+    def put(self, atom, facts):
+        """
+        Cache facts (a list) as the result of the query atom.
+        """
+        if len(facts) > self.max_facts or self.max_queries <= 0:
+            return
+        key = _pattern(atom)
+        old = self.results.pop(key, None)
+        if old is not None:
+            self.num_facts -= len(old)
+        self.results[key] = facts
+        self.num_facts += len(facts)
+        self.by_predicate.setdefault(atom.predicate.id, set()).add(key)
+
+        while len(self.results) > self.max_queries or self.num_facts > self.max_facts:
+            (key, old) = self.results.popitem(last=False)
+            self.__forget(key, old)
+            self.evictions += 1
+
+    def invalidate(self, pred):
+        """
+        Drop the results of the queries with predicate id pred.
+        """
+        keys = self.by_predicate.pop(pred, None)
+        if keys:
+            for key in keys:
+                self.num_facts -= len(self.results.pop(key))
+            self.invalidations += len(keys)
+
+    def clear(self):
+        """
+        Drop all results.
+        """
+        self.results.clear()
+        self.by_predicate.clear()
+        self.num_facts = 0
+
+    def stats(self):
+        """
+        A dict with the numbers of cached queries and facts, and of hits,
+        misses, invalidated and evicted results so far.
+        """
+        return {'queries': len(self.results), 'facts': self.num_facts,
+                'hits': self.hits, 'misses': self.misses,
+                'invalidations': self.invalidations, 'evictions': self.evictions}
+
+    def __len__(self):
+        return len(self.results)
+
+    ## Private
+
+    def __forget(self, key, facts):
+        self.num_facts -= len(facts)
+        keys = self.by_predicate[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self.by_predicate[key[0]]
+
+## Private functions
+
+def _pattern(atom):
+    variables = {}
+    args = []
+    for arg in atom.args:
+        if arg.is_var:
+            args.append(-1 - variables.setdefault(arg.id, len(variables)))
+        else:
+            args.append(arg.id)
+    return (atom.predicate.id, tuple(args))
@@ -0,0 +1,369 @@
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+
+from eunomia.models import Atom, Term
+
+class ColumnarEngine(object):
+    """
+    An engine that stores the facts of each predicate as a columnar integer
+    array (one column per argument position, holding symbol ids) and
+    evaluates rule bodies with vectorized numpy operations: selections are
+    boolean masks, joins are sort/searchsorted merges and duplicates are
+    removed with sorted unique keys.
+
+    Evaluation is semi-naive, like SemiNaiveEngine. Facts and rules can be
+    pushed and the facts read as with Engine (get_facts, iter_facts,
+    count_facts, get_matching_facts, exists and explain), but they can not
+    be retracted and the engine can not be saved. numpy is only needed for
+    this engine.
+    """
+
+    def __init__(self, program):
+        if numpy is None:
+            raise ImportError('ColumnarEngine needs numpy')
+
+        # store the original program
+        self.program = program
+
+        # the (original) rules, in the order they were added
+        self.rules = []
+        self.rule_set = set()
+
+        # (predicate id, arity) -> Relation
+        self.relations = {}
+
+        # Now add rules and facts and evaluate
+        self.push_program(self.program)
+
+    def push_rule(self, rule):
+        self.__propagate([rule], [])
+
+    def push_fact(self, fact):
+        # fact is assumed to be an atom
+        self.__propagate([], [fact])
+
+    def push_rules(self, rules):
+        self.__propagate(rules, [])
+
+    def push_facts(self, facts):
+        self.__propagate([], [f.head for f in facts])
+
+    def push_program(self, program):
+        self.__propagate(program.rules, [f.head for f in program.facts])
+
+    def get_facts(self):
+        facts = []
+        for (pred, arity), relation in self.relations.items():
+            facts.extend(_to_atoms(pred, relation.rows))
+        return facts
+
+    def iter_facts(self):
+        """
+        Yield every known fact once, making the atoms of one predicate at a
+        time.
+        """
+        for (pred, arity), relation in list(self.relations.items()):
+            for fact in _to_atoms(pred, relation.rows):
+                yield fact
+
+    def count_facts(self, predicate=None):
+        """
+        The number of known facts, or of known facts with predicate (a name).
+        """
+        if predicate is None:
+            return sum(len(relation) for relation in self.relations.values())
+        pred = Term(predicate).id
+        return sum(len(relation) for (key, relation) in self.relations.items() if key[0] == pred)
+
+    def get_matching_facts(self, atom):
+        relation = self.relations.get(_key(atom))
+        if relation is None:
+            return []
+        rows = relation.rows
+        selection = _select(atom, rows)
+        return _to_atoms(atom.predicate.id, rows[selection])
+
+    def exists(self, atom):
+        """
+        Whether some known fact matches atom, without making atoms of them.
+        """
+        relation = self.relations.get(_key(atom))
+        return relation is not None and bool(_select(atom, relation.rows).any())
+
+    def explain(self, rule):
+        """
+        Show how the body of rule is joined with the current facts: the body
+        atoms in the order they are joined (the order of the body), each with
+        the estimated and actual number of bindings after it, as (atom,
+        estimated, actual) triples like Engine.explain. The estimate divides
+        by the number of distinct values of every variable the atom shares
+        with the atoms before it.
+        """
+        relations = self.__rows()
+        steps = []
+        length, columns = 1, {}
+        estimated = 1.0
+        for atom in rule.body:
+            rows = relations.get(_key(atom))
+            if rows is None:
+                rows = numpy.empty((0, len(atom.args)), dtype=numpy.int64)
+            selected = rows[_select(atom, rows)]
+            estimated *= len(selected)
+            seen = set()
+            for p, arg in enumerate(atom.args):
+                if arg.is_var and arg.id in columns and arg.id not in seen:
+                    estimated /= max(len(numpy.unique(selected[:, p])), 1)
+                seen.add(arg.id)
+            length, columns = _join(length, columns, atom, rows)
+            steps.append((atom, estimated, length))
+        return steps
+
+    # Private
+
+    def __propagate(self, rules, facts):
+        """
+        Add rules and facts and evaluate until no new facts can be derived.
+        """
+        derived = {}
+
+        # New rules are first evaluated against the facts known so far
+        for rule in rules:
+            if rule.is_fact():
+                facts.append(rule.head)
+            elif rule not in self.rule_set:
+                self.rule_set.add(rule)
+                self.rules.append(rule)
+                full = self.__rows()
+                self.__evaluate(rule, [full] * len(rule.body), derived)
+
+        for fact in facts:
+            row = numpy.array([[arg.id for arg in fact.args]], dtype=numpy.int64)
+            derived.setdefault(_key(fact), []).append(row)
+
+        delta = self.__new_rows(derived)
+        while delta:
+            # old: the facts before this round, full: old plus delta
+            old = self.__rows()
+            for key, rows in delta.items():
+                self.__relation(key).add(rows)
+            full = self.__rows()
+
+            derived = {}
+            for rule in self.rules:
+                body = rule.body
+                for i, atom in enumerate(body):
+                    if _key(atom) in delta:
+                        relations = [full] * i + [delta] + [old] * (len(body) - i - 1)
+                        self.__evaluate(rule, relations, derived)
+            delta = self.__new_rows(derived)
+
+    def __rows(self):
+        return dict((key, relation.rows) for key, relation in self.relations.items())
+
+    def __relation(self, key):
+        relation = self.relations.get(key)
+        if relation is None:
+            relation = self.relations[key] = Relation(key[1])
+        return relation
+
+    def __new_rows(self, derived):
+        """
+        For the lists of derived rows per predicate, get the unique rows that
+        are not known yet.
+        """
+        delta = {}
+        for key, row_list in derived.items():
+            rows = numpy.concatenate(row_list)
+            relation = self.relations.get(key)
+            if relation is None:
+                rows = _unique(rows)
+            else:
+                rows = relation.difference(rows)
+            if len(rows):
+                delta[key] = rows
+        return delta
+
+    def __evaluate(self, rule, relations, derived):
+        """
+        Join the body atoms of rule, the j-th one against relations[j], and
+        add the resolved head rows to derived.
+        """
+        # A table of bindings: the number of rows and a column per variable
+        length, columns = 1, {}
+        for j, atom in enumerate(rule.body):
+            rows = relations[j].get(_key(atom))
+            if rows is None or not len(rows):
+                return
+            length, columns = _join(length, columns, atom, rows)
+            if not length:
+                return
+
+        head = rule.head
+        head_columns = []
+        for arg in head.args:
+            if arg.is_var:
+                head_columns.append(columns[arg.id])
+            else:
+                head_columns.append(numpy.full(length, arg.id, dtype=numpy.int64))
+        if head_columns:
+            rows = numpy.column_stack(head_columns)
+        else:
+            rows = numpy.empty((length, 0), dtype=numpy.int64)
+        derived.setdefault(_key(head), []).append(rows)
+
+
+class Relation(object):
+    """
+    The facts of one predicate: an (n, arity) array of symbol ids without
+    duplicates, sorted on the byte keys of the rows (see _row_keys).
+    """
+
+    def __init__(self, arity):
+        self.arity = arity
+        self.rows = numpy.empty((0, arity), dtype=numpy.int64)
+        self.keys = _row_keys(self.rows)
+
+    def difference(self, rows):
+        """
+        The unique rows of rows that are not in this relation.
+        """
+        rows = _unique(rows)
+        keys = _row_keys(rows)
+        return rows[~_contains(self.keys, keys)]
+
+    def add(self, rows):
+        """
+        Add unique rows that are not in this relation yet. This creates new
+        arrays, so earlier values of self.rows stay valid.
+        """
+        keys = _row_keys(rows)
+        order = numpy.argsort(keys, kind='stable')
+        keys = keys[order]
+        positions = numpy.searchsorted(self.keys, keys)
+        self.keys = numpy.insert(self.keys, positions, keys)
+        self.rows = numpy.insert(self.rows, positions, rows[order], axis=0)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+## Vectorized helpers
+
+def _key(atom):
+    return (atom.predicate.id, len(atom.args))
+
+def _row_keys(rows):
+    """
+    One comparable key per row: the bytes of the row. Rows without columns
+    all get the same key.
+    """
+    if rows.shape[1] == 0:
+        return numpy.zeros(len(rows), dtype=numpy.int8)
+    rows = numpy.ascontiguousarray(rows)
+    return rows.view(numpy.dtype((numpy.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+
+def _unique(rows):
+    keys = _row_keys(rows)
+    _, first = numpy.unique(keys, return_index=True)
+    return rows[first]
+
+def _contains(sorted_keys, keys):
+    """
+    For each of keys, whether it is in sorted_keys.
+    """
+    if not len(sorted_keys):
+        return numpy.zeros(len(keys), dtype=bool)
+    positions = numpy.searchsorted(sorted_keys, keys)
+    positions[positions == len(sorted_keys)] = 0
+    return sorted_keys[positions] == keys
+
+def _select(atom, rows):
+    """
+    A mask of the rows that match the constants and repeated variables of
+    atom.
+    """
+    selection = numpy.ones(len(rows), dtype=bool)
+    first = {}
+    for p, arg in enumerate(atom.args):
+        if not arg.is_var:
+            selection &= rows[:, p] == arg.id
+        elif arg.id in first:
+            selection &= rows[:, p] == rows[:, first[arg.id]]
+        else:
+            first[arg.id] = p
+    return selection
+
+def _join(length, columns, atom, rows):
+    """
+    Join a table of bindings (length rows, a column per variable) with the
+    rows of a relation for atom. Returns the new table of bindings.
+    """
+    rows = rows[_select(atom, rows)]
+
+    # the columns atom binds
+    atom_columns = {}
+    for p, arg in enumerate(atom.args):
+        if arg.is_var and arg.id not in atom_columns:
+            atom_columns[arg.id] = rows[:, p]
+
+    shared = [v for v in atom_columns if v in columns]
+    if shared:
+        left, right = _join_keys([columns[v] for v in shared],
+                                 [atom_columns[v] for v in shared])
+        left_idx, right_idx = _matching_pairs(left, right)
+    else:
+        # a cross product
+        left_idx = numpy.repeat(numpy.arange(length), len(rows))
+        right_idx = numpy.tile(numpy.arange(len(rows)), length)
+
+    new_columns = dict((v, column[left_idx]) for v, column in columns.items())
+    for v, column in atom_columns.items():
+        if v not in new_columns:
+            new_columns[v] = column[right_idx]
+    return len(left_idx), new_columns
+
+def _join_keys(left_columns, right_columns):
+    """
+    Turn the (possibly multiple) join columns of both sides into one integer
+    key per row, equal keys meaning equal values in all columns.
+    """
+    if len(left_columns) == 1:
+        return left_columns[0], right_columns[0]
+    left = numpy.column_stack(left_columns)
+    right = numpy.column_stack(right_columns)
+    _, codes = numpy.unique(numpy.concatenate([left, right]), axis=0, return_inverse=True)
+    codes = codes.reshape(-1)
+    return codes[:len(left)], codes[len(left):]
+
+def _matching_pairs(left, right):
+    """
+    All pairs (i, j) with left[i] == right[j], as two index arrays.
+    """
+    order = numpy.argsort(right, kind='stable')
+    sorted_right = right[order]
+    lo = numpy.searchsorted(sorted_right, left, 'left')
+    hi = numpy.searchsorted(sorted_right, left, 'right')
+    counts = hi - lo
+    total = counts.sum()
+    left_idx = numpy.repeat(numpy.arange(len(left)), counts)
+    # for every pair, its offset within the range lo[i]..hi[i]
+    starts = numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    offsets = numpy.arange(total) - starts
+    right_idx = order[numpy.repeat(lo, counts) + offsets]
+    return left_idx, right_idx
+
+def _to_atoms(pred, rows):
+    predicate = Term.from_id(pred)
+    terms = {}
+    atoms = []
+    for row in rows.tolist():
+        args = []
+        for sid in row:
+            term = terms.get(sid)
+            if term is None:
+                term = terms[sid] = Term.from_id(sid)
+            args.append(term)
+        atoms.append(Atom(predicate, args))
+    return atoms
@@ -1,78 +1,613 @@
+import io
+import csv
+import sys
+from collections import deque
+from itertools import islice
 from eunomia.index import FactIndex, RuleIndex
+from eunomia.cache import QueryCache
+from eunomia.stats import Statistics
 from eunomia.models import Program, Rule, Atom, Term
+from eunomia.plan import Planner, signature
+import eunomia.snapshot
+
+# Orders in which the Engine processes the facts and rules it derives
+FIFO = 'fifo'
+LIFO = 'lifo'
+FACTS_FIRST = 'facts'
+ORDERS = (FIFO, LIFO, FACTS_FIRST)
 
 class Engine(object):
+
+    # the number of rows load_facts reads and deduplicates at a time
+    LOAD_BATCH = 10000
     
-    def __init__(self, program):
-        
-        # store the original program
-        self.program = program
+    def __init__(self, program, order=FIFO, fact_index=None, max_partial_rules=None,
+                 max_cached_queries=1024, statistics=False):
+        """
+        order is the order in which derived facts and rules are processed:
+        FIFO (breadth-first), LIFO (depth-first) or FACTS_FIRST (all pending
+        facts before any pending rule). The minimal model is the same for
+        each of them, only the time and peak memory to get there differ.
 
-        # an index of rules for fast resolution
-        self.rule_index = RuleIndex()
+        fact_index is the store for the facts, by default a new FactIndex
+        (see eunomia.mapped for one on disk).
 
-        # an index of ground facts
-        self.fact_index = FactIndex()
+        max_partial_rules is the number of partially resolved rules that
+        are kept in the rule index: None keeps all of them, 0 none, and n
+        only the n most recent ones. They are not needed for the model to be
+        complete (a new fact is resolved with the pushed rules too, and every
+        rule is joined with all known facts), they only save the work of
+        making the same partial rule again.
 
+        max_cached_queries is the number of query results get_matching_facts
+        keeps (see eunomia.cache), 0 to not cache them.
 
-        # A register of rules and facts in the system, to be able to check
-        # existence fast.
-        self.register = {}
+        With statistics the work of evaluating the program is counted (see
+        enable_statistics).
+        """
+        self.__setup(program, order, fact_index, max_partial_rules, max_cached_queries)
+        self.enable_statistics(statistics)
 
         # Now add rules and facts to index and resolve
         self.push_program(self.program)
 
     def push_rule(self, rule):
-        # After resolution the original rule might now be trying to push a
-        # rule that is essentially a fact (empty body)
-        if rule.is_fact():
-            self.push_fact(rule.head)
-        else:
-            if not self.__in_register(rule):
-                # it's not seen yet:
-                self.__add_register(rule)
-                self.rule_index.add_rule(rule)
-
-                new_rules = self.fact_index.get_resolutions(rule)
-                self.push_rules(new_rules)
+        self.__add_explicit([rule], [])
+        self.pending_rules.append(rule)
+        self.__run()
 
     def push_fact(self, fact):
         # fact is assumed to be an atom
-        if not self.__in_register(fact):
-            # it's not seen yet:
-            self.__add_register(fact)
-            self.fact_index.add_fact(fact)
-
-            # now get all resolved rules with that fact.
-            new_rules = self.rule_index.get_resolutions(fact)
-            # and mutually recurse by pushing these new rules:
-            # Note that some of these rules might be facts now (because of
-            # resolution)
-            self.push_rules(new_rules)
+        self.__add_explicit([], [fact])
+        self.pending_facts.append(fact)
+        self.__run()
 
     def push_rules(self, rules):
-        for r in rules:
-            self.push_rule(r)
+        self.__add_explicit(rules, [])
+        self.pending_rules.extend(rules)
+        self.__run()
 
     def push_facts(self, facts):
-        for f in facts:
-            self.push_fact(f.head)
+        self.push_delta([f.head for f in facts])
+
+    def push_delta(self, facts, rules=()):
+        """
+        Push a batch of facts (atoms) and rules at once. The rules are
+        processed as usual, but the new facts are propagated set-at-a-time:
+        all of them form one delta that is joined with the rules per
+        predicate, and so are the facts derived from it, round after round
+        (like SemiNaiveEngine), instead of being resolved one fact at a time.
+        Returns the number of new facts, derived ones included.
+        """
+        before = len(self.fact_index)
+        self.__add_explicit(rules, facts)
+        self.pending_rules.extend(rules)
+        self.__run()
+        self.__propagate_delta([fact for fact in facts if self.__store_fact(fact)])
+        return len(self.fact_index) - before
 
     def push_program(self, program):
-        self.push_rules(program.rules)
-        self.push_facts(program.facts)
+        heads = [f.head for f in program.facts]
+        self.__add_explicit(program.rules, heads)
+        self.pending_rules.extend(program.rules)
+        self.pending_facts.extend(heads)
+        self.__run()
+
+    def retract_fact(self, fact):
+        """
+        Remove the fact (an atom that was pushed or loaded before) and update
+        the model incrementally with Delete and Rederive (see __retract). The
+        fact stays known if it still follows from the rules. Returns whether
+        fact was a pushed fact.
+        """
+        if fact not in self.explicit_facts:
+            return False
+        self.explicit_facts.remove(fact)
+        self.__retract([fact], [])
+        return True
+
+    def retract_rule(self, rule):
+        """
+        Remove the rule (one that was pushed before) and update the model
+        incrementally like retract_fact. Returns whether rule was a pushed
+        rule.
+        """
+        if rule.is_fact():
+            return self.retract_fact(rule.head)
+        if rule not in self.explicit_rules:
+            return False
+        self.explicit_rules.remove(rule)
+        self.__retract(self.planner.derive(rule), [rule])
+        return True
+
+    def load_facts(self, predicate, path, delimiter='\t'):
+        """
+        Load every row of a delimited file (TSV by default, or e.g. CSV with
+        delimiter ',') as a fact of predicate, with the fields of the row as
+        its arguments. The rows are streamed into the fact index without the
+        parser, and everything that follows from the new facts is derived
+        at once after the whole file is read. Returns the number of new facts.
+
+        Fields of a TSV file are taken as they are, quotes included; with
+        another delimiter a field can be quoted with ". Empty lines are
+        skipped, and a row with another number of fields than the first one
+        is a ValueError (facts of the read rows before it are kept, but not
+        resolved yet).
+        """
+        terms = {}
+        def term(value):
+            t = terms.get(value)
+            if t is None:
+                t = terms[value] = Term(value)
+            return t
+
+        pred = Term(predicate)
+        new_facts = []
+        quoting = csv.QUOTE_NONE if delimiter == '\t' else csv.QUOTE_MINIMAL
+        arity = None
+        with _open_csv(path) as f:
+            batch = []
+            seen = set()
+            reader = csv.reader(f, delimiter=delimiter, quoting=quoting)
+            for fields in reader:
+                row = tuple(fields)
+                if not row:
+                    continue
+                if arity is None:
+                    arity = len(row)
+                elif len(row) != arity:
+                    raise ValueError('%s line %d has %d fields, expected %d'
+                                     % (path, reader.line_num, len(row), arity))
+                if row not in seen:
+                    seen.add(row)
+                    batch.append(row)
+                    if len(batch) == self.LOAD_BATCH:
+                        self.__load_batch(pred, batch, term, new_facts)
+                        batch = []
+                        seen = set()
+            self.__load_batch(pred, batch, term, new_facts)
+
+        self.__propagate_delta(new_facts)
+        return len(new_facts)
+
+    def save(self, path):
+        """
+        Save the complete state of the engine (the program, all rules
+        including the partially resolved ones, and all facts) as a snapshot
+        to path, see eunomia.snapshot.
+        """
+        eunomia.snapshot.save(path, ORDERS.index(self.order), self.program,
+                              self.rule_index.get_all_rules(),
+                              self.fact_index.relations,
+                              self.explicit_rules, self.explicit_facts)
+
+    @classmethod
+    def load(cls, path, fact_index=None, max_partial_rules=None, max_cached_queries=1024):
+        """
+        Get the engine saved to path with save, with its facts in fact_index
+        (by default a new FactIndex). The engine is not evaluated again, and
+        later additions are incremental as on the saved engine.
+
+        max_partial_rules and max_cached_queries are as for a new Engine; of
+        the saved partially resolved rules at most max_partial_rules are
+        kept.
+        """
+        (order, program, rules, facts, explicit_rules, explicit_facts) = eunomia.snapshot.load(path)
+        engine = cls.__new__(cls)
+        engine.__setup(program, ORDERS[order], fact_index, max_partial_rules, max_cached_queries)
+        engine.explicit_rules.update(explicit_rules)
+        engine.explicit_facts.update(explicit_facts)
+        for rule in rules:
+            if max_partial_rules is not None and rule not in engine.explicit_rules:
+                if len(engine.partial_rules) >= max_partial_rules:
+                    continue
+                engine.partial_rules.append(rule)
+            engine.__add_register(rule)
+            engine.rule_index.add_rule(rule)
+        for fact in facts:
+            engine.__store_fact(fact)
+        return engine
+
+    def measure_partial_rules(self):
+        """
+        Get (number, bytes) for the partially resolved rules kept in the
+        rule index: the bytes of their rules, atoms and tuples and of their
+        entries in the rule index. Terms are shared with the facts and the
+        pushed rules, so they are not counted.
+        """
+        number = 0
+        size = 0
+        for rule in self.rule_index.get_all_rules():
+            if rule in self.explicit_rules:
+                continue
+            number += 1
+            size += sys.getsizeof(rule) + sys.getsizeof(rule.body)
+            for atom in (rule.head,) + rule.body:
+                size += sys.getsizeof(atom) + sys.getsizeof(atom.args)
+            # an (idx, rule) pair in the rule index per body atom
+            size += len(rule.body) * sys.getsizeof((0, rule))
+        return number, size
 
     def get_facts(self):
         return self.fact_index.get_all_facts()
 
-    def get_matching_facts(self, atom):
-        return self.fact_index.get_matching_facts(atom)
+    def iter_facts(self):
+        """
+        Yield every known fact once, without building a list of them.
+        """
+        return self.fact_index.iter_facts()
+
+    def count_facts(self, predicate=None):
+        """
+        The number of known facts, or of known facts with predicate (a name).
+        """
+        if predicate is None:
+            return self.fact_index.count_facts()
+        return self.fact_index.count_facts(Term(predicate).id)
+
+    def get_matching_facts(self, atom, offset=0, limit=None):
+        """
+        Get the known facts that match atom, skipping the first offset of
+        them and at most limit (None for all). Without a limit the result
+        is cached until a fact with the predicate of atom is added or
+        removed; with one only as many facts as needed are looked up.
+        """
+        if limit is not None:
+            return list(islice(self.iter_matching_facts(atom), offset, offset + limit))
+        cache = self.query_cache
+        if cache is None:
+            return self.fact_index.get_matching_facts(atom)[offset:]
+        facts = cache.get(atom)
+        if facts is None:
+            facts = self.fact_index.get_matching_facts(atom)
+            cache.put(atom, facts)
+        # a copy, so the cached result can not be changed
+        return facts[offset:]
+
+    def iter_matching_facts(self, atom):
+        """
+        Yield the known facts that match atom one at a time, from the cached
+        result if there is one, and otherwise while the fact index is
+        walked. The engine must not change while iterating.
+        """
+        if self.query_cache is not None:
+            facts = self.query_cache.get(atom)
+            if facts is not None:
+                return iter(facts)
+        return self.fact_index.iter_matching_facts(atom)
+
+    def exists(self, atom):
+        """
+        Whether some known fact matches atom, stopping at the first one.
+        """
+        for fact in self.iter_matching_facts(atom):
+            return True
+        return False
+
+    def query(self, atoms):
+        """
+        Answer the conjunctive query atoms, e.g. [edge(?x, ?y), path(?y, ?x)],
+        with a join over the known facts: get the bindings of the variables
+        for which all atoms hold, as mappings from variable ids to terms
+        (atom.resolve(binding) gives the fact an atom was matched with).
+        """
+        return self.planner.query(atoms)
+
+    def enable_statistics(self, enabled=True):
+        """
+        Count the work of the engine and its indexes from now on in a new
+        Statistics (see eunomia.stats), which is then the stats of the
+        engine, or stop counting (stats is None).
+        """
+        self.stats = Statistics() if enabled else None
+        self.rule_index.stats = self.stats
+        self.fact_index.stats = self.stats
+
+    def explain(self, rule):
+        """
+        Show how the body of rule is joined with the current facts: the body
+        atoms in the order they are joined, each with the estimated and actual
+        number of bindings after it (see Planner.explain).
+        """
+        return self.planner.explain(rule)
             
     # Private
 
-    def __add_register(self, el):
-        self.register[el.hash()] = 1
+    def __setup(self, program, order, fact_index=None, max_partial_rules=None,
+                max_cached_queries=1024):
+        if order not in ORDERS:
+            raise ValueError('Unknown order %s, use one of %s' % (order, ', '.join(ORDERS)))
+        self.order = order
+
+        # store the original program
+        self.program = program
+
+        # an index of rules for fast resolution
+        self.rule_index = RuleIndex()
+
+        # an index of ground facts
+        self.fact_index = fact_index if fact_index is not None else FactIndex()
+
+        # compiles the rules into join plans against the fact index
+        self.planner = Planner(self.fact_index)
+
+        # the results of get_matching_facts, invalidated per predicate
+        self.query_cache = QueryCache(max_cached_queries) if max_cached_queries else None
+
+        # the counters of the work done, if they are enabled
+        self.stats = None
+        self.rule_index.stats = None
+        self.fact_index.stats = None
+
+        # A register of the rules in the system, to be able to check
+        # existence fast (the fact index does this for facts).
+        self.register = set()
+
+        # The partially resolved rules kept in the rule index, oldest first,
+        # if there is a maximum number of them.
+        self.max_partial_rules = max_partial_rules
+        self.partial_rules = deque()
+
+        # The rules and facts that were pushed (rather than derived), which
+        # are the ones that can be retracted.
+        self.explicit_rules = set()
+        self.explicit_facts = set()
+
+        # The worklist of facts and rules that still need to be processed.
+        # With FACTS_FIRST the pending facts are kept apart from the rules,
+        # otherwise everything goes into the same queue.
+        self.pending_rules = deque()
+        if order == FACTS_FIRST:
+            self.pending_facts = deque()
+        else:
+            self.pending_facts = self.pending_rules
+
+    def __run(self):
+        """
+        Process the worklist until nothing is pending. Processing an item only
+        adds new items to the worklist, so the depth of the derivations does
+        not matter (there is no recursion).
+        """
+        facts = self.pending_facts
+        rules = self.pending_rules
+        lifo = self.order == LIFO
+        while facts or rules:
+            if facts:
+                item = facts.pop() if lifo else facts.popleft()
+            else:
+                item = rules.pop() if lifo else rules.popleft()
+
+            if isinstance(item, Atom):
+                self.__process_fact(item)
+            elif item.is_fact():
+                # After resolution the original rule might now be a rule that
+                # is essentially a fact (empty body)
+                self.__process_fact(item.head)
+            else:
+                self.__process_rule(item)
+
+    def __process_rule(self, rule):
+        stats = self.stats
+        if not self.__in_register(rule):
+            # it's not seen yet:
+            limit = self.max_partial_rules
+            if limit is None or rule in self.explicit_rules:
+                self.__add_register(rule)
+                self.rule_index.add_rule(rule)
+            elif limit > 0:
+                self.__add_register(rule)
+                self.rule_index.add_rule(rule)
+                self.partial_rules.append(rule)
+                if len(self.partial_rules) > limit:
+                    self.__evict(self.partial_rules.popleft())
+                    if stats is not None:
+                        stats.count('partial rules evicted')
+            if stats is not None:
+                stats.count('rules new')
+
+            # join the whole body with the known facts at once (rather than
+            # resolving it one body atom at a time)
+            derived = self.planner.derive(rule)
+            self.pending_facts.extend(derived)
+            if stats is not None:
+                stats.count('facts joined', len(derived))
+                stats.derived(rule, len(derived))
+        elif stats is not None:
+            stats.count('rules known')
+
+    def __process_fact(self, fact):
+        if self.__store_fact(fact):
+            # now get all resolved rules with that fact. Note that some of
+            # these rules might be facts now (because of resolution)
+            self.pending_rules.extend(self.rule_index.get_resolutions(fact))
+
+    def __store_fact(self, fact):
+        """
+        Add fact to the fact index if it is not seen yet. Returns whether it
+        was new.
+        """
+        if not self.fact_index.add_fact(fact):
+            if self.stats is not None:
+                self.stats.count('facts known')
+            return False
+        if self.stats is not None:
+            self.stats.count('facts new')
+        if self.query_cache is not None:
+            self.query_cache.invalidate(fact.predicate.id)
+        return True
+
+    def __load_batch(self, pred, batch, term, new_facts):
+        """
+        Store the facts of pred for the (distinct) rows in batch, without
+        resolving them yet, and add the new ones to new_facts.
+        """
+        if self.stats is not None:
+            self.stats.count('facts pushed', len(batch))
+        for row in batch:
+            fact = Atom(pred, [term(value) for value in row])
+            self.explicit_facts.add(fact)
+            if self.__store_fact(fact):
+                new_facts.append(fact)
+
+    def __add_explicit(self, rules, facts):
+        for rule in rules:
+            if rule.is_fact():
+                self.explicit_facts.add(rule.head)
+            else:
+                self.explicit_rules.add(rule)
+        self.explicit_facts.update(facts)
+        if self.stats is not None:
+            self.stats.count('rules pushed', len(rules))
+            self.stats.count('facts pushed', len(facts))
+
+    def __propagate_delta(self, delta):
+        """
+        Derive everything that follows from delta, facts that were just
+        stored, round by round: every round joins the facts that are new in
+        it (grouped per predicate) with the pushed rules. The body atoms after
+        the one a delta fact is resolved with do not use the delta, so every
+        derivation is made only once per round.
+        """
+        # (predicate id, arity) -> list of (body position, signature, params)
+        uses = {}
+        for rule in self.explicit_rules:
+            shape, params = signature(rule)
+            for idx, atom in enumerate(rule.body):
+                key = (atom.predicate.id, len(atom.args))
+                uses.setdefault(key, []).append((idx, shape, params))
+
+        to_atom = self.planner.to_atom
+        while delta:
+            skip = {}
+            by_key = {}
+            for fact in delta:
+                row = tuple([arg.id for arg in fact.args])
+                skip.setdefault(fact.predicate.id, set()).add(row)
+                by_key.setdefault((fact.predicate.id, len(row)), []).append(row)
+
+            heads = []
+            for key, rows in by_key.items():
+                for (idx, shape, params) in uses.get(key, ()):
+                    plan = self.planner.compile(shape, idx)
+                    for row in rows:
+                        for head in plan.run(self.fact_index, params, row, skip):
+                            heads.append(to_atom(plan.head_pred, head))
+            delta = [head for head in heads if self.__store_fact(head)]
+
+    def __retract(self, facts, rules):
+        """
+        Delete and Rederive: first everything that was derived using the
+        facts or rules is deleted (over-deletion, as some of it may have
+        other derivations), including the partially resolved rules made
+        with them. Then the deleted facts that are pushed facts or that
+        still follow in one step from what is left are derived again, and the
+        usual propagation derives the rest.
+        """
+        deleted_facts = []
+        deleted_rules = list(rules)
+        seen = set(rules)
+
+        def delete_fact(fact):
+            if fact not in seen and fact in self.fact_index:
+                seen.add(fact)
+                deleted_facts.append(fact)
+
+        def delete_rule(rule):
+            if (rule not in seen and rule not in self.explicit_rules
+                    and self.__in_register(rule)):
+                seen.add(rule)
+                deleted_rules.append(rule)
+
+        for fact in facts:
+            delete_fact(fact)
+
+        # Over-delete against the model as it is. The lists grow while we go
+        # through them.
+        k = 0
+        r = 0
+        while k < len(deleted_facts) or r < len(deleted_rules):
+            if r < len(deleted_rules):
+                # the rules resolved from a deleted rule with any fact
+                for resolved in self.fact_index.get_resolutions(deleted_rules[r]):
+                    if not resolved.is_fact():
+                        delete_rule(resolved)
+                r += 1
+            else:
+                for resolved in self.rule_index.get_resolutions(deleted_facts[k]):
+                    if resolved.is_fact():
+                        delete_fact(resolved.head)
+                    else:
+                        for head in self.planner.derive(resolved):
+                            delete_fact(head)
+                        delete_rule(resolved)
+                k += 1
+
+        for fact in deleted_facts:
+            self.fact_index.remove_fact(fact)
+            if self.query_cache is not None:
+                self.query_cache.invalidate(fact.predicate.id)
+        for rule in deleted_rules:
+            self.rule_index.remove_rule(rule)
+            self.register.remove(rule)
+
+        # Over-deletion finds the partial rules made with a deleted fact only
+        # through the partial rules they were made from, which may have been
+        # evicted. So with a maximum none of the kept ones can be trusted.
+        if self.max_partial_rules is not None:
+            for rule in self.partial_rules:
+                self.__evict(rule)
+            self.partial_rules.clear()
+
+        # Rederive: a deleted fact is back if it is pushed or if the body of
+        # a pushed rule with the fact as its head still holds.
+        rules_by_head = {}
+        for rule in self.explicit_rules:
+            key = (rule.head.predicate.id, len(rule.head.args))
+            rules_by_head.setdefault(key, []).append(rule)
+        for fact in deleted_facts:
+            if fact in self.explicit_facts:
+                self.pending_facts.append(fact)
+                continue
+            for rule in rules_by_head.get((fact.predicate.id, len(fact.args)), ()):
+                mapping = _match(rule.head, fact)
+                if mapping is not False:
+                    bound = Rule(fact, [atom.resolve(mapping) for atom in rule.body])
+                    if self.planner.derive(bound):
+                        self.pending_facts.append(fact)
+                        break
+        self.__run()
+
+    def __evict(self, rule):
+        """
+        Drop a partially resolved rule; it is made again (and joined with the
+        facts again) if it is resolved again.
+        """
+        if rule not in self.explicit_rules:
+            self.rule_index.remove_rule(rule)
+            self.register.discard(rule)
+
+    def __add_register(self, rule):
+        self.register.add(rule)
+
+    def __in_register(self, rule):
+        return rule in self.register
+
+## Private functions
 
-    def __in_register(self, el):
-        return el.hash() in self.register
+def _open_csv(path):
+    """
+    Open path for the csv module: without newline translation, which on
+    Python 2 means in binary mode.
+    """
+    if sys.version_info[0] < 3:
+        return open(path, 'rb')
+    return io.open(path, newline='')
 
+def _match(atom, fact):
+    """
+    The mapping of the variables of atom that makes it fact, or False.
+    """
+    for (arg, value) in zip(atom.args, fact.args):
+        if not arg.is_var and arg.id != value.id:
+            return False
+    return atom.unify_with_ground(fact)
@@ -0,0 +1,79 @@
+
+class DependencyGraph(object):
+    """
+    The predicate dependency graph of a set of rules: there is an edge from
+    every predicate in the body of a rule to the predicate of its head.
+    Predicates are keys (predicate id, arity).
+    """
+
+    def __init__(self, rules=()):
+        # key -> set of keys that depend on it
+        self.edges = {}
+        for rule in rules:
+            self.add_rule(rule)
+
+    def add_rule(self, rule):
+        head = _key(rule.head)
+        self.edges.setdefault(head, set())
+        for atom in rule.body:
+            self.edges.setdefault(_key(atom), set()).add(head)
+
+    def components(self):
+        """
+        Get the strongly connected components (lists of keys) in topological
+        order: a component only depends on components before it. This is
+        Tarjan's algorithm, without recursion so deep graphs are fine.
+        """
+        index = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        components = []
+
+        for start in self.edges:
+            if start in index:
+                continue
+            index[start] = lowlink[start] = len(index)
+            stack.append(start)
+            on_stack.add(start)
+            work = [(start, iter(self.edges[start]))]
+            while work:
+                node, successors = work[-1]
+                for succ in successors:
+                    if succ not in index:
+                        index[succ] = lowlink[succ] = len(index)
+                        stack.append(succ)
+                        on_stack.add(succ)
+                        work.append((succ, iter(self.edges[succ])))
+                        break
+                    elif succ in on_stack:
+                        lowlink[node] = min(lowlink[node], index[succ])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        components.append(component)
+
+        # Tarjan finds a component after all components that depend on it
+        components.reverse()
+        return components
+
+    def is_recursive(self, component):
+        """
+        Whether the predicates of a component depend on themselves.
+        """
+        return len(component) > 1 or component[0] in self.edges[component[0]]
+
+## Private functions
+
+def _key(atom):
+    return (atom.predicate.id, len(atom.args))
@@ -2,20 +2,33 @@ import eunomia.utils
 
 class AtomIndex(object):
     """
-    Index where keys are atom patterns (variables are all treated as -1)
+    Index where keys are atom patterns over symbol ids (variables are all
+    treated as -1, which is never a symbol id)
     """
 
     def __init__(self):
         self.index = {}
 
     def add(self, atom, value):
-        pred = atom.predicate.value
+        pred = atom.predicate.id
         if pred not in self.index:
             self.index[pred] = {}
         self.__add_args(self.index[pred], atom.args, value)
 
+    def remove(self, atom, value):
+        """
+        Remove value from the values for atom (if it is there).
+        """
+        dic = self.index.get(atom.predicate.id)
+        for el in atom.args:
+            if dic is None:
+                return
+            dic = dic.get(-1 if el.is_var else el.id)
+        if type(dic) == list and value in dic:
+            dic.remove(value)
+
     def get_values(self, atom):
-        pred = atom.predicate.value
+        pred = atom.predicate.id
         if pred not in self.index:
             return []
         else:
@@ -25,21 +38,33 @@ class AtomIndex(object):
         """
         Get all values for all keys that match the atom, where a match is any generalization of the atom.
         """
-        pred = atom.predicate.value
-        if pred not in self.index:
-            return []
-        else:
-            return self.__find_more_general(self.index[pred], atom.args)
+        return list(self.iter_more_general_matches(atom))
 
     def get_more_specific_matches(self, atom):
         """
         Get all values for all keys that match the atom, where a match is any specialization of the atom.
         """
-        pred = atom.predicate.value
+        return list(self.iter_more_specific_matches(atom))
+
+    def iter_more_general_matches(self, atom):
+        """
+        Yield the values of get_more_general_matches one at a time, while the
+        index is walked.
+        """
+        pred = atom.predicate.id
         if pred not in self.index:
-            return []
-        else:
-            return self.__find_more_specific(self.index[pred], atom.args)
+            return iter(())
+        return self.__find_more_general(self.index[pred], atom.args, 0)
+
+    def iter_more_specific_matches(self, atom):
+        """
+        Yield the values of get_more_specific_matches one at a time, while
+        the index is walked.
+        """
+        pred = atom.predicate.id
+        if pred not in self.index:
+            return iter(())
+        return self.__find_more_specific(self.index[pred], atom.args, 0)
 
     def get_all_values(self):
         """
@@ -64,7 +89,7 @@ class AtomIndex(object):
             if el.is_var:
                 key_val = -1
             else:
-                key_val = el.value
+                key_val = el.id
 
             if key_val not in dic:
                 dic[key_val] = {}
@@ -75,7 +100,7 @@ class AtomIndex(object):
             if el.is_var:
                 key_val = -1
             else:
-                key_val = el.value
+                key_val = el.id
             if key_val not in dic:
                 dic[key_val] = [value]
             # elif value not in dic[key_val]:
@@ -91,7 +116,7 @@ class AtomIndex(object):
             if el.is_var:
                 key_val = -1
             else:
-                key_val = el.value
+                key_val = el.id
 
             if key_val not in dic:
                 return []
@@ -102,64 +127,45 @@ class AtomIndex(object):
         else:
             return []
 
-    def __find_more_general(self, dic, args):
+    def __find_more_general(self, dic, args, k=0):
         """
-        Find values for keys that are more general than args.
+        Yield the values for keys that are more general than args[k:].
         """
-        if len(args) > 0:
-            el = args[0]
-            key_val1 = key_val2 = None
-            if el.is_var:
-                # only generalization is variable  -1
-                key_val1 = -1
-            else:
-                # generalize constant to both variable and constant
-                key_val1 = -1
-                key_val2 = el.value
-            
-            if key_val1 not in dic and key_val2 not in dic:
-                return []
-            else:
-                values1 = []
-                values2 = []
-                if key_val1 in dic:
-                    values1 = self.__find_more_general(dic[key_val1], args[1:])
-                if key_val2 and key_val2 in dic:
-                    values2 = self.__find_more_general(dic[key_val2], args[1:])
-                return values1 + values2
+        if k < len(args):
+            el = args[k]
+            # a variable only generalizes to a variable (-1), a constant to
+            # both a variable and itself
+            if -1 in dic:
+                for value in self.__find_more_general(dic[-1], args, k + 1):
+                    yield value
+            if not el.is_var and el.id in dic:
+                for value in self.__find_more_general(dic[el.id], args, k + 1):
+                    yield value
         elif type(dic) == list:
-            return dic
-        else:
-            return []
+            for value in dic:
+                yield value
 
-    def __find_more_specific(self, dic, args):
+    def __find_more_specific(self, dic, args, k=0):
         """
-        Find values for keys that are more specific than args. Specific means it has to be constants.
+        Yield the values for keys that are more specific than args[k:].
+        Specific means it has to be constants.
         """
-        if len(args) > 0:
-            el = args[0]
-            key_val =  None
+        if k < len(args):
+            el = args[k]
             if not el.is_var:
                 # specialized value is value itself
-                key_val = el.value 
-                
-            if key_val and key_val not in dic:
-                return []
-            elif key_val and key_val in dic:
-                return self.__find_more_specific(dic[key_val], args[1:])
-
+                if el.id in dic:
+                    for value in self.__find_more_specific(dic[el.id], args, k + 1):
+                        yield value
             else:
                 # el is a var so all constant keys would be specializations
-                values = []
                 for key in dic:
                     if key != -1: # -1 is var
-                        values.extend(self.__find_more_specific(dic[key], args[1:]))
-                return values
-
+                        for value in self.__find_more_specific(dic[key], args, k + 1):
+                            yield value
         elif type(dic) == list:
-            return dic
-        else:
-            return []
+            for value in dic:
+                yield value
 
     ## Built-ins
     def __str__(self):
@@ -176,22 +182,32 @@ class RuleIndex(object):
     def __init__(self):
         self.index = AtomIndex()
 
+        # a Statistics to count the work in, or None (see eunomia.stats)
+        self.stats = None
+
     def add_rule(self, rule):
         # for each of the body atoms we add this rule to the index.
         body = rule.body
         for idx, body_atom in enumerate(body):
             self.index.add(body_atom, (idx, rule))
 
+    def remove_rule(self, rule):
+        for idx, body_atom in enumerate(rule.body):
+            self.index.remove(body_atom, (idx, rule))
+
     def get_resolutions(self, fact):
         # for the ground fact, get all rules in the index that have some body
         # atom that unifies with the fact. Return that rule and the mapping the
         # makes up the unification.
-        candidate_idx_rule_pairs = self.index.get_more_general_matches(fact)
+        candidate_idx_rule_pairs = self.index.iter_more_general_matches(fact)
 
-        # candidate_idx_rule_pairs is a list with items (x, rule) where x is
+        # candidate_idx_rule_pairs yields items (x, rule) where x is
         # the index in the body of the rule that matches with fact.
+        stats = self.stats
         resolutions = []
         for (idx, rule) in candidate_idx_rule_pairs:
+            if stats is not None:
+                stats.count('rule index candidates')
             mapping = rule.body[idx].unify_with_ground(fact)
             if mapping is not False:
                 # resolution applys the mapping and remove the body atom at idx
@@ -199,60 +215,337 @@ class RuleIndex(object):
                 # we could optimize here by pushing immediately for resolution
                 # against facts.
                 resolutions.append(new_rule)
+                if stats is not None:
+                    stats.resolved(rule, new_rule)
+        if stats is not None:
+            stats.count('rule index unifications', len(resolutions))
         return resolutions
 
+    def get_all_rules(self):
+        """
+        Get all rules in the index (each rule once).
+        """
+        rules = []
+        def traverse(dic):
+            for value in dic.values():
+                if type(value) == dict:
+                    traverse(value)
+                else:
+                    rules.extend([rule for (idx, rule) in value if idx == 0])
+        traverse(self.index.index)
+        return rules
+
     ## Built-ins
     def __str__(self):
         return str(self.index)
 
 class FactIndex(object):
     """
-    This is an AtomIndex storing all facts. The key is the fact, the value is a
+    The facts of each relation (a predicate and arity) are kept in a hash
+    table from rows (tuples of symbol ids) to the facts, which is the one
+    place to check whether a fact is known. On top of it there are hash
+    indexes on any set of argument positions, and an AtomIndex for matching
+    atoms with variables, where the key is the fact and the value a
     singleton list of that fact.
+
+    A hash index is built once the join plans (see lookup and eunomia.plan)
+    or the queries (see get_matching_facts) asked INDEX_THRESHOLD times for
+    the rows with some values on its positions, and kept up to date from
+    then on. Until then joins scan the relation and queries walk the
+    AtomIndex, so patterns that are only used once or twice do not cost an
+    index. A hash index that was not used while its relation had as many
+    additions and removals as half its rows (and at least
+    INDEX_IDLE_MINIMUM) is dropped, as building it again when it is needed
+    costs about as much as keeping it up to date had; the relation's indexes
+    are checked for that every INDEX_IDLE_MINIMUM updates.
     """
+
+    INDEX_THRESHOLD = 3
+    INDEX_IDLE_MINIMUM = 1000
+
     def __init__(self):
         self.index = AtomIndex()
 
+        # (predicate id, arity) -> {row: fact}
+        self.relations = {}
+
+        # (predicate id, arity) -> {positions: {key: list of rows}}
+        self.hash_indexes = {}
+
+        # (predicate id, arity, positions) -> number of times asked for
+        # while there was no hash index on the positions
+        self.index_uses = {}
+
+        # (predicate id, arity) -> number of rows added and removed, and
+        # (predicate id, arity, positions) -> that number when the hash index
+        # on the positions was last used
+        self.relation_updates = {}
+        self.index_last_used = {}
+
+        # (predicate id, arity, position) -> (number of rows, number of
+        # distinct values) when last counted, see distinct
+        self.distinct_counts = {}
+
+        # the number of facts, in total and per predicate id
+        self.size = 0
+        self.predicate_sizes = {}
+
+        # a Statistics to count the work in, or None (see eunomia.stats)
+        self.stats = None
+
     def add_fact(self, fact):
+        """
+        Add fact if it is not known yet. Returns whether it was new.
+        """
+        if not self.add_row(fact.predicate.id, tuple([arg.id for arg in fact.args]), fact):
+            return False
         self.index.add(fact, fact)
+        return True
+
+    def add_row(self, pred, row, fact=None):
+        """
+        Add a row to the relation of pred if it is not there yet, for fact
+        (the atom of the row, if there is one). Without the fact only the
+        join plans can use the row, get_all_facts and get_matching_facts can
+        not. Returns whether the row was new.
+        """
+        relation_key = (pred, len(row))
+        rows = self.relations.get(relation_key)
+        if rows is None:
+            rows = self.relations[relation_key] = {}
+        elif row in rows:
+            return False
+        rows[row] = fact
+        self.size += 1
+        self.predicate_sizes[pred] = self.predicate_sizes.get(pred, 0) + 1
+
+        # keep the hash indexes on this relation up to date
+        indexes = self.hash_indexes.get(relation_key)
+        if indexes:
+            for positions, index in indexes.items():
+                key = tuple([row[p] for p in positions])
+                bucket = index.get(key)
+                if bucket is None:
+                    index[key] = [row]
+                else:
+                    bucket.append(row)
+            self.__updated(relation_key, indexes)
+        return True
+
+    def remove_fact(self, fact):
+        self.index.remove(fact, fact)
+
+        row = tuple([arg.id for arg in fact.args])
+        relation_key = (fact.predicate.id, len(row))
+        del self.relations[relation_key][row]
+        self.size -= 1
+        self.predicate_sizes[fact.predicate.id] -= 1
+
+        indexes = self.hash_indexes.get(relation_key)
+        if indexes:
+            for positions, index in indexes.items():
+                key = tuple([row[p] for p in positions])
+                bucket = index[key]
+                bucket.remove(row)
+                if not bucket:
+                    del index[key]
+            self.__updated(relation_key, indexes)
+
+    def lookup(self, pred, arity, positions, key):
+        """
+        Get the rows of the relation pred/arity that have the values key on
+        the argument positions (a tuple), from the hash index on those
+        positions or, while there is none, by a scan of the relation. If all
+        positions are bound the key is the row, and the rows of the relation
+        are probed with it.
+        """
+        relation_key = (pred, arity)
+        if self.stats is not None:
+            self.stats.count('fact index lookups')
+        if not positions:
+            return self.relations.get(relation_key, ())
+        if len(positions) == arity and positions == tuple(range(arity)):
+            rows = self.relations.get(relation_key)
+            return [key] if rows is not None and key in rows else ()
+
+        index = self.__hash_index(relation_key, positions)
+        if index is None:
+            if self.stats is not None:
+                self.stats.count('fact index scans')
+            return [row for row in self.relations.get(relation_key, ())
+                    if tuple([row[p] for p in positions]) == key]
+        return index.get(key, ())
+
+    def count(self, pred, arity):
+        """
+        The number of facts of the relation pred/arity.
+        """
+        return len(self.relations.get((pred, arity), ()))
+
+    def distinct(self, pred, arity, position):
+        """
+        The number of distinct values on an argument position of the relation
+        pred/arity (at least 1). If there is no hash index on the position to
+        read it from, it is counted again whenever the relation doubled in
+        size since the last count.
+        """
+        relation_key = (pred, arity)
+        index = self.hash_indexes.get(relation_key, {}).get((position,))
+        if index is not None:
+            return max(len(index), 1)
+
+        rows = self.relations.get(relation_key, ())
+        count_key = (pred, arity, position)
+        counted = self.distinct_counts.get(count_key)
+        if counted is None or len(rows) >= 2 * counted[0]:
+            counted = (len(rows), len(set([row[position] for row in rows])))
+            self.distinct_counts[count_key] = counted
+        return max(counted[1], 1)
 
     def get_resolutions(self, rule):
         """
         Get all new rules that result for matching ground facts in the fact index with any rule body atom.
         """
+        stats = self.stats
         resolutions = []
         for idx, body_atom in enumerate(rule.body):
-            candidates = self.index.get_more_specific_matches(body_atom)
+            candidates = self.index.iter_more_specific_matches(body_atom)
 
             for cand in candidates:
+                if stats is not None:
+                    stats.count('fact index candidates')
                 mapping = body_atom.unify_with_ground(cand)
                 if mapping is not False:
                     new_rule = rule.resolve(idx, mapping)
-                resolutions.append(new_rule)
+                    resolutions.append(new_rule)
+        if stats is not None:
+            stats.count('fact index unifications', len(resolutions))
         return resolutions
 
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, fact):
+        rows = self.relations.get((fact.predicate.id, len(fact.args)))
+        return rows is not None and tuple([arg.id for arg in fact.args]) in rows
+
+    def count_facts(self, pred=None):
+        """
+        The number of facts, or of facts with predicate id pred (of any
+        arity).
+        """
+        if pred is None:
+            return self.size
+        return self.predicate_sizes.get(pred, 0)
+
+    def iter_facts(self):
+        """
+        Yield every fact currently known to the fact index, each once. The
+        fact index must not change while iterating.
+        """
+        for rows in self.relations.values():
+            for row in rows:
+                fact = rows[row]
+                if fact is not None:
+                    yield fact
+
     def get_all_facts(self):
         """
         Get all facts currently known to fact index.
         """
-        return self.index.get_all_values()
+        return list(self.iter_facts())
 
     def get_matching_facts(self, atom):
         """
         Get all facts that match the atom (answer the query).
         """
-        candidates = self.index.get_more_specific_matches(atom)
+        return list(self.iter_matching_facts(atom))
+
+    def iter_matching_facts(self, atom):
+        """
+        Yield the facts that match the atom one at a time, while the indexes
+        are walked, so the first answers come without finding all of them.
+        The fact index must not change while iterating.
+        """
+        relation_key = (atom.predicate.id, len(atom.args))
+        rows = self.relations.get(relation_key, {})
+        positions = tuple([p for (p, arg) in enumerate(atom.args) if not arg.is_var])
+        if len(positions) == len(atom.args):
+            # a ground atom is one probe of its relation
+            fact = rows.get(tuple([arg.id for arg in atom.args]))
+            if fact is not None:
+                yield fact
+            return
+
+        index = self.__hash_index(relation_key, positions) if positions else None
+        if index is not None:
+            key = tuple([atom.args[p].id for p in positions])
+            candidates = (rows[row] for row in index.get(key, ()))
+        else:
+            candidates = self.index.iter_more_specific_matches(atom)
 
         # now only retain those candidates that actually unify (the indexes do
         # not distinguish between equal variables)
-
-        facts = []
+        stats = self.stats
         for cand in candidates:
-            mapping = atom.unify_with_ground(cand)
-            if mapping is not False:
-                new_fact = atom.resolve(mapping)
-                facts.append(new_fact)
-        return facts
+            if stats is not None:
+                stats.count('fact index candidates')
+            if cand is not None and atom.unify_with_ground(cand) is not False:
+                # (a None is a row added without its fact)
+                if stats is not None:
+                    stats.count('fact index unifications')
+                yield cand
+
+    ## Private functions
+
+    def __hash_index(self, relation_key, positions):
+        """
+        The hash index on positions of the relation, built if it was asked
+        for INDEX_THRESHOLD times now, or None. The positions are never all
+        positions of the relation: the rows themselves are the index on
+        those.
+        """
+        use_key = relation_key + (positions,)
+        indexes = self.hash_indexes.get(relation_key)
+        if indexes is not None:
+            index = indexes.get(positions)
+            if index is not None:
+                self.index_last_used[use_key] = self.relation_updates.get(relation_key, 0)
+                return index
+
+        uses = self.index_uses.get(use_key, 0) + 1
+        if uses < self.INDEX_THRESHOLD:
+            self.index_uses[use_key] = uses
+            return None
+        self.index_uses.pop(use_key, None)
+
+        if self.stats is not None:
+            self.stats.count('hash indexes built')
+        if indexes is None:
+            indexes = self.hash_indexes[relation_key] = {}
+        index = indexes[positions] = {}
+        for row in self.relations.get(relation_key, ()):
+            index.setdefault(tuple([row[p] for p in positions]), []).append(row)
+        self.index_last_used[use_key] = self.relation_updates.get(relation_key, 0)
+        return index
+
+    def __updated(self, relation_key, indexes):
+        """
+        Count an update of the relation, which has hash indexes, and every
+        INDEX_IDLE_MINIMUM updates drop the ones that were idle too long.
+        """
+        updates = self.relation_updates.get(relation_key, 0) + 1
+        self.relation_updates[relation_key] = updates
+        if updates % self.INDEX_IDLE_MINIMUM:
+            return
+        limit = max(len(self.relations[relation_key]) // 2, self.INDEX_IDLE_MINIMUM)
+        for positions in list(indexes):
+            use_key = relation_key + (positions,)
+            if updates - self.index_last_used.get(use_key, 0) >= limit:
+                del indexes[positions]
+                self.index_last_used.pop(use_key, None)
+                if self.stats is not None:
+                    self.stats.count('hash indexes dropped')
 
 
 
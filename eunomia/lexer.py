@@ -11,6 +11,9 @@ tokens = (
   'CONSTANT', # A WORD that is not a VAR
 )
 
+# The lexer built by the first call of Lexer, see there
+_lexer = None
+
 def Lexer():
     """
     Use it as follows
@@ -19,7 +22,16 @@ def Lexer():
     tok = lexer.token()
 
     Those tokens have a type and value (tok.type and tok.value).
+
+    The lexer is only built the first time, later calls get a clone of it
+    (which has its own input and position).
     """
+    global _lexer
+    if _lexer is None:
+        _lexer = _build()
+    return _lexer.clone()
+
+def _build():
     t_LPAREN  = r'\('
     t_RPAREN  = r'\)'
     t_COMMA  = r'\,'
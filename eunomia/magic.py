@@ -0,0 +1,141 @@
+"""
+Goal-directed query answering with the magic-sets rewriting: rather than
+computing the complete minimal model and looking up a query in it, the
+program is rewritten for the binding pattern of the query so that bottom-up
+evaluation only derives facts that are relevant to it.
+
+Predicates defined by rules (IDB predicates) get an adorned copy per binding
+pattern (an adornment, with a 'b' for every bound and an 'f' for every free
+argument), e.g. path#bf, and a magic predicate, e.g. magic#path#bf, that
+holds the bindings the adorned predicate is asked for (if there are any bound
+arguments). Bindings are passed from left to right through rule bodies. The
+'#' can not occur in parsed names, so the new predicates never clash with the
+program's.
+"""
+
+from eunomia.models import Program, Rule, Atom, Term
+from eunomia.seminaive import SemiNaiveEngine
+from eunomia.symbols import symbols
+
+def query(program, atom):
+    """
+    Get all facts of the minimal model of program that match atom, by only
+    evaluating the part of the program that is relevant to atom.
+    """
+    key = _key(atom)
+    if not any(_key(rule.head) == key for rule in program.rules):
+        # nothing to derive, so the answers are among the given facts
+        return _matching_facts(program.facts, atom)
+
+    rewritten, answer = rewrite(program, atom)
+    engine = SemiNaiveEngine(rewritten)
+    return [Atom(atom.predicate, fact.args) for fact in engine.get_matching_facts(answer)]
+
+def rewrite(program, atom):
+    """
+    Rewrite program for the query atom. Returns the rewritten program and the
+    atom to query it with instead (which only differs from atom in its
+    predicate).
+    """
+    rules_by_head = {}
+    for rule in program.rules:
+        rules_by_head.setdefault(_key(rule.head), []).append(rule)
+    fact_keys = set([_key(fact.head) for fact in program.facts])
+
+    if _key(atom) not in rules_by_head:
+        # nothing to derive, the facts are the answer
+        return program, atom
+
+    rewritten = Program()
+    for fact in program.facts:
+        rewritten.add_fact(fact)
+
+    query_adornment = _adornment(atom.args, set())
+    for seed in _magic_atom(atom.predicate, atom.args, query_adornment):
+        rewritten.add_fact(Rule(seed, []))
+
+    todo = [(_key(atom), atom.predicate, query_adornment)]
+    done = set([(_key(atom), query_adornment)])
+    while todo:
+        (key, predicate, adornment) = todo.pop()
+        adorned = _adorned(predicate, adornment)
+
+        for rule in rules_by_head.get(key, ()):
+            head = rule.head
+            bound = set([arg.id for arg in _bound_args(head.args, adornment) if arg.is_var])
+            body = _magic_atom(predicate, head.args, adornment)
+            for body_atom in rule.body:
+                body_key = _key(body_atom)
+                if body_key in rules_by_head:
+                    body_adornment = _adornment(body_atom.args, bound)
+                    # the bindings for body_atom come from the head and the
+                    # body atoms before it
+                    magic_heads = _magic_atom(body_atom.predicate, body_atom.args, body_adornment)
+                    for magic_head in magic_heads:
+                        if body:
+                            rewritten.add_rule(Rule(magic_head, body))
+                        else:
+                            # only bound by constants
+                            rewritten.add_fact(Rule(magic_head, []))
+                    if (body_key, body_adornment) not in done:
+                        done.add((body_key, body_adornment))
+                        todo.append((body_key, body_atom.predicate, body_adornment))
+                    body_atom = Atom(_adorned(body_atom.predicate, body_adornment), body_atom.args)
+                body = body + [body_atom]
+                bound.update([arg.id for arg in body_atom.args if arg.is_var])
+            rewritten.add_rule(Rule(Atom(adorned, head.args), body))
+
+        if key in fact_keys:
+            # the facts of an IDB predicate hold for every binding pattern
+            args = [Term('?x%d' % i, True) for i in range(key[1])]
+            body = _magic_atom(predicate, args, adornment) + [Atom(predicate, args)]
+            rewritten.add_rule(Rule(Atom(adorned, args), body))
+
+    return rewritten, Atom(_adorned(atom.predicate, query_adornment), atom.args)
+
+## Private functions
+
+def _key(atom):
+    return (atom.predicate.id, len(atom.args))
+
+def _matching_facts(facts, atom):
+    """
+    The heads of facts (rules without a body) that match atom, each once.
+    """
+    key = _key(atom)
+    matching = []
+    seen = set()
+    for fact in facts:
+        head = fact.head
+        if _key(head) != key or head in seen:
+            continue
+        if all(arg.is_var or arg.id == value.id for (arg, value) in zip(atom.args, head.args)):
+            if atom.unify_with_ground(head) is not False:
+                seen.add(head)
+                matching.append(head)
+    return matching
+
+def _adornment(args, bound):
+    """
+    The adornment of args given the ids of the bound variables: constants
+    and bound variables are 'b', the rest is 'f'.
+    """
+    return ''.join(['b' if not arg.is_var or arg.id in bound else 'f' for arg in args])
+
+def _bound_args(args, adornment):
+    return [arg for (arg, a) in zip(args, adornment) if a == 'b']
+
+def _adorned(predicate, adornment):
+    return Term('%s#%s' % (symbols.name(predicate.id), adornment))
+
+def _magic_atom(predicate, args, adornment):
+    """
+    The magic atom for args with adornment, as a list with that atom. Without
+    bound arguments the magic atom would always hold, so then the list is
+    empty.
+    """
+    bound_args = _bound_args(args, adornment)
+    if not bound_args:
+        return []
+    magic = Term('magic#%s#%s' % (symbols.name(predicate.id), adornment))
+    return [Atom(magic, bound_args)]
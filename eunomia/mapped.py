@@ -0,0 +1,413 @@
+"""
+A fact store on disk, for models that do not fit in memory.
+
+MappedFactIndex can be used instead of FactIndex (see the fact_index argument
+of Engine and SemiNaiveEngine). Every relation (a predicate and arity) is a
+file of fixed-width records, one 32 bit symbol id per argument, and every
+hash index the join plans ask for is a pair of files: the buckets, each
+holding the number (plus one) of the last record added with a key that hashes
+to it, and for every record the number (plus one) of the record before it in
+its bucket. All files are memory-mapped, so the operating system's page cache
+decides which parts are in memory. A removed fact keeps its record, and only
+the number of the record is remembered, so it is skipped from then on.
+
+Only the symbol table, the statistics of the relations and the numbers of the
+removed records stay in memory.
+"""
+
+import os
+import mmap
+import struct
+import shutil
+import tempfile
+from eunomia.models import Atom, Term
+
+class MappedFactIndex(object):
+    """
+    A FactIndex keeping its relations and hash indexes in memory-mapped files
+    in directory (by default a new temporary directory, which close removes).
+    It has the same interface as FactIndex.
+    """
+
+    def __init__(self, directory=None):
+        self.temporary = directory is None
+        if self.temporary:
+            directory = tempfile.mkdtemp(prefix='eunomia-')
+        elif not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+
+        # (predicate id, arity) -> _Relation
+        self.relations = {}
+
+        # (predicate id, arity, position) -> (number of rows, number of
+        # distinct values) when last counted, see distinct
+        self.distinct_counts = {}
+
+        # the number of facts, in total and per predicate id
+        self.size = 0
+        self.predicate_sizes = {}
+
+        # symbol id -> Term, so the atoms we return share their terms
+        self.terms = {}
+
+        # a Statistics to count the work in, or None (see eunomia.stats)
+        self.stats = None
+
+    def add_fact(self, fact):
+        """
+        Add fact if it is not known yet. Returns whether it was new.
+        """
+        return self.add_row(fact.predicate.id, tuple([arg.id for arg in fact.args]))
+
+    def add_row(self, pred, row, fact=None):
+        """
+        Add a row to the relation of pred if it is not there yet (checked with
+        the hash index on all positions). Returns whether it was new.
+        """
+        relation_key = (pred, len(row))
+        relation = self.relations.get(relation_key)
+        if relation is None:
+            relation = self.relations[relation_key] = _Relation(self.directory, pred, len(row))
+        elif relation.lookup(tuple(range(len(row))), row):
+            return False
+        relation.append(row)
+        self.size += 1
+        self.predicate_sizes[pred] = self.predicate_sizes.get(pred, 0) + 1
+        return True
+
+    def remove_fact(self, fact):
+        """
+        Remove fact, which must be known.
+        """
+        pred = fact.predicate.id
+        row = tuple([arg.id for arg in fact.args])
+        self.relations[(pred, len(row))].remove(row)
+        self.size -= 1
+        self.predicate_sizes[pred] -= 1
+
+    def lookup(self, pred, arity, positions, key):
+        """
+        Get the rows of the relation pred/arity that have the values key on
+        the argument positions (a tuple), see FactIndex.lookup.
+        """
+        if self.stats is not None:
+            self.stats.count('fact index lookups')
+        relation = self.relations.get((pred, arity))
+        if relation is None:
+            return ()
+        return relation.lookup(positions, key)
+
+    def count(self, pred, arity):
+        """
+        The number of facts of the relation pred/arity.
+        """
+        relation = self.relations.get((pred, arity))
+        return len(relation) if relation is not None else 0
+
+    def distinct(self, pred, arity, position):
+        """
+        The number of distinct values on an argument position of the relation
+        pred/arity (at least 1), counted again whenever the relation doubled
+        in size since the last count.
+        """
+        relation = self.relations.get((pred, arity))
+        if relation is None:
+            return 1
+        count_key = (pred, arity, position)
+        counted = self.distinct_counts.get(count_key)
+        if counted is None or len(relation) >= 2 * counted[0]:
+            counted = (len(relation), len(set([row[position] for row in relation])))
+            self.distinct_counts[count_key] = counted
+        return max(counted[1], 1)
+
+    def get_resolutions(self, rule):
+        """
+        Get all new rules that result for matching ground facts in the fact
+        index with any rule body atom, see FactIndex.get_resolutions.
+        """
+        stats = self.stats
+        resolutions = []
+        for idx, body_atom in enumerate(rule.body):
+            for cand in self.iter_matching_facts(body_atom):
+                if stats is not None:
+                    stats.count('fact index candidates')
+                mapping = body_atom.unify_with_ground(cand)
+                if mapping is not False:
+                    resolutions.append(rule.resolve(idx, mapping))
+        if stats is not None:
+            stats.count('fact index unifications', len(resolutions))
+        return resolutions
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, fact):
+        row = tuple([arg.id for arg in fact.args])
+        return bool(self.lookup(fact.predicate.id, len(row), tuple(range(len(row))), row))
+
+    def count_facts(self, pred=None):
+        """
+        The number of facts, or of facts with predicate id pred (of any
+        arity).
+        """
+        if pred is None:
+            return self.size
+        return self.predicate_sizes.get(pred, 0)
+
+    def iter_facts(self):
+        """
+        Yield every fact currently known to the fact index, each once, reading
+        the rows from disk as it goes.
+        """
+        for ((pred, arity), relation) in self.relations.items():
+            for row in relation:
+                yield self.__to_atom(pred, row)
+
+    def get_all_facts(self):
+        """
+        Get all facts currently known to fact index.
+        """
+        return list(self.iter_facts())
+
+    def get_matching_facts(self, atom):
+        """
+        Get all facts that match the atom (answer the query).
+        """
+        return list(self.iter_matching_facts(atom))
+
+    def iter_matching_facts(self, atom):
+        """
+        Yield the facts that match the atom one at a time, reading the rows
+        from disk as it goes.
+        """
+        positions = []
+        key = []
+        variables = {}
+        checks = []
+        for p, arg in enumerate(atom.args):
+            if not arg.is_var:
+                positions.append(p)
+                key.append(arg.id)
+            elif arg.id in variables:
+                checks.append((p, variables[arg.id]))
+            else:
+                variables[arg.id] = p
+
+        pred = atom.predicate.id
+        relation = self.relations.get((pred, len(atom.args)))
+        if relation is None:
+            return
+        if positions:
+            rows = relation.lookup(tuple(positions), tuple(key))
+        else:
+            rows = relation
+        for row in rows:
+            if all(row[p] == row[q] for (p, q) in checks):
+                yield self.__to_atom(pred, row)
+
+    def close(self):
+        """
+        Close all files, and remove them if they are in a temporary directory.
+        """
+        for relation in self.relations.values():
+            relation.close()
+        self.relations = {}
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    ## Private
+
+    def __to_atom(self, pred, row):
+        terms = self.terms
+        args = []
+        for sid in (pred,) + row:
+            term = terms.get(sid)
+            if term is None:
+                term = terms[sid] = Term.from_id(sid)
+            args.append(term)
+        return Atom(args[0], args[1:])
+
+
+class _Relation(object):
+    """
+    The rows of one relation in a file, with the hash indexes on it.
+    """
+
+    def __init__(self, directory, pred, arity):
+        self.directory = directory
+        self.name = '%d_%d' % (pred, arity)
+        self.arity = arity
+        self.rows = _IntArray(os.path.join(directory, self.name + '.rows'))
+        self.num_rows = 0
+        # the numbers of the records of removed rows
+        self.removed = set()
+        # positions -> _HashIndex
+        self.indexes = {}
+
+    def append(self, row):
+        number = self.num_rows
+        if self.arity:
+            self.rows.extend(row)
+        self.num_rows += 1
+        for index in self.indexes.values():
+            index.add(number, row)
+
+    def row(self, number):
+        if not self.arity:
+            return ()
+        return self.rows.read(number * self.arity, self.arity)
+
+    def remove(self, row):
+        for number in self.__index(tuple(range(self.arity))).numbers(row):
+            self.removed.add(number)
+
+    def lookup(self, positions, key):
+        if not positions:
+            return list(self)
+        return [self.row(number) for number in self.__index(positions).numbers(key)]
+
+    def records(self):
+        """
+        Yield the number and row of every record, including the removed ones.
+        """
+        for number in range(self.num_rows):
+            yield (number, self.row(number))
+
+    def close(self):
+        self.rows.close()
+        for index in self.indexes.values():
+            index.close()
+
+    def __len__(self):
+        return self.num_rows - len(self.removed)
+
+    def __iter__(self):
+        removed = self.removed
+        for number in range(self.num_rows):
+            if number not in removed:
+                yield self.row(number)
+
+    ## Private
+
+    def __index(self, positions):
+        index = self.indexes.get(positions)
+        if index is None:
+            index = self.indexes[positions] = _HashIndex(self, positions)
+        return index
+
+
+class _HashIndex(object):
+    """
+    A hash index on some positions of a relation, as chains of record
+    numbers through a file of buckets and a file with the previous record
+    in the chain of every record. There are four times as many buckets (and
+    the chains are made again) once there are more than twice as many
+    records as buckets.
+    """
+
+    MINIMUM_BUCKETS = 1024
+
+    def __init__(self, relation, positions):
+        self.relation = relation
+        self.positions = positions
+        path = os.path.join(relation.directory, '%s_%s' % (relation.name, '_'.join(map(str, positions))))
+        self.buckets = None
+        self.previous = None
+        self.path = path
+        self.__build(max(self.MINIMUM_BUCKETS, 2 * relation.num_rows))
+
+    def add(self, number, row):
+        if number >= 2 * self.num_buckets:
+            self.__build(4 * self.num_buckets)
+            return
+        bucket = hash(tuple([row[p] for p in self.positions])) % self.num_buckets
+        self.previous.append(self.buckets.get(bucket))
+        self.buckets.set(bucket, number + 1)
+
+    def numbers(self, key):
+        """
+        The numbers of the records with key that are not removed.
+        """
+        positions = self.positions
+        relation = self.relation
+        removed = relation.removed
+        numbers = []
+        number = self.buckets.get(hash(key) % self.num_buckets)
+        while number:
+            if number - 1 not in removed:
+                row = relation.row(number - 1)
+                if tuple([row[p] for p in positions]) == key:
+                    numbers.append(number - 1)
+            number = self.previous.get(number - 1)
+        return numbers
+
+    def close(self):
+        self.buckets.close()
+        self.previous.close()
+
+    ## Private
+
+    def __build(self, num_buckets):
+        if self.buckets is not None:
+            self.close()
+        self.num_buckets = num_buckets
+        self.buckets = _IntArray(self.path + '.buckets', num_buckets)
+        self.previous = _IntArray(self.path + '.previous')
+        for (number, row) in self.relation.records():
+            self.add(number, row)
+
+
+class _IntArray(object):
+    """
+    A growing array of 32 bit integers in a memory-mapped file, starting with
+    length zeros.
+    """
+
+    MINIMUM_CAPACITY = 1024
+
+    def __init__(self, path, length=0):
+        self.path = path
+        self.length = length
+        self.file = open(path, 'w+b')
+        self.capacity = 0
+        self.map = None
+        self.__grow(max(length, self.MINIMUM_CAPACITY))
+
+    def get(self, i):
+        return struct.unpack_from('<i', self.map, 4 * i)[0]
+
+    def set(self, i, value):
+        struct.pack_into('<i', self.map, 4 * i, value)
+
+    def read(self, i, n):
+        return struct.unpack_from('<%di' % n, self.map, 4 * i)
+
+    def append(self, value):
+        self.extend((value,))
+
+    def extend(self, values):
+        n = len(values)
+        if self.length + n > self.capacity:
+            self.__grow(max(2 * self.capacity, self.length + n))
+        struct.pack_into('<%di' % n, self.map, 4 * self.length, *values)
+        self.length += n
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def __len__(self):
+        return self.length
+
+    ## Private
+
+    def __grow(self, capacity):
+        if self.map is not None:
+            self.map.close()
+        # the file grows with zeros
+        self.file.truncate(4 * capacity)
+        self.capacity = capacity
+        self.map = mmap.mmap(self.file.fileno(), 4 * capacity)
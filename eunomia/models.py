@@ -1,3 +1,8 @@
+from eunomia.symbols import symbols
+
+
+def _immutable(self, *args):
+    raise AttributeError("%s objects are immutable" % type(self).__name__)
 
 class Program(object):
     """
@@ -36,13 +41,17 @@ class Program(object):
 
 class Rule(object):
     """
-    A Rule consists of a head atom and a possibly empty list of body atoms
-    (body).
+    A Rule consists of a head atom and a possibly empty tuple of body atoms
+    (body). Rules are immutable, so their hash is computed only once.
     """
+    __slots__ = ('head', 'body', '_hash')
+
     def __init__(self, head, body):
-        # Head is a single atom, body is a list of atoms
-        self.head = head
-        self.body = body
+        # Head is a single atom, body is a sequence of atoms
+        body = tuple(body)
+        object.__setattr__(self, 'head', head)
+        object.__setattr__(self, 'body', body)
+        object.__setattr__(self, '_hash', hash((head, body)))
     
     def is_fact(self):
         # Assumption we only ask this rules that resulted from proper datalog
@@ -63,7 +72,10 @@ class Rule(object):
         return Rule(new_head, new_body)
 
     def hash(self):
-        return hash(str(self))
+        return self._hash
+
+    def __hash__(self):
+        return self._hash
 
     def __str__(self):
         result = str(self.head)
@@ -73,32 +85,43 @@ class Rule(object):
         return result + "."
 
     def __eq__(self, other): 
-        return self.__dict__ == other.__dict__
+        if self is other:
+            return True
+        if not isinstance(other, Rule):
+            return False
+        return (self._hash == other._hash and self.head == other.head
+                and self.body == other.body)
 
     def __ne__(self, other): 
         return not self == other
 
+    def __reduce__(self):
+        return (Rule, (self.head, self.body))
+
+    __setattr__ = __delattr__ = _immutable
+
 class Atom(object):
     """
     An Atom is of the form p(t1, ..., tn) where p is a predicate (a term) and ti are
-    terms (possibly empty list).
+    terms (possibly empty tuple). Atoms are immutable, so their hash is
+    computed only once.
     """
+    __slots__ = ('predicate', 'args', '_hash')
+
     def __init__(self, predicate, args):
         # for an atom p(t1, ..., tn) we have a predicate p and 
-        # and a list of terms t1 ...tn as arguments
+        # and a tuple of terms t1 ...tn as arguments
         # A predicate is a constant symbol
-        self.predicate = predicate
-        self.args = args
+        args = tuple(args)
+        object.__setattr__(self, 'predicate', predicate)
+        object.__setattr__(self, 'args', args)
+        object.__setattr__(self, '_hash', hash((predicate, args)))
 
     def resolve(self, mapping):
         """
         We resolve the atom with the mapping.
         """
-        new_predicate = self.predicate
-        new_args = []
-        for arg in self.args:
-            new_args.append(arg.resolve(mapping))
-        return Atom(new_predicate, new_args)
+        return Atom(self.predicate, [arg.resolve(mapping) for arg in self.args])
 
 
     def unify_with_ground(self, atom):
@@ -113,16 +136,19 @@ class Atom(object):
         mapping = {}
         for idx, a  in enumerate(self.args):
             if a.is_var:
-                if a.value not in mapping:
-                    mapping[a.value] = atom.args[idx] 
-                elif mapping[a.value] != atom.args[idx]:
+                if a.id not in mapping:
+                    mapping[a.id] = atom.args[idx] 
+                elif mapping[a.id].id != atom.args[idx].id:
                     return False
                 # else just skip
-        # Return a mapping from values to terms.
+        # Return a mapping from variable ids to terms.
         return mapping
 
     def hash(self):
-        return hash(str(self))
+        return self._hash
+
+    def __hash__(self):
+        return self._hash
 
     def __str__(self):
         result = str(self.predicate) + "("
@@ -131,42 +157,79 @@ class Atom(object):
         return result + ")"
 
     def __eq__(self, other): 
-        return self.__dict__ == other.__dict__
+        if self is other:
+            return True
+        if not isinstance(other, Atom):
+            return False
+        return (self._hash == other._hash and self.predicate == other.predicate
+                and self.args == other.args)
 
     def __ne__(self, other): 
         return not self == other
 
+    def __reduce__(self):
+        return (Atom, (self.predicate, self.args))
+
+    __setattr__ = __delattr__ = _immutable
+
 class Term(object):
     """
-    A Term is a variable or a constant.
+    A Term is a variable or a constant. Terms are immutable.
     """
+    __slots__ = ('id', 'is_var', '_hash')
+
     def __init__(self, value, is_var=False):
         # value of term is constant or variable, where the latter is assumed
-        # to be always starting with a '?'
-        self.value = value
-        self.is_var = is_var
+        # to be always starting with a '?'. We only keep the interned id of
+        # the value (see eunomia.symbols).
+        sid = symbols.intern(value)
+        object.__setattr__(self, 'id', sid)
+        object.__setattr__(self, 'is_var', is_var)
+        object.__setattr__(self, '_hash', hash((sid, is_var)))
+
+    @classmethod
+    def from_id(cls, sid, is_var=False):
+        """
+        Create the term for an already interned symbol id (no name lookup).
+        """
+        term = object.__new__(cls)
+        object.__setattr__(term, 'id', sid)
+        object.__setattr__(term, 'is_var', is_var)
+        object.__setattr__(term, '_hash', hash((sid, is_var)))
+        return term
+
+    @property
+    def value(self):
+        return symbols.name(self.id)
 
     def resolve(self, mapping):
-        if self.is_var:
-            if self.value in mapping:
-                # the mapping is always from variables to constant so the new
-                # term is a constant
-                new_term = Term(mapping[self.value].value)
-            else:
-                new_term = Term(self.value, self.is_var)
-        else:
-            # create a new term with the same value (a copy)
-            new_term = Term(self.value)
-        return new_term
+        # the mapping is always from variable ids to constants, so terms can
+        # be shared rather than copied.
+        if self.is_var and self.id in mapping:
+            return mapping[self.id]
+        return self
 
     def hash(self):
-        return hash(str(self))
+        return self._hash
+
+    def __hash__(self):
+        return self._hash
 
     def __str__(self):
-        return str(self.value)
+        return symbols.name(self.id)
 
     def __eq__(self, other): 
-        return self.__dict__ == other.__dict__
+        if self is other:
+            return True
+        if not isinstance(other, Term):
+            return False
+        return self.id == other.id and self.is_var == other.is_var
 
     def __ne__(self, other): 
         return not self == other
+
+    def __reduce__(self):
+        # pickle by name: symbol ids are only meaningful within a process
+        return (Term, (self.value, self.is_var))
+
+    __setattr__ = __delattr__ = _immutable
@@ -0,0 +1,310 @@
+"""
+Building the minimal model on several CPU cores.
+
+The ParallelEngine evaluates semi-naively, like SemiNaiveEngine, but once a
+round is large it hands the rest of the evaluation to a pool of worker
+processes. Each worker keeps its own copy of the facts (rows of symbol ids,
+so the workers never need the symbol table) and resolves only the delta
+facts of its own partition (by hash of the row) with the rules.
+
+The engine sends every worker only its partition of the first delta; from
+then on the workers exchange among themselves what they derived, so each of
+them adds the same new facts to its copy and finds the same next delta, and
+they all stop in the same round. Every worker reports the new facts of its
+own partition to the engine, which stores them while the workers go on.
+The engine keeps facts as rows too, and only makes atoms of them when they
+are asked for.
+
+The facts themselves are not partitioned: every worker keeps all of them,
+since a rule body can look a relation up on any of its argument positions,
+and a relation partitioned on the columns of one join would have to be sent
+around again for the next. This costs one copy of the model per worker (next
+to the engine's), and every worker adds every new fact to its copy, so only
+the joins are spread over the workers, not the storing of the new facts.
+Where the workers do not run side by side (on a single CPU) the pool is
+slower than evaluating in one process, see benchmarks/parallel.py.
+"""
+
+import multiprocessing
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+from eunomia.index import FactIndex
+from eunomia.models import Term
+from eunomia.plan import Planner, signature
+
+class ParallelEngine(object):
+    """
+    An alternative to Engine that spreads the joins of large rounds over
+    workers processes. Rounds with fewer than PARALLEL_MINIMUM new facts are
+    evaluated in this process; the workers are only started once a round is
+    larger, and are stopped when the model is complete.
+
+    Like Engine it takes incremental additions (push_rule, push_fact,
+    push_rules, push_facts and push_program), and the facts can be read with
+    get_facts, iter_facts, count_facts and get_matching_facts (without an
+    offset or a limit) and joins shown with explain. Unlike Engine it can not
+    retract, answer conjunctive queries (query), check exists, push_delta,
+    or be saved and loaded.
+    """
+
+    PARALLEL_MINIMUM = 1000
+
+    def __init__(self, program, workers=None):
+        """
+        workers is the number of worker processes, by default the number of
+        CPUs.
+        """
+        self.workers = workers or multiprocessing.cpu_count()
+
+        # store the original program
+        self.program = program
+
+        # an index of ground facts, as rows only (see iter_facts)
+        self.fact_index = FactIndex()
+
+        # compiles the rules into join plans against the fact index
+        self.planner = Planner(self.fact_index)
+
+        # (predicate id, arity) -> list of (body position, signature, params)
+        # of the rules with a body atom of that predicate
+        self.uses = {}
+
+        # The rules in the system, to be able to check existence fast (the
+        # fact index does this for facts).
+        self.rules = set()
+
+        # Now add rules and facts to index and evaluate
+        self.push_program(self.program)
+
+    def push_rule(self, rule):
+        self.__propagate([rule], [])
+
+    def push_fact(self, fact):
+        # fact is assumed to be an atom
+        self.__propagate([], [fact])
+
+    def push_rules(self, rules):
+        self.__propagate(rules, [])
+
+    def push_facts(self, facts):
+        self.__propagate([], [f.head for f in facts])
+
+    def push_program(self, program):
+        self.__propagate(program.rules, [f.head for f in program.facts])
+
+    def get_facts(self):
+        return list(self.iter_facts())
+
+    def iter_facts(self):
+        """
+        Yield every known fact once, without building a list of them.
+        """
+        to_atom = self.planner.to_atom
+        for ((pred, arity), rows) in self.fact_index.relations.items():
+            for row in rows:
+                yield to_atom(pred, row)
+
+    def count_facts(self, predicate=None):
+        """
+        The number of known facts, or of known facts with predicate (a name).
+        """
+        if predicate is None:
+            return self.fact_index.count_facts()
+        return self.fact_index.count_facts(Term(predicate).id)
+
+    def get_matching_facts(self, atom):
+        positions = []
+        key = []
+        variables = {}
+        checks = []
+        for p, arg in enumerate(atom.args):
+            if not arg.is_var:
+                positions.append(p)
+                key.append(arg.id)
+            elif arg.id in variables:
+                checks.append((p, variables[arg.id]))
+            else:
+                variables[arg.id] = p
+
+        pred = atom.predicate.id
+        rows = self.fact_index.lookup(pred, len(atom.args), tuple(positions), tuple(key))
+        return [self.planner.to_atom(pred, row) for row in rows
+                if all(row[p] == row[q] for (p, q) in checks)]
+
+    def explain(self, rule):
+        return self.planner.explain(rule)
+
+    # Private
+
+    def __propagate(self, rules, facts):
+        """
+        Add rules and facts and evaluate until no new facts can be derived.
+        """
+        delta = []
+
+        # New rules are first evaluated against the facts known so far; the
+        # facts they derive become part of the first delta.
+        for rule in rules:
+            if rule.is_fact():
+                facts.append(rule.head)
+            elif rule not in self.rules:
+                self.rules.add(rule)
+                shape, params = signature(rule)
+                for idx, atom in enumerate(rule.body):
+                    key = (atom.predicate.id, len(atom.args))
+                    self.uses.setdefault(key, []).append((idx, shape, params))
+                plan = self.planner.compile(shape)
+                self.__add_new(plan.run(self.fact_index, params), plan.head_pred, delta)
+
+        for fact in facts:
+            row = tuple([arg.id for arg in fact.args])
+            self.__add_new([row], fact.predicate.id, delta)
+
+        # every fact in delta is in the fact index already
+        while delta:
+            if len(delta) >= self.PARALLEL_MINIMUM and self.workers > 1:
+                _Pool(self.workers, self.fact_index, self.uses, delta).run()
+                break
+
+            skip = {}
+            for (pred, row) in delta:
+                skip.setdefault(pred, set()).add(row)
+            derived = _join(self.planner, self.uses, delta, skip)
+
+            delta = []
+            for (pred, row) in derived:
+                self.__add_new([row], pred, delta)
+
+    def __add_new(self, rows, pred, delta):
+        # the fact index tells which rows are new
+        for row in rows:
+            if self.fact_index.add_row(pred, row):
+                delta.append((pred, row))
+
+
+class _Pool(object):
+    """
+    The worker processes for one evaluation, from the facts in fact_index
+    (delta included) on, each with a queue of the messages of the others,
+    and a queue for the new facts they report.
+    """
+
+    def __init__(self, workers, fact_index, uses, delta):
+        self.fact_index = fact_index
+        self.results = multiprocessing.Queue()
+        inboxes = [multiprocessing.Queue() for part in range(workers)]
+        parts = [[] for part in range(workers)]
+        for fact in delta:
+            parts[hash(fact[1]) % workers].append(fact)
+
+        self.processes = []
+        for part in range(workers):
+            process = multiprocessing.Process(target=_work,
+                                              args=(part, workers, fact_index.relations, uses,
+                                                    parts[part], inboxes, self.results))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+    def run(self):
+        """
+        Store the new facts the workers report until they are all done.
+        """
+        add_row = self.fact_index.add_row
+        running = len(self.processes)
+        try:
+            while running:
+                try:
+                    facts = self.results.get(timeout=1)
+                except Empty:
+                    for process in self.processes:
+                        if process.exitcode:
+                            raise RuntimeError('a worker process failed (exit code %d)'
+                                               % process.exitcode)
+                    continue
+                if facts is None:
+                    running -= 1
+                else:
+                    for (pred, row) in facts:
+                        add_row(pred, row)
+        finally:
+            for process in self.processes:
+                if running:
+                    process.terminate()
+                process.join()
+
+## Private functions
+
+def _work(part, parts, relations, uses, delta, inboxes, results):
+    """
+    A worker process. Every round it sends the facts it found (in the first
+    round its partition of the first delta) to the other workers, and gets
+    theirs. The ones that are new to its copy of the facts are the delta of
+    the round, which every worker finds the same: it reports the ones in its
+    own partition, and resolves them with the rules. It stops (and reports
+    None) when the delta is empty.
+    """
+    store = FactIndex()
+    for ((pred, arity), rows) in relations.items():
+        for row in rows:
+            store.add_row(pred, row)
+    planner = Planner(store)
+    inbox = inboxes[part]
+
+    # messages of the other workers for later rounds, per round
+    early = {}
+    found = delta
+    number = 0
+    while True:
+        for other in range(parts):
+            if other != part:
+                inboxes[other].put((number, found))
+        facts = set(found)
+        messages = early.pop(number, [])
+        while len(messages) < parts - 1:
+            (round_number, message) = inbox.get()
+            if round_number == number:
+                messages.append(message)
+            else:
+                early.setdefault(round_number, []).append(message)
+        for message in messages:
+            facts.update(message)
+
+        if number == 0:
+            # the first delta is in the copy of the facts already
+            delta = list(facts)
+        else:
+            delta = [(pred, row) for (pred, row) in facts if store.add_row(pred, row)]
+            results.put([(pred, row) for (pred, row) in delta if hash(row) % parts == part])
+        if not delta:
+            break
+
+        skip = {}
+        for (pred, row) in delta:
+            skip.setdefault(pred, set()).add(row)
+        # only send the heads that are not known yet
+        found = [(pred, row) for (pred, row) in _join(planner, uses, delta, skip, part, parts)
+                 if row not in store.relations.get((pred, len(row)), ())]
+        number += 1
+    results.put(None)
+
+def _join(planner, uses, delta, skip, part=0, parts=1):
+    """
+    Resolve the delta facts of partition part (of parts) with the rules in
+    uses and get the (predicate id, row) of the heads, without duplicates.
+    The delta must be in the store of planner already. As in SemiNaiveEngine,
+    the body atoms after the one a delta fact is resolved with skip the delta.
+    """
+    store = planner.store
+    derived = set()
+    for (pred, row) in delta:
+        if parts > 1 and hash(row) % parts != part:
+            continue
+        for (idx, shape, params) in uses.get((pred, len(row)), ()):
+            plan = planner.compile(shape, idx)
+            head_pred = plan.head_pred
+            for head in plan.run(store, params, row, skip):
+                derived.add((head_pred, head))
+    return list(derived)
@@ -1,3 +1,6 @@
+import os
+import sys
+import ply
 import ply.yacc as yacc
 
 # We need the tokens from the lexer (required)
@@ -6,15 +9,13 @@ import eunomia.lexer
 from eunomia.models import Term, Atom, Rule, Program
 
 
-# Logging to file
+# The parsers built so far, per start symbol (None for the whole program)
+_parsers = {}
 
-import logging
-logging.basicConfig(
-    level = logging.DEBUG,
-    filename = "parselog.txt",
-    filemode = "w",
-    format = "%(filename)10s:%(lineno)4d:%(message)s"
-)
+# The table module given to yacc. There is no such module, so yacc never
+# reads tables from a parsetab.py (which may be stale, or from another
+# version of ply); they are read from the cache (see _table_file) or built.
+_NO_TABLES = 'eunomia._no_parsetab'
 
 
 class Parser():
@@ -25,17 +26,31 @@ class Parser():
         """
         start is the start symbol of the grammar, by default it is just the
         top level goal.
+
+        The parsing tables are made once per start symbol (the first time a
+        Parser for it is made) and shared by all Parsers after that. They are
+        read from a file in the user's cache directory, which is written when
+        it is missing or made for another grammar (see _table_file); no
+        table files are written or read next to the code.
         """
         self.tokens = eunomia.lexer.tokens # this is required
-        self.log = logging.getLogger()
-        if start:
-            # We'll not write tables when we specified a start symbol, this
-            # means we are jumping in places in the grammar to test out
-            # different subgrammars. And we do not want these tables to
-            # persist.
-            self.parser = yacc.yacc(module=self, start=start, debug=0, write_tables=0, errorlog=self.log)
-        else:
-            self.parser = yacc.yacc(module=self)
+        key = start or None
+        self.parser = _parsers.get(key)
+        if self.parser is None:
+            table_file = _table_file(key)
+            try:
+                self.parser = self.__build(key, table_file)
+            except Exception:
+                if table_file is None:
+                    raise
+                # an unreadable table file (e.g. one that was partly
+                # written): make it again
+                try:
+                    os.remove(table_file)
+                except OSError:
+                    pass
+                self.parser = self.__build(key, table_file)
+            _parsers[key] = self.parser
 
     def parse(self, input):
         # input is the program input (a string)
@@ -127,3 +142,30 @@ class Parser():
     def p_error(self, p):
         raise SyntaxError('Syntax error in input: %s' % p) # pragma: no cover
 
+    ## Private
+
+    def __build(self, key, table_file):
+        return yacc.yacc(module=self, start=key, tabmodule=_NO_TABLES, debug=0, write_tables=0,
+                         optimize=0, errorlog=yacc.NullLogger(), picklefile=table_file)
+
+## Private functions
+
+def _table_file(key):
+    """
+    The file the parsing tables for start symbol key are cached in: in
+    $EUNOMIA_CACHE, or else in eunomia in the user's cache directory, with
+    the versions of ply and Python in its name (yacc itself checks that the
+    tables are for the current grammar). None if the directory can not be
+    made.
+    """
+    directory = os.environ.get('EUNOMIA_CACHE')
+    if not directory:
+        cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        directory = os.path.join(cache, 'eunomia')
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    except OSError:
+        return None
+    name = 'parser-ply%s-py%d-%s.pickle' % (ply.__version__, sys.version_info[0], key or 'program')
+    return os.path.join(directory, name)
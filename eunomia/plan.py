@@ -0,0 +1,306 @@
+from eunomia.models import Rule, Atom, Term
+
+def signature(rule):
+    """
+    Get the shape of a rule, with its constants taken out: (signature,
+    params).
+
+    The signature is a tuple of (predicate id, codes) for the head and then
+    each body atom, where a code >= 0 is the number of a variable (in order of
+    first appearance) and a code < 0 is the constant params[-code - 1]. Rules
+    that only differ in their constants (e.g. all partial rules resolved from
+    the same rule and body atom) have the same signature and can share a
+    JoinPlan.
+    """
+    variables = {}
+    params = []
+    shape = []
+    for atom in (rule.head,) + rule.body:
+        codes = []
+        for arg in atom.args:
+            if arg.is_var:
+                code = variables.get(arg.id)
+                if code is None:
+                    code = variables[arg.id] = len(variables)
+            else:
+                params.append(arg.id)
+                code = -len(params)
+            codes.append(code)
+        shape.append((atom.predicate.id, tuple(codes)))
+    return tuple(shape), params
+
+
+class JoinPlan(object):
+    """
+    A JoinPlan is a rule body compiled into a nested hash join: for every body
+    atom (a step) we know up front which argument positions are bound (by a
+    constant or by a variable of an earlier step), so a step is one probe of
+    a hash index on those positions (see FactIndex.lookup) instead of a walk
+    over the fact trie.
+
+    Variables and constants each get a slot in a list of values; constants
+    are filled in from the params of the rule the plan is used for, so one
+    plan serves every rule with the same signature.
+
+    If first is a body position, the plan starts with that atom and expects
+    the fact it should be resolved with (the seed) when run.
+
+    The other atoms are ordered by estimate(pred, arity, key positions), the
+    estimated number of facts a probe returns: greedily, the atom with the
+    lowest estimate given the variables bound so far goes next (the order of
+    the rule breaks ties). Without estimate the atoms keep the rule's order.
+    """
+
+    def __init__(self, shape, first=None, estimate=None):
+        self.shape = shape
+        self.first = first
+
+        # number the slots: variables first, then the constants
+        self.num_vars = 0
+        num_consts = 0
+        for (pred, codes) in shape:
+            for code in codes:
+                if code >= 0:
+                    self.num_vars = max(self.num_vars, code + 1)
+                else:
+                    num_consts += 1
+        self.num_slots = self.num_vars + num_consts
+
+        head_pred, head_codes = shape[0]
+        self.head_pred = head_pred
+        self.head_slots = tuple(self.__slot(code) for code in head_codes)
+
+        remaining = list(enumerate(shape[1:]))
+
+        # Each step is (body position, predicate id, arity, key positions,
+        # key slots, binds, checks) where binds are the (position, slot) pairs
+        # of variables the step binds, and checks the (position, slot) pairs
+        # of variables that are repeated within the atom.
+        self.steps = []
+        # the estimated number of bindings after each step
+        self.estimates = []
+        bound = set(range(self.num_vars, self.num_slots))
+        size = 1.0
+        while remaining:
+            if first is not None and not self.steps:
+                k = [position for (position, atom) in remaining].index(first)
+                selectivity = None if estimate is None else 1.0
+            elif estimate is None:
+                k = 0
+                selectivity = None
+            else:
+                k, selectivity = self.__cheapest(remaining, bound, estimate)
+            (position, (pred, codes)) = remaining.pop(k)
+
+            key_positions, key_slots, binds, checks = self.__keys(codes, bound)
+            bound.update([slot for (p, slot) in binds])
+            self.steps.append((position, pred, len(codes), key_positions,
+                               key_slots, binds, checks))
+            if selectivity is not None:
+                size *= selectivity
+                self.estimates.append(size)
+
+    def run(self, store, params, seed=None, skip=None, counts=None):
+        """
+        Evaluate the plan against store (a FactIndex) and return the resolved
+        heads as rows (tuples of symbol ids).
+
+        seed is the fact (a row) for the first step if the plan was made with
+        a first position. skip optionally maps predicate ids to sets of rows
+        that steps after the first position must not use. If counts is a list
+        (one zero per step), the number of bindings after each step is
+        added to it.
+        """
+        values = [None] * self.num_vars + list(params)
+        steps = self.steps
+        num_steps = len(steps)
+        head_slots = self.head_slots
+        first = self.first
+        results = []
+
+        def join(k):
+            if k == num_steps:
+                results.append(tuple([values[s] for s in head_slots]))
+                return
+            (position, pred, arity, key_positions, key_slots, binds, checks) = steps[k]
+            key = tuple([values[s] for s in key_slots])
+            if k == 0 and first is not None:
+                candidates = [seed]
+                if tuple([seed[p] for p in key_positions]) != key:
+                    return
+            else:
+                candidates = store.lookup(pred, arity, key_positions, key)
+            excluded = None
+            if skip is not None and first is not None and position > first:
+                excluded = skip.get(pred)
+            for row in candidates:
+                if excluded is not None and row in excluded:
+                    continue
+                for (p, s) in binds:
+                    values[s] = row[p]
+                for (p, s) in checks:
+                    if row[p] != values[s]:
+                        break
+                else:
+                    if counts is not None:
+                        counts[k] += 1
+                    join(k + 1)
+
+        join(0)
+        return results
+
+    ## Private
+
+    def __slot(self, code):
+        if code >= 0:
+            return code
+        return self.num_vars - code - 1
+
+    def __keys(self, codes, bound):
+        key_positions = []
+        key_slots = []
+        binds = []
+        checks = []
+        new = set()
+        for p, code in enumerate(codes):
+            slot = self.__slot(code)
+            if slot in bound:
+                key_positions.append(p)
+                key_slots.append(slot)
+            elif slot in new:
+                checks.append((p, slot))
+            else:
+                binds.append((p, slot))
+                new.add(slot)
+        return tuple(key_positions), tuple(key_slots), tuple(binds), tuple(checks)
+
+    def __cheapest(self, remaining, bound, estimate):
+        """
+        Get the index in remaining of the atom with the lowest estimate, and
+        that estimate.
+        """
+        best = None
+        for k, (position, (pred, codes)) in enumerate(remaining):
+            key_positions = self.__keys(codes, bound)[0]
+            cost = estimate(pred, len(codes), key_positions)
+            if best is None or cost < best[1]:
+                best = (k, cost)
+        return best
+
+
+class Planner(object):
+    """
+    Compiles rules into JoinPlans against a store (a FactIndex), sharing one
+    plan between all rules with the same signature, and turns the resulting
+    rows back into atoms.
+
+    Plans order their body atoms with the statistics of the store. Once the
+    store has grown by REPLAN_FACTOR since a plan was made, the plan is made
+    again with the new statistics.
+    """
+
+    REPLAN_FACTOR = 2
+    REPLAN_MINIMUM = 100
+
+    def __init__(self, store):
+        self.store = store
+        # (signature, first) -> (JoinPlan, size of the store when planned)
+        self.plans = {}
+        # symbol id -> Term, so derived atoms share their terms
+        self.terms = {}
+
+    def plan(self, rule, first=None):
+        """
+        Get (plan, params) for rule.
+        """
+        shape, params = signature(rule)
+        return self.compile(shape, first), params
+
+    def compile(self, shape, first=None):
+        """
+        Get the plan for a signature.
+        """
+        key = (shape, first)
+        size = len(self.store)
+        entry = self.plans.get(key)
+        if entry is None or size > self.REPLAN_FACTOR * entry[1] + self.REPLAN_MINIMUM:
+            entry = self.plans[key] = (JoinPlan(shape, first, self.estimate), size)
+        return entry[0]
+
+    def estimate(self, pred, arity, key_positions):
+        """
+        The estimated number of facts of pred/arity that have given values on
+        key_positions, assuming the positions are independent.
+        """
+        store = self.store
+        result = float(store.count(pred, arity))
+        for p in key_positions:
+            if not result:
+                break
+            result /= store.distinct(pred, arity, p)
+        return result
+
+    def to_atom(self, pred, row):
+        terms = self.terms
+        args = []
+        for sid in row:
+            term = terms.get(sid)
+            if term is None:
+                term = terms[sid] = Term.from_id(sid)
+            args.append(term)
+        predicate = terms.get(pred)
+        if predicate is None:
+            predicate = terms[pred] = Term.from_id(pred)
+        return Atom(predicate, args)
+
+    def derive(self, rule):
+        """
+        Get all heads (atoms) of rule that follow from the facts in the store.
+        """
+        plan, params = self.plan(rule)
+        return [self.to_atom(plan.head_pred, row) for row in plan.run(self.store, params)]
+
+    def query(self, atoms):
+        """
+        Answer the conjunctive query atoms (a list of atoms that may share
+        variables): get the bindings of its variables for which every atom
+        is a fact in the store, each a mapping from variable ids to terms
+        like those of Atom.unify_with_ground. The atoms are joined like a
+        rule body, in the order of the plan.
+        """
+        variables = []
+        seen = set()
+        for atom in atoms:
+            for arg in atom.args:
+                if arg.is_var and arg.id not in seen:
+                    seen.add(arg.id)
+                    variables.append(arg)
+        plan, params = self.plan(Rule(Atom(atoms[0].predicate, variables), atoms))
+        ids = [var.id for var in variables]
+        terms = self.terms
+        bindings = []
+        for row in plan.run(self.store, params):
+            binding = {}
+            for (vid, sid) in zip(ids, row):
+                term = terms.get(sid)
+                if term is None:
+                    term = terms[sid] = Term.from_id(sid)
+                binding[vid] = term
+            bindings.append(binding)
+        return bindings
+
+    def explain(self, rule):
+        """
+        Get, for the body atoms of rule in the order the plan joins them, the
+        triples (atom, estimated, actual) with the estimated and actual number
+        of bindings after joining that atom. The plan is made with the current
+        statistics.
+        """
+        shape, params = signature(rule)
+        plan = JoinPlan(shape, None, self.estimate)
+        counts = [0] * len(plan.steps)
+        plan.run(self.store, params, counts=counts)
+        result = []
+        for k, step in enumerate(plan.steps):
+            result.append((rule.body[step[0]], plan.estimates[k], counts[k]))
+        return result
@@ -0,0 +1,134 @@
+"""
+A hand-written reader for the language of eunomia.parser, for large (fact
+heavy) programs: it reads line by line and yields every rule as soon as its
+closing dot is read, so rules can be pushed into an engine while the rest of
+the input is still being read, and the input never has to be in memory as a
+whole.
+
+It accepts exactly what the PLY Parser accepts and builds the same rules:
+tokens are those of eunomia.lexer (any other character is skipped), and no
+token can span two lines, so the input is tokenized per line.
+"""
+
+import re
+from eunomia.models import Program, Rule, Atom, Term
+
+# VAR, WORD, IF, and LPAREN, RPAREN, COMMA, DOT (in the lexer's order)
+_TOKEN = re.compile(r'\?\w+|\w+|:-|[(),.]')
+
+# The states of the reader: what it expects next
+_RULE = 0        # the predicate of a head
+_LPAREN = 1      # the ( after a predicate
+_FIRST_ARG = 2   # a term, a ) or a , (the grammar allows an empty first term)
+_ARG = 3         # a term after a ,
+_NEXT_ARG = 4    # a , or a ) after a term
+_AFTER_HEAD = 5  # a :- or a .
+_BODY = 6        # the predicate of a body atom
+_AFTER_ATOM = 7  # a , or a . after a body atom
+
+def read(lines):
+    """
+    Yield the rules (facts are rules with an empty body) in lines, a file
+    object or any other iterable of strings. Raises a SyntaxError on input
+    the Parser does not accept, after yielding the rules before it.
+    """
+    terms = {}
+    state = _RULE
+    head = None
+    body = []
+    predicate = None
+    args = []
+    count = 0
+
+    for (number, line) in enumerate(lines):
+        for token in _TOKEN.findall(line):
+            first = token[0]
+            is_term = first not in '(),.:'
+
+            if state == _NEXT_ARG:
+                if token == ',':
+                    state = _ARG
+                    continue
+                elif token != ')':
+                    _error(token, number)
+            elif state == _ARG or (state == _FIRST_ARG and is_term):
+                if not is_term:
+                    _error(token, number)
+                term = terms.get(token)
+                if term is None:
+                    term = terms[token] = Term(token, first == '?')
+                args.append(term)
+                state = _NEXT_ARG
+                continue
+            elif state == _FIRST_ARG:
+                if token == ',':
+                    state = _ARG
+                    continue
+                elif token != ')':
+                    _error(token, number)
+            elif state == _RULE or state == _BODY:
+                if not is_term:
+                    _error(token, number)
+                predicate = terms.get(token)
+                if predicate is None:
+                    predicate = terms[token] = Term(token, first == '?')
+                state = _LPAREN
+                continue
+            elif state == _LPAREN:
+                if token != '(':
+                    _error(token, number)
+                args = []
+                state = _FIRST_ARG
+                continue
+            elif state == _AFTER_HEAD:
+                if token == ':-':
+                    state = _BODY
+                elif token == '.':
+                    count += 1
+                    yield Rule(head, [])
+                    head = None
+                    state = _RULE
+                else:
+                    _error(token, number)
+                continue
+            else:
+                if token == ',':
+                    state = _BODY
+                elif token == '.':
+                    count += 1
+                    yield Rule(head, body)
+                    head = None
+                    body = []
+                    state = _RULE
+                else:
+                    _error(token, number)
+                continue
+
+            # the ) that closes an atom
+            atom = Atom(predicate, args)
+            if head is None:
+                head = atom
+                state = _AFTER_HEAD
+            else:
+                body.append(atom)
+                state = _AFTER_ATOM
+
+    if state != _RULE or not count:
+        raise SyntaxError('Syntax error in input: unexpected end of input')
+
+def read_program(lines):
+    """
+    Read all of lines into a Program, like Parser.parse does for a string.
+    """
+    program = Program()
+    for rule in read(lines):
+        if rule.body:
+            program.add_rule(rule)
+        else:
+            program.add_fact(rule)
+    return program
+
+## Private functions
+
+def _error(token, number):
+    raise SyntaxError('Syntax error in input: %s on line %d' % (token, number + 1))
@@ -0,0 +1,222 @@
+from eunomia.index import FactIndex
+from eunomia.graph import DependencyGraph
+from eunomia.models import Term
+from eunomia.plan import Planner, signature
+
+class SemiNaiveEngine(object):
+    """
+    An alternative to Engine that computes the minimal model set-at-a-time.
+
+    Instead of resolving one fact at a time into partially instantiated rules,
+    every round joins the facts that are new in that round (the delta)
+    against all known facts, so each derivation is made once per new fact. No
+    partial rules are ever created, only the original rules are stored.
+
+    The rules are evaluated per stratum: a strongly connected component of
+    the predicate dependency graph, in topological order, so a stratum only
+    starts once everything it depends on is known. A stratum that is not
+    recursive is done after a single pass; a recursive one runs rounds until
+    it derives nothing new.
+
+    Like Engine it takes incremental additions (push_rule, push_fact,
+    push_rules, push_facts and push_program), and the facts can be read with
+    get_facts, iter_facts, count_facts and get_matching_facts (without an
+    offset or a limit) and joins shown with explain. Unlike Engine it can not
+    retract, answer conjunctive queries (query), check exists, push_delta,
+    or be saved and loaded.
+    """
+
+    def __init__(self, program, fact_index=None):
+        """
+        fact_index is the store for the facts, by default a new FactIndex
+        (see eunomia.mapped for one on disk).
+        """
+
+        # store the original program
+        self.program = program
+
+        # the predicate dependency graph of the rules, and the rules grouped
+        # into strata along it (see __stratify)
+        self.graph = DependencyGraph()
+        self.strata = []
+
+        # an index of ground facts
+        self.fact_index = fact_index if fact_index is not None else FactIndex()
+
+        # compiles the rules into join plans against the fact index
+        self.planner = Planner(self.fact_index)
+
+        # rule -> (signature, params), see eunomia.plan.signature
+        self.signatures = {}
+
+        # The rules in the system, to be able to check existence fast (the
+        # fact index does this for facts).
+        self.rules = set()
+
+        # Now add rules and facts to index and evaluate
+        self.push_program(self.program)
+
+    def push_rule(self, rule):
+        self.__propagate([rule], [])
+
+    def push_fact(self, fact):
+        # fact is assumed to be an atom
+        self.__propagate([], [fact])
+
+    def push_rules(self, rules):
+        self.__propagate(rules, [])
+
+    def push_facts(self, facts):
+        self.__propagate([], [f.head for f in facts])
+
+    def push_program(self, program):
+        self.__propagate(program.rules, [f.head for f in program.facts])
+
+    def get_facts(self):
+        return self.fact_index.get_all_facts()
+
+    def iter_facts(self):
+        """
+        Yield every known fact once, without building a list of them.
+        """
+        return self.fact_index.iter_facts()
+
+    def count_facts(self, predicate=None):
+        """
+        The number of known facts, or of known facts with predicate (a name).
+        """
+        if predicate is None:
+            return self.fact_index.count_facts()
+        return self.fact_index.count_facts(Term(predicate).id)
+
+    def get_matching_facts(self, atom):
+        return self.fact_index.get_matching_facts(atom)
+
+    def explain(self, rule):
+        return self.planner.explain(rule)
+
+    # Private
+
+    def __propagate(self, rules, facts):
+        """
+        Add rules and facts and evaluate until no new facts can be derived,
+        one stratum at a time.
+        """
+        new_rules = set()
+        for rule in rules:
+            if rule.is_fact():
+                facts.append(rule.head)
+            elif rule not in self.rules:
+                self.rules.add(rule)
+                self.graph.add_rule(rule)
+                self.signatures[rule] = signature(rule)
+                new_rules.add(rule)
+        if new_rules:
+            self.__stratify()
+
+        # (predicate id, arity) -> the facts that are new in this propagation
+        new = {}
+        for fact in facts:
+            self.__add_new(fact, new)
+
+        for (rules, uses, recursive, done) in self.strata:
+            derived = {}
+
+            # New rules are evaluated against all facts known so far, and
+            # the rules of the stratum against the new facts of earlier
+            # strata, in a single pass.
+            for rule in rules:
+                if rule in new_rules:
+                    for head in self.planner.derive(rule):
+                        self.__add_new(head, derived)
+            self.__join(uses, new, derived)
+
+            while derived:
+                for key, delta in derived.items():
+                    new.setdefault(key, []).extend(delta)
+                if not recursive:
+                    # nothing derived here is used by the stratum itself
+                    break
+                delta, derived = derived, {}
+                self.__join(uses, delta, derived)
+
+            # Later strata do not need the new facts of predicates that only
+            # earlier strata use.
+            for key in done:
+                new.pop(key, None)
+
+    def __stratify(self):
+        """
+        Group the rules into strata, one per strongly connected component of
+        the dependency graph that has rules, in topological order. A stratum
+        is (rules, uses, recursive, done) with uses the (body position, rule)
+        pairs per (predicate id, arity) of the body atoms, and done the keys
+        no later stratum uses.
+        """
+        components = self.graph.components()
+        stratum_of = {}
+        for s, component in enumerate(components):
+            for key in component:
+                stratum_of[key] = s
+
+        rules = [[] for component in components]
+        uses = [{} for component in components]
+        last_use = {}
+        for rule in self.rules:
+            s = stratum_of[_key(rule.head)]
+            rules[s].append(rule)
+            for idx, atom in enumerate(rule.body):
+                key = _key(atom)
+                uses[s].setdefault(key, []).append((idx, rule))
+                last_use[key] = max(last_use.get(key, s), s)
+
+        done = [[] for component in components]
+        for key, s in last_use.items():
+            done[s].append(key)
+
+        self.strata = []
+        for s, component in enumerate(components):
+            if rules[s]:
+                self.strata.append((rules[s], uses[s], self.graph.is_recursive(component), done[s]))
+
+    def __join(self, uses, delta, derived):
+        """
+        Resolve the facts in delta (all in the fact index already) with the
+        body atoms in uses and add the new heads to derived (storing them).
+        """
+        # To derive everything only once, the body atoms after the one a
+        # delta fact is resolved with do not use the delta facts: those
+        # derivations are made when the delta fact itself is resolved with
+        # the later body atom.
+        skip = {}
+        for key, facts in delta.items():
+            if key in uses:
+                rows = skip.setdefault(key[0], set())
+                for fact in facts:
+                    rows.add(tuple([arg.id for arg in fact.args]))
+
+        to_atom = self.planner.to_atom
+        for key, facts in delta.items():
+            for (idx, rule) in uses.get(key, ()):
+                shape, params = self.signatures[rule]
+                plan = self.planner.compile(shape, idx)
+                for fact in facts:
+                    row = tuple([arg.id for arg in fact.args])
+                    for head in plan.run(self.fact_index, params, row, skip):
+                        self.__add_new(to_atom(plan.head_pred, head), derived)
+
+    def __add_new(self, fact, found):
+        """
+        Store fact and add it to found if it is new. A fact is stored as soon
+        as it is derived; joins of the same round may then already find it,
+        which only derives some facts earlier.
+        """
+        if not self.fact_index.add_fact(fact):
+            return False
+        found.setdefault(_key(fact), []).append(fact)
+        return True
+
+## Private functions
+
+def _key(atom):
+    return (atom.predicate.id, len(atom.args))
@@ -0,0 +1,180 @@
+"""
+Snapshots of an Engine in a compact binary format, so a materialized model
+can be restored without evaluating the program again.
+
+A snapshot is the header MAGIC, followed by the version and a zlib-compressed
+body. The body has the names of all symbols, and then one array of 32 bit
+integers (little endian) with the evaluation order, the program, the rules
+in the rule index (including the partially resolved ones), the facts per
+relation, and the pushed rules and facts of the engine. Symbols are written
+as the ids of the saving process and mapped to the ids of the restoring
+process on load; in atoms a variable with id i is written as -1 - i.
+"""
+
+import sys
+import zlib
+import struct
+from array import array
+from eunomia.models import Program, Rule, Atom, Term
+from eunomia.symbols import symbols
+
+MAGIC = b'EUNOMIA-SNAPSHOT'
+VERSION = 2
+
+def save(path, order, program, rules, relations, explicit_rules, explicit_facts):
+    """
+    Write a snapshot to path: order is the number of the evaluation order,
+    rules the rules of the rule index, relations maps (predicate id, arity)
+    to lists of rows (see FactIndex), and explicit_rules and explicit_facts
+    are the rules and facts (atoms) that were pushed.
+    """
+    ints = array('i', [order])
+    _write_rules(ints, program.rules)
+    _write_rules(ints, program.facts)
+    _write_rules(ints, rules)
+    ints.append(len(relations))
+    for ((pred, arity), rows) in relations.items():
+        ints.extend([pred, arity, len(rows)])
+        for row in rows:
+            ints.extend(row)
+    _write_rules(ints, explicit_rules)
+    _write_rules(ints, [Rule(fact, []) for fact in explicit_facts])
+
+    names = [_encode(name) for name in symbols.names]
+    lengths = array('i', [len(name) for name in names])
+    body = (struct.pack('<ii', len(names), len(ints)) + _to_bytes(lengths)
+            + b''.join(names) + _to_bytes(ints))
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<i', VERSION))
+        f.write(zlib.compress(body, 1))
+
+def load(path):
+    """
+    Read the snapshot at path. Returns (order, program, rules, facts,
+    explicit_rules, explicit_facts) with the symbols interned in this
+    process' symbol table, and facts and explicit_facts lists of atoms.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    header = len(MAGIC) + 4
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s is not an eunomia snapshot' % path)
+    (version,) = struct.unpack('<i', data[len(MAGIC):header])
+    if version != VERSION:
+        raise ValueError('%s is a snapshot of version %d, expected %d' % (path, version, VERSION))
+
+    body = zlib.decompress(data[header:])
+    (num_names, num_ints) = struct.unpack('<ii', body[:8])
+    offset = 8
+    lengths = _from_bytes(body[offset:offset + 4 * num_names])
+    offset += 4 * num_names
+    ids = []
+    for length in lengths:
+        ids.append(symbols.intern(_decode(body[offset:offset + length])))
+        offset += length
+    ints = _from_bytes(body[offset:offset + 4 * num_ints])
+
+    reader = _Reader(ints, ids)
+    order = reader.next()
+    program = Program()
+    for rule in reader.rules():
+        program.add_rule(rule)
+    for fact in reader.rules():
+        program.add_fact(fact)
+    rules = reader.rules()
+
+    facts = []
+    for r in range(reader.next()):
+        pred = reader.term(reader.next())
+        arity = reader.next()
+        for k in range(reader.next()):
+            facts.append(Atom(pred, [reader.term(reader.next()) for p in range(arity)]))
+    explicit_rules = reader.rules()
+    explicit_facts = [fact.head for fact in reader.rules()]
+    return order, program, rules, facts, explicit_rules, explicit_facts
+
+
+class _Reader(object):
+    """
+    Reads the integers of a snapshot body one at a time, mapping the saved
+    symbol ids to the ones of this process.
+    """
+
+    def __init__(self, ints, ids):
+        self.ints = ints
+        self.ids = ids
+        self.position = 0
+        # (saved code) -> Term, so the restored atoms share their terms
+        self.terms = {}
+
+    def next(self):
+        value = self.ints[self.position]
+        self.position += 1
+        return value
+
+    def term(self, code):
+        term = self.terms.get(code)
+        if term is None:
+            if code < 0:
+                term = Term.from_id(self.ids[-1 - code], True)
+            else:
+                term = Term.from_id(self.ids[code])
+            self.terms[code] = term
+        return term
+
+    def atom(self):
+        pred = self.term(self.next())
+        return Atom(pred, [self.term(self.next()) for p in range(self.next())])
+
+    def rules(self):
+        rules = []
+        for r in range(self.next()):
+            num_body = self.next()
+            head = self.atom()
+            rules.append(Rule(head, [self.atom() for b in range(num_body)]))
+        return rules
+
+## Private functions
+
+def _write_rules(ints, rules):
+    ints.append(len(rules))
+    for rule in rules:
+        ints.append(len(rule.body))
+        for atom in (rule.head,) + rule.body:
+            ints.append(_code(atom.predicate))
+            ints.append(len(atom.args))
+            ints.extend([_code(arg) for arg in atom.args])
+
+def _code(term):
+    return -1 - term.id if term.is_var else term.id
+
+def _encode(name):
+    if isinstance(name, bytes):
+        return name
+    return name.encode('utf-8')
+
+def _decode(data):
+    if bytes is str:
+        # Python 2: names are byte strings
+        return data
+    return data.decode('utf-8')
+
+def _to_bytes(ints):
+    if sys.byteorder == 'big':
+        ints = array('i', ints)
+        ints.byteswap()
+    if hasattr(ints, 'tobytes'):
+        return ints.tobytes()
+    return ints.tostring()
+
+def _from_bytes(data):
+    ints = array('i')
+    if hasattr(ints, 'frombytes'):
+        ints.frombytes(data)
+    else:
+        ints.fromstring(data)
+    if sys.byteorder == 'big':
+        ints.byteswap()
+    return ints
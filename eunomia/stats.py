@@ -0,0 +1,85 @@
+"""
+Counters of the work an Engine and its indexes do, to see where the time of
+a build goes and whether a change reduces the work.
+
+They are off by default (see Engine.enable_statistics): the Engine, the
+RuleIndex and the FactIndex then each have a stats attribute that is None,
+and the only cost is checking that where something would be counted.
+"""
+
+from collections import OrderedDict
+
+class Statistics(object):
+    """
+    Named counters (see count), and the number of resolutions per source
+    rule: a partially resolved rule counts for the pushed rule it was
+    resolved from.
+
+    At most max_rules source rules and max_rules partial rules are kept
+    track of, so a long session does not make the statistics grow without
+    end. With more source rules only the half with the most resolutions is
+    kept (the counts of the others are lost), and with more partial rules
+    the oldest ones are forgotten (a partial rule that is resolved again
+    after that counts for itself).
+    """
+
+    def __init__(self, max_rules=100000):
+        self.max_rules = max_rules
+
+        # name -> number
+        self.counts = {}
+
+        # source rule -> the number of rules and facts resolved from it and
+        # from the partial rules made with it
+        self.resolutions = {}
+
+        # partially resolved rule -> its source rule, oldest first
+        self.origins = OrderedDict()
+
+    def count(self, name, number=1):
+        self.counts[name] = self.counts.get(name, 0) + number
+
+    def resolved(self, rule, new_rule):
+        """
+        Count that rule was resolved with a fact into new_rule.
+        """
+        source = self.origins.get(rule, rule)
+        self.__add_resolutions(source, 1)
+        if not new_rule.is_fact() and new_rule not in self.origins:
+            self.origins[new_rule] = source
+            if len(self.origins) > self.max_rules:
+                self.origins.popitem(last=False)
+
+    def derived(self, rule, number):
+        """
+        Count number facts derived by joining the whole body of rule.
+        """
+        if number:
+            self.__add_resolutions(self.origins.get(rule, rule), number)
+
+    def top_rules(self, number=10):
+        """
+        The number source rules with the most resolutions, as (rule, number)
+        pairs, most first.
+        """
+        pairs = sorted(self.resolutions.items(), key=lambda pair: (-pair[1], str(pair[0])))
+        return pairs[:number]
+
+    def reset(self):
+        self.counts.clear()
+        self.resolutions.clear()
+        self.origins.clear()
+
+    ## Private
+
+    def __add_resolutions(self, source, number):
+        resolutions = self.resolutions
+        if source in resolutions:
+            resolutions[source] += number
+            return
+        resolutions[source] = number
+        if len(resolutions) > self.max_rules:
+            # keep the half with the most resolutions
+            kept = sorted(resolutions.items(), key=lambda pair: -pair[1])[:self.max_rules // 2]
+            resolutions.clear()
+            resolutions.update(kept)
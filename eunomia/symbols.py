@@ -0,0 +1,36 @@
+
+class SymbolTable(object):
+    """
+    A SymbolTable interns symbols (constants, predicates and variables) as
+    dense integer ids (0, 1, 2, ...). Indexes and the engine only ever see the
+    ids; the names are only needed again when printing.
+    """
+    def __init__(self):
+        # name -> id
+        self.ids = {}
+        # id -> name (the position in the list is the id)
+        self.names = []
+
+    def intern(self, name):
+        """
+        Get the id of name, creating a new one if we never saw name before.
+        """
+        sid = self.ids.get(name)
+        if sid is None:
+            sid = len(self.names)
+            self.ids[name] = sid
+            self.names.append(name)
+        return sid
+
+    def name(self, sid):
+        return self.names[sid]
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+
+# The process-wide symbol table, shared by all programs and engines.
+symbols = SymbolTable()
@@ -1,5 +1,5 @@
 import os
-from eunomia.parser import Parser
+from eunomia.reader import read_program
 import os
 
 
@@ -11,12 +11,12 @@ def uniqify(values):
     return list(hash_dict.values())
 
 def load_program(filename):
+    # the file is read line by line (see eunomia.reader), rather than parsed
+    # as a whole with the Parser
     program = None
     if os.path.isfile(filename):
-        with open(filename, 'rU') as f:
-            text = f.read()
-            parser = Parser()
-            program = parser.parse(text) 
+        with open(filename, 'r') as f:
+            program = read_program(f)
     return program
 
 
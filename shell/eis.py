@@ -2,6 +2,7 @@ import cmd
 from eunomia.parser import Parser
 from eunomia.engine import Engine
 import eunomia.utils
+import eunomia.magic
 from timer import Timer
 import os
 
@@ -23,6 +24,12 @@ class Eis(cmd.Cmd):
     # Possible options for SHOW command
     show_options = [ 'loaded', 'inferences' ]
 
+    # Whether engines count their work (see the STATS command)
+    statistics = False
+
+    # Possible options for STATS command
+    stats_options = [ 'on', 'off', 'reset' ]
+
     ## Loading files as programs:
 
     def do_load(self, filename):
@@ -51,10 +58,9 @@ class Eis(cmd.Cmd):
                 if not self.engine:
                     print "You did not ask to deduce what I know. Try 'build'."
                 else:
-                    facts = self.engine.get_facts()
-                    for f in facts:
+                    for f in self.engine.iter_facts():
                         print f
-                    print "==> ", len(facts), "facts currently known."
+                    print "==> ", self.engine.count_facts(), "facts currently known."
             else:
                 print "I don't know what to show. Use <TAB> to see options."
         else:
@@ -95,34 +101,163 @@ class Eis(cmd.Cmd):
             print "I don't know what to add. Add a rule or fact."
 
 
+    ## Retracting rules or facts
+
+    def do_retract(self, what):
+        """retract [rule or fact]
+        Remove a rule or fact that was added before and update the known
+        inferences.
+        \nFor example 'retract f(a,b).' or 'retract p(?x, ?y) :- q(?y, ?x).'
+        """
+        if what:
+            try:
+                p = Parser()
+                old_program = p.parse(what)
+                retracted = 0
+                if self.engine:
+                    with self.time:
+                        for rule in old_program.rules + old_program.facts:
+                            if self.engine.retract_rule(rule):
+                                retracted += 1
+
+                # and take them out of the program
+                if self.program:
+                    for rule in old_program.rules:
+                        if rule in self.program.rules:
+                            self.program.rules.remove(rule)
+                    for fact in old_program.facts:
+                        if fact in self.program.facts:
+                            self.program.facts.remove(fact)
+
+                print "==> retracted ", retracted, " rules and facts and updated known inferences."
+
+            except Exception as e:
+                print "I'm not able to retract ", what, " Is it a well-formed fact or rule?\nDetails: ",  e
+        else:
+            print "I don't know what to retract. Give a rule or fact."
+
+    ## Importing facts in bulk
+
+    def do_import(self, line):
+        """import [predicate] [file]
+        Load every row of a TSV file (or a CSV file if it ends in .csv) as a
+        fact of predicate and update the known inferences.
+        \nFor example 'import edge edges.tsv' for facts edge(x, y) from two columns.
+        """
+        args = line.split()
+        if len(args) != 2:
+            print "Give a predicate and a file, e.g. 'import edge edges.tsv'."
+        elif not self.engine:
+            print "Do a build first, then import facts into it."
+        elif not os.path.isfile(args[1]):
+            print args[1], " does not seem to exist."
+        else:
+            (predicate, filename) = args
+            delimiter = ',' if filename.endswith('.csv') else '\t'
+            with self.time:
+                added = self.engine.load_facts(predicate, filename, delimiter)
+                print "==> ", added, "new facts imported and updated known inferences."
+
     ## Doing queries
 
     def do_query(self, what):
-        """query [atom]
+        """query [atoms] [limit n] [offset n] [exists]
         \nFor example 'query f(?x,b).' 
+        \nAfter a 'build' the query is looked up in the model. Without a
+        build only the part of the loaded program that the query needs is
+        evaluated.
+        \nA query of more than one atom, e.g. 'query f(?x,?y), g(?y,?x).',
+        shows the values of its variables for which all atoms hold. It needs
+        a 'build' first.
+        \nAfter the query, 'limit 20' shows at most 20 answers, 'offset 40'
+        skips the first 40, and 'exists' only tells whether there is any,
+        e.g. 'query f(?x,b). offset 40 limit 20'.
         """
         if what:
             try:
-                p = Parser()
-                new_program = p.parse(what)
-                if len(new_program.facts) > 0:
-                    atom = new_program.facts[0].head
-                
-                # this pushes both facts and rules
-                if atom and self.engine:
+                (query, offset, limit, exists) = _query_options(what)
+                p = Parser('atoms')
+                atoms = p.parse(query)
+                atom = atoms[0]
+
+                if len(atoms) > 1:
+                    if self.engine:
+                        with self.time:
+                            self.__query_atoms(atoms, offset, limit, exists)
+                    else:
+                        print "Do a build first for a query of more than one atom."
+                elif self.engine or self.program:
                     with self.time:
-                        facts = self.engine.get_matching_facts(atom)
-                        for f in facts:
-                            print f
-                        print "==> ", len(facts), "facts match query ", atom
+                        if self.engine and exists:
+                            found = self.engine.exists(atom)
+                        elif self.engine:
+                            facts = self.engine.get_matching_facts(atom, offset, limit)
+                        else:
+                            facts = eunomia.magic.query(self.program, atom)[offset:]
+                            if limit is not None:
+                                facts = facts[:limit]
+                            found = len(facts) > 0
+                        if exists:
+                            print "==> ", "some fact matches" if found else "no fact matches", "query ", atom
+                        else:
+                            for f in facts:
+                                print f
+                            print "==> ", len(facts), "facts match query ", atom
                 else:
-                    print "Do an actual query and do a build first."
+                    print "Do an actual query and load a program first."
  
             except Exception as e:
                 print "I'm not able to query ", what, " Is it well-formed? ",  e
         else:
             print "I don't know what to query."
 
+    def __query_atoms(self, atoms, offset, limit, exists):
+        query = ", ".join(map(str, atoms))
+        bindings = self.engine.query(atoms)
+        if exists:
+            print "==> ", "some answer" if bindings else "no answer", "to query ", query
+            return
+        bindings = bindings[offset:]
+        if limit is not None:
+            bindings = bindings[:limit]
+
+        variables = []
+        for atom in atoms:
+            for arg in atom.args:
+                if arg.is_var and arg not in variables:
+                    variables.append(arg)
+        for binding in bindings:
+            if variables:
+                print ", ".join(["%s = %s" % (var, binding[var.id]) for var in variables])
+        print "==> ", len(bindings), "answers to query ", query
+
+
+    ## Explaining how a rule is evaluated
+
+    def do_explain(self, what):
+        """explain [rule]
+        Show in which order the body atoms of a rule are joined with the facts
+        currently known, with the estimated and actual number of intermediate
+        results after each atom.
+        \nFor example 'explain path(?x, ?z) :- edge(?x, ?y), path(?y, ?z).'
+        """
+        if what:
+            try:
+                p = Parser()
+                new_program = p.parse(what)
+                if new_program.rules and self.engine:
+                    rule = new_program.rules[0]
+                    with self.time:
+                        steps = self.engine.explain(rule)
+                        for i, (atom, estimated, actual) in enumerate(steps):
+                            print "%d. %s  (estimated %.1f, actual %d)" % (i + 1, atom, estimated, actual)
+                else:
+                    print "Explain an actual rule and do a build first."
+
+            except Exception as e:
+                print "I'm not able to explain ", what, " Is it a well-formed rule? ",  e
+        else:
+            print "I don't know what to explain. Give a rule."
 
     ## Inferring all you can:
 
@@ -135,15 +270,118 @@ class Eis(cmd.Cmd):
                 print "No program was loaded. Try 'load' first."
             else:
                 print "Building model..."
-                self.engine = Engine(self.program)
+                self.engine = Engine(self.program, statistics=self.statistics)
                 print "==> Model built (do 'show inferences' to see all known facts)"
 
+    ## Saving and restoring a built model
+
+    def do_save(self, filename):
+        """save [file]
+        Save the built model (program, rules and all known facts) to a file,
+        so it can be restored later without building it again.
+        """
+        if not filename:
+            print "To what file should I save?"
+        elif not self.engine:
+            print "There is no model to save. Try 'build' first."
+        else:
+            with self.time:
+                self.engine.save(filename)
+                print "==> model saved to ", filename
+
+    def do_restore(self, filename):
+        """restore [file]
+        Restore a model saved with 'save', together with its program.
+        """
+        if not filename:
+            print "What file should I restore?"
+        elif not os.path.isfile(filename):
+            print filename, " does not seem to exist."
+        else:
+            with self.time:
+                try:
+                    self.engine = Engine.load(filename)
+                    self.engine.enable_statistics(self.statistics)
+                    self.program = self.engine.program
+                    print "==> model restored (do 'show inferences' to see all known facts)"
+                except ValueError as e:
+                    print "I'm not able to restore ", filename, " Details: ", e
+
+    ## Counting the work of the engine
+
+    def do_stats(self, what):
+        """stats [on|off|reset]
+        Show how much work the engine did: facts and rules pushed, new and
+        already known, candidates the indexes looked at and how many of them
+        unified, and the rules most resolutions came from.
+        \n'stats on' starts counting (do it before a 'build' to count the
+        build), 'stats off' stops it and 'stats reset' starts from zero.
+        """
+        if what == "on" or what == "off":
+            self.statistics = what == "on"
+            if self.engine:
+                self.engine.enable_statistics(self.statistics)
+            print "==> statistics are", what
+        elif what == "reset":
+            if self.engine and self.engine.stats:
+                self.engine.stats.reset()
+                print "==> statistics reset"
+            else:
+                print "Statistics are off. Try 'stats on'."
+        elif what:
+            print "I don't know what to do with the statistics. Use <TAB> to see options."
+        elif not self.engine or not self.engine.stats:
+            print "There are no statistics. Do 'stats on' and then a 'build'."
+        else:
+            stats = self.engine.stats
+            for name in sorted(stats.counts):
+                print "%-28s %d" % (name, stats.counts[name])
+            top = stats.top_rules()
+            if top:
+                print "Rules with the most resolutions:"
+                for (rule, number) in top:
+                    print "%12d  %s" % (number, rule)
+            if self.engine.query_cache is not None:
+                cache = self.engine.query_cache.stats()
+                print "Query cache: %d hits, %d misses, %d queries cached" % (cache['hits'], cache['misses'], cache['queries'])
+
+    def complete_stats(self, text, line, begidx, endidx):
+        return [ f for f in self.stats_options if f.startswith(text) ]
+
     def do_EOF(self, line):
         return True
     
     def postloop(self):
         print
 
+## Private functions
+
+def _query_options(text):
+    """
+    Split the text of a query command into the query (up to its last dot,
+    without the dot) and the options after it: (query, offset, limit,
+    exists).
+    """
+    (query, dot, rest) = text.rpartition('.')
+    if not dot:
+        return (text, 0, None, False)
+    words = rest.split()
+    offset = 0
+    limit = None
+    exists = False
+    while words:
+        word = words.pop(0)
+        if word == 'exists':
+            exists = True
+        elif word in ('limit', 'offset') and words and words[0].isdigit():
+            if word == 'limit':
+                limit = int(words.pop(0))
+            else:
+                offset = int(words.pop(0))
+        else:
+            raise ValueError("unknown query option '%s', use limit n, offset n or exists" % word)
+    return (query, offset, limit, exists)
+
 if __name__ == '__main__':
     Eis().cmdloop()
 
@@ -0,0 +1,72 @@
+import unittest
+from eunomia.cache import QueryCache
+from eunomia.models import Atom, Term
+
+class TestQueryCache(unittest.TestCase):
+
+    def test_get_and_put(self):
+        cache = QueryCache()
+        query = Atom(Term("p"), [Term("?x", True), Term("b")])
+        facts = [Atom(Term("p"), [Term("a"), Term("b")])]
+        self.assertIsNone(cache.get(query))
+        cache.put(query, facts)
+        self.assertIs(cache.get(query), facts)
+
+        # the variables do not matter, only where they are
+        self.assertIs(cache.get(Atom(Term("p"), [Term("?y", True), Term("b")])), facts)
+        self.assertIsNone(cache.get(Atom(Term("p"), [Term("b"), Term("?x", True)])))
+        self.assertIsNone(cache.get(Atom(Term("p"), [Term("?x", True), Term("?x", True)])))
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 3))
+        self.assertEqual((stats['queries'], stats['facts']), (1, 1))
+
+    def test_invalidate(self):
+        cache = QueryCache()
+        p1 = Atom(Term("p"), [Term("?x", True)])
+        p2 = Atom(Term("p"), [Term("a")])
+        q = Atom(Term("q"), [Term("?x", True)])
+        for query in [p1, p2, q]:
+            cache.put(query, [query])
+
+        cache.invalidate(Term("p").id)
+        self.assertIsNone(cache.get(p1))
+        self.assertIsNone(cache.get(p2))
+        self.assertEqual(cache.get(q), [q])
+        self.assertEqual(cache.stats()['invalidations'], 2)
+        self.assertEqual(len(cache), 1)
+
+        # again, with nothing to drop
+        cache.invalidate(Term("p").id)
+        self.assertEqual(cache.stats()['invalidations'], 2)
+
+    def test_least_recently_used(self):
+        cache = QueryCache(max_queries=2, max_facts=3)
+        queries = [Atom(Term("p"), [Term("a%d" % i)]) for i in range(3)]
+        cache.put(queries[0], [queries[0]])
+        cache.put(queries[1], [queries[1]])
+        cache.get(queries[0])
+        cache.put(queries[2], [queries[2]])
+
+        self.assertIsNotNone(cache.get(queries[0]))
+        self.assertIsNone(cache.get(queries[1]))
+        self.assertIsNotNone(cache.get(queries[2]))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        # too many facts in all: the least recently used go
+        cache.put(queries[1], [queries[1]] * 3)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.stats()['facts'], 3)
+
+        # a result that is too large is not cached
+        cache.put(queries[0], [queries[0]] * 4)
+        self.assertIsNone(cache.get(queries[0]))
+        self.assertEqual(cache.stats()['facts'], 3)
+
+        # and invalidating keeps the counts right
+        cache.invalidate(Term("p").id)
+        self.assertEqual(cache.stats()['facts'], 0)
+        self.assertEqual(cache.by_predicate, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import random
+from eunomia.models import Rule, Atom, Term
+from eunomia.engine import Engine
+from eunomia.parser import Parser
+import eunomia.columnar
+import eunomia.utils
+from tests.test_engine import EngineCases
+
+@unittest.skipIf(eunomia.columnar.numpy is None, "numpy is not installed")
+class TestColumnarEngine(EngineCases, unittest.TestCase):
+
+    def setUp(self):
+        eunomia.utils.clear_tmp_parse_files()
+
+    def make_engine(self, program):
+        return eunomia.columnar.ColumnarEngine(program)
+
+    def test_push_known_fact(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        engine = eunomia.columnar.ColumnarEngine(program)
+        engine.push_fact(Atom(Term("edge"), [ Term("a"), Term("b")]))
+        engine.push_fact(Atom(Term("edge"), [ Term("b"), Term("c")]))
+        self.assertEqual(len(engine.get_facts()), 5)
+
+        # pushing a known fact changes nothing
+        engine.push_fact(Atom(Term("edge"), [ Term("a"), Term("b")]))
+        self.assertEqual(len(engine.get_facts()), 5)
+
+    def test_constants_and_repeated_variables(self):
+        parser = Parser()
+        program = parser.parse("""
+            p(?x) :- r(?x), q(?x, ?x).
+            s(?x, c) :- q(a, ?x).
+            t() :- r(a).
+            u(?x) :- t(), r(?x).
+            r(a). r(b). q(a, a). q(b, c).
+            """)
+        engine = eunomia.columnar.ColumnarEngine(program)
+        expected = ['p(a)', 'r(a)', 'r(b)', 'q(a, a)', 'q(b, c)', 's(a, c)',
+                    't()', 'u(a)', 'u(b)']
+        self.assertEqual(set(map(str, engine.get_facts())), set(expected))
+
+        query = Atom(Term("q"), [ Term("?x", True), Term("?x", True) ])
+        self.assertEqual(list(map(str, engine.get_matching_facts(query))), ['q(a, a)'])
+
+    def test_same_model_as_engine(self):
+        program = Parser().parse("""
+            path(?x, ?y) :- edge(?x, ?y).
+            path(?x, ?z) :- path(?x, ?y), path(?y, ?z).
+            meet(?x, ?y) :- path(?x, ?z), path(?y, ?z), edge(?x, ?y).
+            """)
+        rnd = random.Random(11)
+        for i in range(40):
+            x, y = rnd.randint(0, 12), rnd.randint(0, 12)
+            fact = Atom(Term("edge"), [ Term("n%d" % x), Term("n%d" % y)])
+            program.add_fact(Rule(fact, []))
+
+        expected = set(map(str, Engine(program).get_facts()))
+        engine = eunomia.columnar.ColumnarEngine(program)
+        self.assertEqual(set(map(str, engine.get_facts())), expected)
+
+
+    def test_reading_facts(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        for (x, y) in [("a", "b"), ("b", "c"), ("c", "d")]:
+            program.add_fact(Rule(Atom(Term("edge"), [ Term(x), Term(y)]), []))
+        expected = Engine(program)
+        engine = eunomia.columnar.ColumnarEngine(program)
+
+        self.assertEqual(set(map(str, engine.iter_facts())), set(map(str, expected.iter_facts())))
+        self.assertEqual(engine.count_facts(), expected.count_facts())
+        self.assertEqual(engine.count_facts("path"), 6)
+        self.assertEqual(engine.count_facts("nothing"), 0)
+
+        self.assertTrue(engine.exists(Atom(Term("path"), [ Term("a"), Term("?x", True)])))
+        self.assertFalse(engine.exists(Atom(Term("path"), [ Term("d"), Term("?x", True)])))
+        self.assertFalse(engine.exists(Atom(Term("path"), [ Term("?x", True), Term("?x", True)])))
+        self.assertFalse(engine.exists(Atom(Term("nothing"), [])))
+
+        rule = program.rules[1]
+        steps = engine.explain(rule)
+        self.assertEqual([str(atom) for (atom, estimated, actual) in steps],
+                         [str(atom) for atom in rule.body])
+        self.assertEqual([actual for (atom, estimated, actual) in steps], [3, 3])
+        self.assertEqual([estimated for (atom, estimated, actual) in steps], [3.0, 6.0])
+        self.assertEqual(steps[-1][2], expected.explain(rule)[-1][2])
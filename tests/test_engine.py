@@ -1,9 +1,46 @@
 import unittest
+import os
+import tempfile
+import random
 from eunomia.models import Program, Rule, Atom, Term
-from eunomia.engine import Engine
+from eunomia.engine import Engine, FIFO, LIFO, FACTS_FIRST
 import eunomia.utils
 
-class TestEngine(unittest.TestCase):
+class EngineCases(object):
+    """
+    The cases every engine passes, mixed into the tests of each engine class
+    (make_engine makes one for a program).
+    """
+
+    def make_engine(self, program):
+        return Engine(program)
+
+    def test_load_program(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        engine = self.make_engine(program)
+        self.assertEqual(engine.get_facts(), [])
+
+        engine.push_fact(Atom(Term("edge"), [ Term("a"), Term("b")]))
+        engine.push_fact(Atom(Term("edge"), [ Term("c"), Term("d")]))
+        engine.push_fact(Atom(Term("edge"), [ Term("b"), Term("c")]))
+
+        expected = ['edge(a, b)', 'edge(b, c)', 'edge(c, d)', 'path(a, b)',
+                    'path(b, c)', 'path(c, d)', 'path(a, c)', 'path(b, d)',
+                    'path(a, d)']
+        self.assertEqual(set(map(str, engine.get_facts())), set(expected))
+
+    def test_ex_20150102(self):
+        program = eunomia.utils.load_program('examples/ex_20150102.lp')
+        engine = self.make_engine(program)
+        expected = ['r(b)', 'p(b)', 'q(b)', 's(a)', 'r(a)', 's(b)']
+        self.assertEqual(set(map(str, engine.get_facts())), set(expected))
+
+        query = Atom(Term("s"), [ Term("?x", True) ])
+        matching = [ 's(a)', 's(b)'] 
+        self.assertEqual(set(map(str, engine.get_matching_facts(query))), set(matching))
+
+
+class TestEngine(EngineCases, unittest.TestCase):
 
     def setUp(self):
         eunomia.utils.clear_tmp_parse_files()
@@ -35,7 +72,7 @@ class TestEngine(unittest.TestCase):
         self.assertEqual(engine.program, program)
         self.assertEqual(set(map(lambda x: x.hash(), engine.get_facts())), set([head.hash()]) )
 
-    def test_load_program(self):
+    def test_push_facts_one_by_one(self):
         program = eunomia.utils.load_program('examples/path.lp')
         self.assertTrue(len(program.rules), 2)
         engine = Engine(program)
@@ -75,17 +112,401 @@ class TestEngine(unittest.TestCase):
 
         self.assertEqual(set(map(lambda x: str(x), results)), set(map(lambda x: str(x), expected)))
 
-    def test_ex_20150102(self):
-        program = eunomia.utils.load_program('examples/ex_20150102.lp')
+    def test_orders(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        for i in range(10):
+            fact = Atom(Term("edge"), [ Term("n%d" % i), Term("n%d" % ((i * 3) % 10))])
+            program.add_fact(Rule(fact, []))
+
+        expected = set(map(str, Engine(program).get_facts()))
+        self.assertEqual(len(expected), 44)
+        for order in [FIFO, LIFO, FACTS_FIRST]:
+            engine = Engine(program, order)
+            self.assertEqual(set(map(str, engine.get_facts())), expected)
+
+        self.assertRaises(ValueError, Engine, program, 'random')
+
+    def test_long_derivation_chain(self):
+        # deriving p(n5000) takes 5000 consecutive steps, which is well past
+        # the recursion limit.
+        program = Program()
+        x = Term("?x", True)
+        y = Term("?y", True)
+        program.add_rule(Rule(Atom(Term("p"), [ y ]), [ Atom(Term("p"), [ x ]), Atom(Term("next"), [ x, y ]) ]))
+        for i in range(5000):
+            program.add_fact(Rule(Atom(Term("next"), [ Term("n%d" % i), Term("n%d" % (i + 1)) ]), []))
+        program.add_fact(Rule(Atom(Term("p"), [ Term("n0") ]), []))
+
+        for order in [FIFO, LIFO, FACTS_FIRST]:
+            engine = Engine(program, order)
+            self.assertEqual(len(engine.get_matching_facts(Atom(Term("p"), [ x ]))), 5001)
+
+    def test_explain(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        for (x, y) in [("a", "b"), ("b", "c"), ("c", "d")]:
+            program.add_fact(Rule(Atom(Term("edge"), [ Term(x), Term(y) ]), []))
         engine = Engine(program)
-        expected = ['r(b)', 'p(b)', 'q(b)', 's(a)', 'r(a)', 's(b)']
+        rule = program.rules[1]
+        steps = engine.explain(rule)
+        self.assertEqual(set(str(atom) for (atom, estimated, actual) in steps), set(map(str, rule.body)))
+        # 3 edges, each followed by the paths from its end
+        self.assertEqual(steps[-1][2], 3)
+
+    def test_load_facts(self):
+        (fd, path) = tempfile.mkstemp(suffix='.tsv')
+        with os.fdopen(fd, 'w') as f:
+            f.write("a\tb\nb\tc\na\tb\n\nc\td\n")
+        program = eunomia.utils.load_program('examples/path.lp')
+        engine = Engine(program)
+        engine.LOAD_BATCH = 2
+        try:
+            self.assertEqual(engine.load_facts('edge', path), 3)
+            # loading again adds nothing
+            self.assertEqual(engine.load_facts('edge', path), 0)
+        finally:
+            os.remove(path)
+
+        expected = ['edge(a, b)', 'edge(b, c)', 'edge(c, d)', 'path(a, b)',
+                    'path(b, c)', 'path(c, d)', 'path(a, c)', 'path(b, d)',
+                    'path(a, d)']
         self.assertEqual(set(map(str, engine.get_facts())), set(expected))
 
-        query = Atom(Term("s"), [ Term("?x", True) ])
-        matching = [ 's(a)', 's(b)'] 
-        self.assertEqual(set(map(str, engine.get_matching_facts(query))), set(matching))
+    def test_load_facts_csv(self):
+        (fd, path) = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write("a,b\nb,\"c\"\n")
+        engine = Engine(eunomia.utils.load_program('examples/path.lp'))
+        try:
+            self.assertEqual(engine.load_facts('edge', path, delimiter=','), 2)
+        finally:
+            os.remove(path)
+        query = Atom(Term("path"), [ Term("a"), Term("?x", True)])
+        self.assertEqual(set(map(str, engine.get_matching_facts(query))), set(['path(a, b)', 'path(a, c)']))
+
+    def test_load_facts_quotes_and_arity(self):
+        (fd, path) = tempfile.mkstemp(suffix='.tsv')
+        with os.fdopen(fd, 'w') as f:
+            f.write('a\t"b\n"b c"\td\r\n')
+        engine = Engine(Program())
+        try:
+            # quotes are part of the fields of a TSV file
+            self.assertEqual(engine.load_facts('edge', path), 2)
+            self.assertEqual(set(map(str, engine.get_facts())),
+                             set(['edge(a, "b)', 'edge("b c", d)']))
+
+            with open(path, 'a') as f:
+                f.write('x\ty\tz\n')
+            try:
+                engine.load_facts('edge', path)
+                self.fail('no ValueError')
+            except ValueError as e:
+                self.assertTrue('line 3' in str(e))
+        finally:
+            os.remove(path)
+        self.assertEqual(engine.count_facts('edge'), 2)
+
+    def test_save_and_load(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        engine = Engine(program, order=LIFO)
+        engine.push_fact(Atom(Term("edge"), [ Term("a"), Term("b")]))
+        engine.push_fact(Atom(Term("edge"), [ Term("b"), Term("c")]))
+
+        (fd, path) = tempfile.mkstemp(suffix='.snapshot')
+        os.close(fd)
+        try:
+            engine.save(path)
+            restored = Engine.load(path)
+        finally:
+            os.remove(path)
+
+        self.assertEqual(restored.order, LIFO)
+        self.assertEqual(str(restored.program), str(program))
+        self.assertEqual(list(map(str, restored.get_facts())), list(map(str, engine.get_facts())))
+        self.assertEqual(set(map(str, restored.rule_index.get_all_rules())),
+                         set(map(str, engine.rule_index.get_all_rules())))
+        self.assertEqual(restored.register, engine.register)
+
+        # both go on the same way
+        for e in (engine, restored):
+            e.push_fact(Atom(Term("edge"), [ Term("c"), Term("d")]))
+            e.push_program(program)
+        self.assertEqual(set(map(str, restored.get_facts())), set(map(str, engine.get_facts())))
+        self.assertEqual(len(restored.get_facts()), 9)
+
+    def test_load_not_a_snapshot(self):
+        self.assertRaises(ValueError, Engine.load, 'examples/path.lp')
+
+    def test_retract_fact(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        engine = Engine(program)
+        edges = [("a", "b"), ("b", "c"), ("c", "d"), ("a", "c")]
+        for (x, y) in edges:
+            engine.push_fact(Atom(Term("edge"), [ Term(x), Term(y)]))
+
+        # derived facts can not be retracted
+        self.assertFalse(engine.retract_fact(Atom(Term("path"), [ Term("a"), Term("b")])))
+
+        # path(a, c) and path(a, d) still hold through edge(a, c)
+        self.assertTrue(engine.retract_fact(Atom(Term("edge"), [ Term("b"), Term("c")])))
+        expected = ['edge(a, b)', 'edge(c, d)', 'edge(a, c)', 'path(a, b)',
+                    'path(c, d)', 'path(a, c)', 'path(a, d)']
+        self.assertEqual(set(map(str, engine.get_facts())), set(expected))
+        self.assertEqual(set(map(str, engine.iter_facts())), set(expected))
+        self.assertEqual(engine.count_facts(), 7)
+        self.assertEqual(engine.count_facts('path'), 4)
+
+        # no partial rule made with edge(b, c) is left to derive path(b, e)
+        engine.push_fact(Atom(Term("edge"), [ Term("d"), Term("e")]))
+        self.assertNotIn('path(b, e)', set(map(str, engine.get_facts())))
+        self.assertIn('path(a, e)', set(map(str, engine.get_facts())))
+
+        # and the model still grows incrementally, also with the facts that
+        # were deleted before
+        engine.push_fact(Atom(Term("edge"), [ Term("b"), Term("c")]))
+        for (x, y) in edges + [("d", "e")]:
+            program.add_fact(Rule(Atom(Term("edge"), [ Term(x), Term(y)]), []))
+        self.assertEqual(set(map(str, engine.get_facts())), set(map(str, Engine(program).get_facts())))
+
+    def test_retract_rule(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        engine = Engine(program)
+        for (x, y) in [("a", "b"), ("b", "c"), ("c", "d")]:
+            engine.push_fact(Atom(Term("edge"), [ Term(x), Term(y)]))
+
+        recursive = program.rules[1]
+        self.assertTrue(engine.retract_rule(recursive))
+        self.assertFalse(engine.retract_rule(recursive))
+        expected = ['edge(a, b)', 'edge(b, c)', 'edge(c, d)', 'path(a, b)',
+                    'path(b, c)', 'path(c, d)']
+        self.assertEqual(set(map(str, engine.get_facts())), set(expected))
+
+        engine.push_fact(Atom(Term("edge"), [ Term("d"), Term("e")]))
+        self.assertIn('path(d, e)', set(map(str, engine.get_facts())))
+        self.assertNotIn('path(c, e)', set(map(str, engine.get_facts())))
+
+        engine.push_rule(recursive)
+        self.assertEqual(len(engine.get_facts()), 4 + 10)
+
+    def test_retract_random(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        rnd = random.Random(13)
+        edges = []
+        for i in range(40):
+            edge = Atom(Term("edge"), [ Term("n%d" % rnd.randint(0, 12)), Term("n%d" % rnd.randint(0, 12))])
+            edges.append(edge)
+        engine = Engine(program)
+        for edge in edges:
+            engine.push_fact(edge)
+
+        for i in range(15):
+            edge = edges.pop(rnd.randrange(len(edges)))
+            engine.retract_fact(edge)
+            if edge in edges:
+                # a duplicate: it is still pushed, but not anymore for the engine
+                engine.push_fact(edge)
+            expected = eunomia.utils.load_program('examples/path.lp')
+            for e in edges:
+                expected.add_fact(Rule(e, []))
+            self.assertEqual(set(map(str, engine.get_facts())), set(map(str, Engine(expected).get_facts())))
+
+    def test_push_delta(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        engine = Engine(program)
+        edges = [Atom(Term("edge"), [ Term(x), Term(y)]) for (x, y) in [("a", "b"), ("b", "c"), ("c", "d")]]
+        # 3 edges and 6 paths, a duplicate counts once
+        self.assertEqual(engine.push_delta(edges + edges[:1]), 9)
+        self.assertEqual(engine.push_delta(edges), 0)
+
+        # with a new rule in the same batch
+        rule = Rule(Atom(Term("reach"), [ Term("?x", True)]), [Atom(Term("path"), [ Term("a"), Term("?x", True)])])
+        fact = Atom(Term("edge"), [ Term("d"), Term("e")])
+        self.assertEqual(engine.push_delta([fact], [rule]), 1 + 4 + 4)
+
+        # and on from there one fact at a time
+        engine.push_fact(Atom(Term("edge"), [ Term("e"), Term("f")]))
+        program.add_rule(rule)
+        for edge in edges + [fact, Atom(Term("edge"), [ Term("e"), Term("f")])]:
+            program.add_fact(Rule(edge, []))
+        self.assertEqual(set(map(str, engine.get_facts())), set(map(str, Engine(program).get_facts())))
+
+    def test_push_delta_random(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        rnd = random.Random(17)
+        engine = Engine(program)
+        for batch in range(4):
+            facts = [Atom(Term("edge"), [ Term("n%d" % rnd.randint(0, 20)), Term("n%d" % rnd.randint(0, 20))])
+                     for i in range(15)]
+            engine.push_delta(facts)
+            for fact in facts:
+                program.add_fact(Rule(fact, []))
+            self.assertEqual(set(map(str, engine.get_facts())), set(map(str, Engine(program).get_facts())))
+
+    def test_max_partial_rules(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        rnd = random.Random(19)
+        edges = [Atom(Term("edge"), [ Term("n%d" % rnd.randint(0, 15)), Term("n%d" % rnd.randint(0, 15))])
+                 for i in range(40)]
+        full = Engine(program)
+        for edge in edges:
+            full.push_fact(edge)
+        expected = set(map(str, full.get_facts()))
+        (number, size) = full.measure_partial_rules()
+        self.assertTrue(number > 0 and size > 0)
+
+        for limit in [0, 5]:
+            engine = Engine(program, max_partial_rules=limit)
+            for edge in edges[:30]:
+                engine.push_fact(edge)
+            # additions stay incremental
+            engine.push_facts([Rule(edge, []) for edge in edges[30:]])
+            self.assertEqual(set(map(str, engine.get_facts())), expected)
+            self.assertEqual(engine.measure_partial_rules()[0], min(limit, number))
+            self.assertTrue(engine.measure_partial_rules()[1] < size)
 
+            # and so do retractions
+            engine.retract_fact(edges[0])
+            full.retract_fact(edges[0])
+            self.assertEqual(set(map(str, engine.get_facts())), set(map(str, full.get_facts())))
+            full.push_fact(edges[0])
 
+    def test_max_partial_rules_retract(self):
+        program = Program()
+        (x, y) = (Term("?x", True), Term("?y", True))
+        program.add_rule(Rule(Atom(Term("h"), [x]),
+                              [Atom(Term("a"), [x]), Atom(Term("b"), [y]), Atom(Term("c"), [y])]))
+        engine = Engine(program, max_partial_rules=1)
+        engine.push_fact(Atom(Term("a"), [ Term("n1")]))
+        engine.push_fact(Atom(Term("b"), [ Term("n2")]))
+        # only the last partial rule h(n1) :- c(n2) is kept
+        self.assertEqual(engine.measure_partial_rules()[0], 1)
+
+        engine.retract_fact(Atom(Term("a"), [ Term("n1")]))
+        engine.push_fact(Atom(Term("c"), [ Term("n2")]))
+        self.assertEqual(set(map(str, engine.get_facts())), set(['b(n2)', 'c(n2)']))
+
+    def test_load_max_partial_rules(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        engine = Engine(program)
+        for (x, y) in [("a", "b"), ("b", "c"), ("c", "d")]:
+            engine.push_fact(Atom(Term("edge"), [ Term(x), Term(y)]))
+        self.assertTrue(engine.measure_partial_rules()[0] > 2)
+
+        (fd, path) = tempfile.mkstemp(suffix='.snapshot')
+        os.close(fd)
+        try:
+            engine.save(path)
+            restored = Engine.load(path, max_partial_rules=2, max_cached_queries=0)
+        finally:
+            os.remove(path)
+
+        self.assertEqual(restored.max_partial_rules, 2)
+        self.assertEqual(restored.measure_partial_rules()[0], 2)
+        self.assertEqual(len(restored.partial_rules), 2)
+        self.assertTrue(restored.query_cache is None)
+
+        for e in (engine, restored):
+            e.push_fact(Atom(Term("edge"), [ Term("d"), Term("e")]))
+            e.retract_fact(Atom(Term("edge"), [ Term("a"), Term("b")]))
+        self.assertEqual(set(map(str, restored.get_facts())), set(map(str, engine.get_facts())))
+
+    def test_query_cache(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        engine = Engine(program)
+        for (x, y) in [("a", "b"), ("b", "c")]:
+            engine.push_fact(Atom(Term("edge"), [ Term(x), Term(y)]))
+        edges = Atom(Term("edge"), [ Term("?x", True), Term("?y", True)])
+        paths = Atom(Term("path"), [ Term("a"), Term("?y", True)])
+
+        self.assertEqual(set(map(str, engine.get_matching_facts(paths))), set(['path(a, b)', 'path(a, c)']))
+        engine.get_matching_facts(paths).append(None)
+        self.assertEqual(set(map(str, engine.get_matching_facts(paths))), set(['path(a, b)', 'path(a, c)']))
+        engine.get_matching_facts(edges)
+        self.assertEqual(engine.query_cache.stats()['hits'], 2)
+
+        # a new edge changes both edge and path, a new rule only path
+        engine.push_fact(Atom(Term("edge"), [ Term("c"), Term("d")]))
+        self.assertEqual(len(engine.get_matching_facts(paths)), 3)
+        self.assertEqual(len(engine.get_matching_facts(edges)), 3)
+        engine.get_matching_facts(edges)
+        self.assertEqual(engine.query_cache.stats()['hits'], 3)
+        engine.push_rule(Rule(Atom(Term("path"), [ Term("?x", True), Term("?x", True)]),
+                              [Atom(Term("edge"), [ Term("?x", True), Term("?y", True)])]))
+        self.assertEqual(len(engine.get_matching_facts(paths)), 4)
+        engine.get_matching_facts(edges)
+        self.assertEqual(engine.query_cache.stats()['hits'], 4)
 
+        # and so do retractions
+        engine.retract_fact(Atom(Term("edge"), [ Term("b"), Term("c")]))
+        self.assertEqual(set(map(str, engine.get_matching_facts(paths))), set(['path(a, b)', 'path(a, a)']))
+        self.assertEqual(len(engine.get_matching_facts(edges)), 2)
+
+        # without a cache
+        engine = Engine(program, max_cached_queries=0)
+        self.assertIsNone(engine.query_cache)
+        self.assertEqual(engine.get_matching_facts(paths), [])
+
+    def test_query_pages(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        engine = Engine(program)
+        for i in range(10):
+            engine.push_fact(Atom(Term("edge"), [ Term("n%d" % i), Term("n%d" % (i + 1))]))
+        query = Atom(Term("path"), [ Term("n0"), Term("?y", True)])
+        everything = list(map(str, engine.get_matching_facts(query)))
+        self.assertEqual(len(everything), 10)
+
+        self.assertEqual(list(map(str, engine.get_matching_facts(query, limit=3))), everything[:3])
+        self.assertEqual(list(map(str, engine.get_matching_facts(query, offset=8, limit=5))), everything[8:])
+        self.assertEqual(list(map(str, engine.get_matching_facts(query, offset=4))), everything[4:])
+        self.assertEqual(list(map(str, engine.iter_matching_facts(query))), everything)
+
+        self.assertTrue(engine.exists(query))
+        self.assertTrue(engine.exists(Atom(Term("path"), [ Term("n3"), Term("n7")])))
+        self.assertFalse(engine.exists(Atom(Term("path"), [ Term("n7"), Term("n3")])))
+        self.assertFalse(engine.exists(Atom(Term("path"), [ Term("?x", True), Term("?x", True)])))
+
+        # and the same without a cache
+        engine = Engine(program, max_cached_queries=0)
+        for i in range(10):
+            engine.push_fact(Atom(Term("edge"), [ Term("n%d" % i), Term("n%d" % (i + 1))]))
+        self.assertEqual(len(engine.get_matching_facts(query, offset=8, limit=5)), 2)
+        self.assertEqual(len(engine.get_matching_facts(query, offset=4)), 6)
+        self.assertTrue(engine.exists(query))
+
+    def test_query(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        engine = Engine(program)
+        for (x, y) in [("a", "b"), ("b", "c"), ("c", "a"), ("c", "d")]:
+            engine.push_fact(Atom(Term("edge"), [ Term(x), Term(y)]))
+        x = Term("?x", True)
+        y = Term("?y", True)
+        # the edges that are on a cycle
+        query = [Atom(Term("edge"), [ x, y]), Atom(Term("path"), [ y, x])]
+        self.assertEqual(set([(str(b[x.id]), str(b[y.id])) for b in engine.query(query)]),
+                         set([("a", "b"), ("b", "c"), ("c", "a")]))
+
+    def test_statistics(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        for (x, y) in [("a", "b"), ("b", "c"), ("c", "a")]:
+            program.add_fact(Rule(Atom(Term("edge"), [ Term(x), Term(y)]), []))
+        self.assertIsNone(Engine(program).stats)
 
+        engine = Engine(program, statistics=True)
+        counts = engine.stats.counts
+        self.assertEqual(counts['facts pushed'], 3)
+        self.assertEqual(counts['rules pushed'], 2)
+        # 3 edges and 9 paths
+        self.assertEqual(counts['facts new'], 12)
+        self.assertTrue(counts['rule index unifications'] <= counts['rule index candidates'])
+        top = engine.stats.top_rules()
+        self.assertEqual(set([rule for (rule, number) in top]), set(program.rules))
 
+        # and they can be turned off and on again later
+        engine.enable_statistics(False)
+        self.assertIsNone(engine.stats)
+        self.assertIsNone(engine.fact_index.stats)
+        engine.enable_statistics()
+        engine.push_fact(Atom(Term("edge"), [ Term("c"), Term("d")]))
+        self.assertEqual(engine.stats.counts['facts pushed'], 1)
+        self.assertEqual(engine.stats.counts['facts new'], 4)
+        engine.get_matching_facts(Atom(Term("path"), [ Term("?x", True), Term("d")]))
+        self.assertEqual(engine.stats.counts['fact index unifications'], 3)
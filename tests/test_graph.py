@@ -0,0 +1,63 @@
+import unittest
+from eunomia.parser import Parser
+from eunomia.graph import DependencyGraph
+from eunomia.symbols import symbols
+import eunomia.utils
+
+def key(name, arity):
+    return (symbols.intern(name), arity)
+
+class TestDependencyGraph(unittest.TestCase):
+
+    def setUp(self):
+        eunomia.utils.clear_tmp_parse_files()
+
+    def test_components(self):
+        program = Parser().parse("""
+            s(?x) :- r(?x).
+            r(?x) :- q(?x).
+            q(?x) :- p(?x), r(?x).
+            p(?x) :- e(?x).
+            t(?x) :- t(?x), e(?x).
+            """)
+        graph = DependencyGraph(program.rules)
+        components = [set(c) for c in graph.components()]
+
+        self.assertEqual(len(components), 5)
+        self.assertIn(set([key('q', 1), key('r', 1)]), components)
+        position = {}
+        for i, component in enumerate(components):
+            for k in component:
+                position[k] = i
+        self.assertLess(position[key('e', 1)], position[key('p', 1)])
+        self.assertLess(position[key('p', 1)], position[key('q', 1)])
+        self.assertLess(position[key('r', 1)], position[key('s', 1)])
+        self.assertLess(position[key('e', 1)], position[key('t', 1)])
+
+    def test_is_recursive(self):
+        program = Parser().parse("""
+            p(?x) :- e(?x).
+            t(?x) :- t(?x), e(?x).
+            a(?x) :- b(?x).
+            b(?x) :- a(?x).
+            """)
+        graph = DependencyGraph(program.rules)
+        recursive = {}
+        for component in graph.components():
+            recursive[frozenset(component)] = graph.is_recursive(component)
+
+        self.assertFalse(recursive[frozenset([key('p', 1)])])
+        self.assertFalse(recursive[frozenset([key('e', 1)])])
+        self.assertTrue(recursive[frozenset([key('t', 1)])])
+        self.assertTrue(recursive[frozenset([key('a', 1), key('b', 1)])])
+
+    def test_deep_chain(self):
+        rules = "\n".join(["p%d(?x) :- p%d(?x)." % (i + 1, i) for i in range(3000)])
+        graph = DependencyGraph(Parser().parse(rules).rules)
+        components = graph.components()
+        self.assertEqual(len(components), 3001)
+        self.assertEqual(components[0], [key('p0', 1)])
+        self.assertEqual(components[-1], [key('p3000', 1)])
+
+if __name__ == '__main__':
+    unittest.main()
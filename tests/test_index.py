@@ -1,6 +1,7 @@
 import unittest
 from eunomia.index import AtomIndex, RuleIndex, FactIndex
 from eunomia.models import Atom, Term, Rule, Program
+from eunomia.symbols import symbols
 
 class TestIndex(unittest.TestCase):
     
@@ -17,17 +18,20 @@ class TestIndex(unittest.TestCase):
 
         # note that the index does not check for membership, we do this at the
         # Engine level
-        self.assertEqual(ind.index, {'p': {'a': {-1: ['random', 'random2', 'random2']}}})
+        p = symbols.intern('p')
+        a = symbols.intern('a')
+        self.assertEqual(ind.index, {p: {a: {-1: ['random', 'random2', 'random2']}}})
 
         at3 = Atom(Term("p"), [Term("a"), Term("d")])
         ind.add(at3, value)
-        self.assertEqual(ind.index, {'p': {'a': {'d': ['random'], -1: ['random', 'random2', 'random2']}}})
+        d = symbols.intern('d')
+        self.assertEqual(ind.index, {p: {a: {d: ['random'], -1: ['random', 'random2', 'random2']}}})
 
     def test_add_variable_first_argument(self):
         ind = AtomIndex()
         at = Atom(Term("p"), [Term("?x", True), Term("a")])
         ind.add(at, "random")
-        self.assertEqual(ind.index, {'p': {-1: {'a': ['random']}}})
+        self.assertEqual(ind.index, {at.predicate.id: {-1: {at.args[1].id: ['random']}}})
 
     def test_get_values(self):
         ind = AtomIndex()
@@ -182,6 +186,27 @@ class TestIndex(unittest.TestCase):
 
         self.assertEqual(set(map(lambda x: x.hash(), ind.get_all_facts())), set([at2.hash(), at3.hash()]))
     
+    def test_iter_and_count_facts(self):
+        ind = FactIndex()
+        facts = [Atom(Term("p"), [Term("a"), Term("b")]),
+                 Atom(Term("p"), [Term("b"), Term("a")]),
+                 Atom(Term("q"), [Term("c")])]
+        for fact in facts + facts:
+            ind.add_fact(fact)
+        # rows without an atom are not facts to iterate over
+        ind.add_row(Term("r").id, (Term("a").id,))
+
+        self.assertEqual(sorted(map(str, ind.iter_facts())), sorted(map(str, facts)))
+        self.assertEqual(ind.count_facts(), 4)
+        self.assertEqual(ind.count_facts(Term("p").id), 2)
+        self.assertEqual(ind.count_facts(Term("q").id), 1)
+        self.assertEqual(ind.count_facts(Term("s").id), 0)
+
+        ind.remove_fact(facts[0])
+        self.assertEqual(ind.count_facts(), 3)
+        self.assertEqual(ind.count_facts(Term("p").id), 1)
+        self.assertNotIn('p(a, b)', list(map(str, ind.iter_facts())))
+
     def test_print_fact_index(self):
         at = Atom(Term("p"), [Term("a"), Term("?x", True)])
         at2 = Atom(Term("p"), [Term("a"), Term("b", False)])
@@ -198,8 +223,8 @@ class TestIndex(unittest.TestCase):
         ind = AtomIndex()
         at = Atom(Term("p"), [Term("a"), Term("?x", True)])
         ind.add(at, "random")
-        self.assertEqual([], ind._AtomIndex__find(ind.index[at.predicate.value], []))
-        self.assertEqual([], ind._AtomIndex__find_more_specific(ind.index[at.predicate.value], []))
+        self.assertEqual([], ind._AtomIndex__find(ind.index[at.predicate.id], []))
+        self.assertEqual([], list(ind._AtomIndex__find_more_specific(ind.index[at.predicate.id], [])))
 
     def test_print_rule_index(self):
         at = Atom(Term("p"), [Term("a"), Term("?x", True)])
@@ -216,3 +241,134 @@ class TestIndex(unittest.TestCase):
 
 
 
+    def test_lookup(self):
+        ind = FactIndex()
+        ind.add_fact(Atom(Term("p"), [Term("a"), Term("b")]))
+        ind.add_fact(Atom(Term("p"), [Term("c"), Term("b")]))
+        p, a, b, c = [Term(s).id for s in "pabc"]
+
+        self.assertEqual(len(ind.lookup(p, 2, (), ())), 2)
+        self.assertEqual(ind.lookup(p, 2, (1,), (b,)), [(a, b), (c, b)])
+        self.assertEqual(ind.lookup(p, 2, (0, 1), (c, b)), [(c, b)])
+        self.assertEqual(list(ind.lookup(p, 2, (0,), (b,))), [])
+        self.assertEqual(list(ind.lookup(p, 1, (0,), (a,))), [])
+
+        # the hash index on the second position is kept up to date
+        ind.add_fact(Atom(Term("p"), [Term("b"), Term("b")]))
+        self.assertEqual(ind.lookup(p, 2, (1,), (b,)), [(a, b), (c, b), (b, b)])
+
+    def test_adaptive_indexes(self):
+        ind = FactIndex()
+        for (x, y) in [("a", "b"), ("c", "b"), ("a", "c")]:
+            ind.add_fact(Atom(Term("p"), [Term(x), Term(y)]))
+        p, a, b, c = [Term(s).id for s in "pabc"]
+        relation_hash_indexes = lambda: ind.hash_indexes.get((p, 2), {})
+
+        # joins scan the relation until the positions were asked for often
+        for i in range(FactIndex.INDEX_THRESHOLD - 1):
+            self.assertEqual(sorted(ind.lookup(p, 2, (1,), (b,))), sorted([(a, b), (c, b)]))
+        self.assertNotIn((1,), relation_hash_indexes())
+        self.assertEqual(sorted(ind.lookup(p, 2, (1,), (b,))), sorted([(a, b), (c, b)]))
+        self.assertIn((1,), relation_hash_indexes())
+
+        # queries use the same indexes
+        query = Atom(Term("p"), [Term("?x", True), Term("c")])
+        self.assertEqual(list(map(str, ind.get_matching_facts(query))), ['p(a, c)'])
+
+        # and build them the same way, walking the atom index until then
+        query = Atom(Term("p"), [Term("a"), Term("?y", True)])
+        for i in range(FactIndex.INDEX_THRESHOLD - 1):
+            self.assertEqual(sorted(map(str, ind.get_matching_facts(query))), ['p(a, b)', 'p(a, c)'])
+        self.assertNotIn((0,), relation_hash_indexes())
+        self.assertEqual(sorted(map(str, ind.get_matching_facts(query))), ['p(a, b)', 'p(a, c)'])
+        self.assertIn((0,), relation_hash_indexes())
+
+        # the indexes are kept up to date
+        ind.add_fact(Atom(Term("p"), [Term("a"), Term("a")]))
+        ind.remove_fact(Atom(Term("p"), [Term("a"), Term("c")]))
+        self.assertEqual(sorted(map(str, ind.get_matching_facts(query))), ['p(a, a)', 'p(a, b)'])
+        self.assertEqual(list(ind.lookup(p, 2, (1,), (c,))), [])
+
+        # repeated variables are still checked
+        query = Atom(Term("p"), [Term("?x", True), Term("?x", True)])
+        self.assertEqual(list(map(str, ind.get_matching_facts(query))), ['p(a, a)'])
+
+        # with all positions bound the rows are probed, without an index
+        for i in range(2 * FactIndex.INDEX_THRESHOLD):
+            self.assertEqual(list(ind.lookup(p, 2, (0, 1), (a, b))), [(a, b)])
+            self.assertEqual(list(ind.lookup(p, 2, (0, 1), (b, a))), [])
+            self.assertEqual(ind.get_matching_facts(Atom(Term("p"), [Term("a"), Term("b")])),
+                             [Atom(Term("p"), [Term("a"), Term("b")])])
+        self.assertNotIn((0, 1), relation_hash_indexes())
+        self.assertEqual(list(ind.lookup(Term("q").id, 2, (0, 1), (a, b))), [])
+
+    def test_idle_indexes_are_dropped(self):
+        ind = FactIndex()
+        ind.INDEX_IDLE_MINIMUM = 10
+        p = Term("p").id
+        for i in range(5):
+            ind.add_row(p, (i, i % 2))
+        for i in range(FactIndex.INDEX_THRESHOLD):
+            ind.lookup(p, 2, (0,), (0,))
+            ind.lookup(p, 2, (1,), (0,))
+        self.assertEqual(set(ind.hash_indexes[(p, 2)]), set([(0,), (1,)]))
+
+        # only the index on the first position stays in use
+        for i in range(5, 40):
+            ind.add_row(p, (i, i % 2))
+            self.assertEqual(ind.lookup(p, 2, (0,), (i,)), [(i, i % 2)])
+        self.assertEqual(set(ind.hash_indexes[(p, 2)]), set([(0,)]))
+
+        # a dropped index is built again once it is asked for often
+        for i in range(FactIndex.INDEX_THRESHOLD):
+            self.assertEqual(len(ind.lookup(p, 2, (1,), (1,))), 20)
+        self.assertEqual(set(ind.hash_indexes[(p, 2)]), set([(0,), (1,)]))
+
+    def test_iter_matching_facts(self):
+        ind = FactIndex()
+        for i in range(100):
+            ind.add_fact(Atom(Term("p"), [Term("a%d" % (i % 10)), Term("b%d" % i)]))
+        query = Atom(Term("p"), [Term("a3"), Term("?y", True)])
+
+        # the answers come one at a time
+        answers = ind.iter_matching_facts(query)
+        self.assertEqual(str(next(answers))[:6], 'p(a3, ')
+        self.assertEqual(len(list(answers)), 9)
+        self.assertEqual(sorted(map(str, ind.iter_matching_facts(query))),
+                         sorted(map(str, ind.get_matching_facts(query))))
+
+        self.assertEqual(list(ind.iter_matching_facts(Atom(Term("p"), [Term("?x", True), Term("?x", True)]))), [])
+        self.assertEqual(list(ind.iter_matching_facts(Atom(Term("q"), [Term("?x", True)]))), [])
+        self.assertEqual(len(list(ind.iter_matching_facts(Atom(Term("p"), [Term("?x", True), Term("?y", True)])))), 100)
+
+    def test_statistics(self):
+        ind = FactIndex()
+        for i in range(10):
+            ind.add_fact(Atom(Term("p"), [Term("a%d" % (i % 5)), Term("b%d" % (i % 2))]))
+        p = Term("p").id
+        self.assertEqual(len(ind), 10)
+        self.assertEqual(ind.count(p, 2), 10)
+        self.assertEqual(ind.count(p, 1), 0)
+        self.assertEqual(ind.distinct(p, 2, 0), 5)
+        self.assertEqual(ind.distinct(p, 2, 1), 2)
+        self.assertEqual(ind.distinct(p, 1, 0), 1)
+
+    def test_exact_match(self):
+        ind = FactIndex()
+        fact = Atom(Term("p"), [Term("a"), Term("b")])
+        self.assertTrue(ind.add_fact(fact))
+        self.assertFalse(ind.add_fact(Atom(Term("p"), [Term("a"), Term("b")])))
+        self.assertEqual(len(ind), 1)
+
+        self.assertIn(Atom(Term("p"), [Term("a"), Term("b")]), ind)
+        self.assertNotIn(Atom(Term("p"), [Term("b"), Term("a")]), ind)
+        self.assertNotIn(Atom(Term("p"), [Term("a")]), ind)
+
+        # a ground query gets the stored fact itself
+        self.assertIs(ind.get_matching_facts(Atom(Term("p"), [Term("a"), Term("b")]))[0], fact)
+        self.assertEqual(ind.get_matching_facts(Atom(Term("p"), [Term("b"), Term("b")])), [])
+
+        ind.remove_fact(fact)
+        self.assertNotIn(fact, ind)
+        self.assertTrue(ind.add_fact(fact))
+
@@ -50,3 +50,11 @@ class TestLexer(unittest.TestCase):
         tok = self.lexer.token()
         self.assertFalse(tok)
 
+
+    def test_lexers_are_independent(self):
+        other = Lexer()
+        self.lexer.input("a b")
+        other.input("?x")
+        self.assertEqual(self.lexer.token().value, "a")
+        self.assertEqual(other.token().value, "?x")
+        self.assertEqual(self.lexer.token().value, "b")
@@ -0,0 +1,97 @@
+import unittest
+import random
+from eunomia.models import Rule, Atom, Term
+from eunomia.engine import Engine
+from eunomia.seminaive import SemiNaiveEngine
+from eunomia.parser import Parser
+from eunomia.magic import query, rewrite
+import eunomia.magic
+import eunomia.utils
+
+class TestMagic(unittest.TestCase):
+
+    def setUp(self):
+        eunomia.utils.clear_tmp_parse_files()
+        self.parser = Parser('atom')
+
+    def graph(self, edges):
+        program = eunomia.utils.load_program('examples/path.lp')
+        for (x, y) in edges:
+            program.add_fact(Rule(Atom(Term("edge"), [ Term(x), Term(y) ]), []))
+        return program
+
+    def assertSameAnswers(self, program, text):
+        atom = self.parser.parse(text)
+        expected = set(map(str, Engine(program).get_matching_facts(atom)))
+        self.assertEqual(set(map(str, query(program, atom))), expected)
+        return expected
+
+    def test_path(self):
+        program = self.graph([("a", "b"), ("b", "c"), ("c", "d"), ("x", "y"), ("y", "z")])
+        answers = self.assertSameAnswers(program, "path(a, ?x)")
+        self.assertEqual(answers, set(["path(a, b)", "path(a, c)", "path(a, d)"]))
+        self.assertSameAnswers(program, "path(?x, d)")
+        self.assertSameAnswers(program, "path(?x, ?y)")
+        self.assertSameAnswers(program, "path(?x, ?x)")
+        self.assertSameAnswers(program, "path(a, c)")
+        self.assertSameAnswers(program, "path(a, x)")
+        self.assertSameAnswers(program, "edge(a, ?x)")
+
+    def test_only_relevant_facts(self):
+        program = self.graph([("a", "b"), ("b", "c"), ("x", "y"), ("y", "z"), ("z", "w")])
+        rewritten, answer = rewrite(program, self.parser.parse("path(a, ?x)"))
+        self.assertEqual(str(answer), "path#bf(a, ?x)")
+        derived = [f for f in SemiNaiveEngine(rewritten).get_facts()
+                   if str(f).startswith("path")]
+        # nothing about x, y, z or w
+        self.assertEqual(set(map(str, derived)),
+                         set(["path#bf(a, b)", "path#bf(a, c)", "path#bf(b, c)"]))
+
+    def test_facts_only(self):
+        program = self.graph([("a", "b"), ("a", "c"), ("b", "b"), ("a", "b")])
+        self.assertSameAnswers(program, "edge(a, ?x)")
+        self.assertSameAnswers(program, "edge(?x, ?x)")
+        self.assertEqual(query(program, self.parser.parse("edge(c, ?x)")), [])
+        self.assertEqual(query(program, self.parser.parse("nothing(?x)")), [])
+
+        # answered from the facts, without evaluating the rules
+        engine = eunomia.magic.SemiNaiveEngine
+        eunomia.magic.SemiNaiveEngine = None
+        try:
+            self.assertEqual(list(map(str, query(program, self.parser.parse("edge(a, b)")))),
+                             ["edge(a, b)"])
+        finally:
+            eunomia.magic.SemiNaiveEngine = engine
+
+    def test_random_graph(self):
+        rnd = random.Random(3)
+        edges = [("n%d" % rnd.randint(0, 20), "n%d" % rnd.randint(0, 20)) for i in range(30)]
+        program = self.graph(edges)
+        for i in range(0, 21, 5):
+            self.assertSameAnswers(program, "path(n%d, ?x)" % i)
+            self.assertSameAnswers(program, "path(?x, n%d)" % i)
+
+    def test_idb_facts_and_constants(self):
+        program = Parser().parse("""
+            anc(?x, ?y) :- parent(?x, ?y).
+            anc(?x, ?z) :- parent(?x, ?y), anc(?y, ?z).
+            anc(eve, adam).
+            related(?x, ?y) :- anc(?x, ?z), anc(?y, ?z).
+            self(?x) :- anc(?x, ?x).
+            parent(cain, eve). parent(abel, eve). parent(seth, adam).
+            parent(adam, adam).
+            """)
+        self.assertSameAnswers(program, "anc(cain, ?x)")
+        self.assertSameAnswers(program, "related(cain, ?y)")
+        self.assertSameAnswers(program, "related(?x, seth)")
+        self.assertSameAnswers(program, "self(?x)")
+
+        program.add_rule(Parser('rule').parse("cains(?x) :- anc(cain, ?x)."))
+        self.assertSameAnswers(program, "cains(?x)")
+        self.assertSameAnswers(program, "cains(adam)")
+
+    def test_ex_20150102(self):
+        program = eunomia.utils.load_program('examples/ex_20150102.lp')
+        self.assertEqual(set(map(str, query(program, self.parser.parse("p(?x)")))), set(["p(b)"]))
+        self.assertEqual(query(program, self.parser.parse("p(a)")), [])
+
@@ -0,0 +1,160 @@
+import unittest
+import os
+import random
+import shutil
+import tempfile
+from eunomia.models import Rule, Atom, Term
+from eunomia.engine import Engine
+from eunomia.seminaive import SemiNaiveEngine
+from eunomia.mapped import MappedFactIndex
+from eunomia.index import FactIndex
+import eunomia.utils
+
+class TestMappedFactIndex(unittest.TestCase):
+
+    def setUp(self):
+        eunomia.utils.clear_tmp_parse_files()
+        self.index = MappedFactIndex()
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_add_and_lookup(self):
+        index = self.index
+        f1 = Atom(Term("p"), [ Term("a"), Term("b")])
+        f2 = Atom(Term("p"), [ Term("a"), Term("c")])
+        f3 = Atom(Term("q"), [])
+        for f in [f1, f2, f3]:
+            index.add_fact(f)
+
+        p, a, b = Term("p").id, Term("a").id, Term("b").id
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.count(p, 2), 2)
+        self.assertEqual(index.count(p, 3), 0)
+        self.assertEqual(sorted(index.lookup(p, 2, (0,), (a,))), sorted([(a, b), (a, Term("c").id)]))
+        self.assertEqual(index.lookup(p, 2, (0, 1), (a, b)), [(a, b)])
+        self.assertEqual(index.lookup(p, 2, (1,), (a,)), [])
+        self.assertEqual(list(index.lookup(Term("q").id, 0, (), ())), [()])
+        self.assertEqual(index.distinct(p, 2, 0), 1)
+        self.assertEqual(index.distinct(p, 2, 1), 2)
+        self.assertEqual(set(map(str, index.get_all_facts())), set(['p(a, b)', 'p(a, c)', 'q()']))
+        self.assertEqual(set(map(str, index.iter_facts())), set(['p(a, b)', 'p(a, c)', 'q()']))
+        self.assertEqual(index.count_facts(), 3)
+        self.assertEqual(index.count_facts(p), 2)
+        self.assertEqual(index.count_facts(Term("r").id), 0)
+
+        query = Atom(Term("p"), [ Term("?x", True), Term("c")])
+        self.assertEqual(list(map(str, index.get_matching_facts(query))), ['p(a, c)'])
+        self.assertEqual(list(map(str, index.iter_matching_facts(query))), ['p(a, c)'])
+        query = Atom(Term("p"), [ Term("?x", True), Term("?y", True)])
+        self.assertEqual(len(list(index.iter_matching_facts(query))), 2)
+        self.assertEqual(list(index.iter_matching_facts(Atom(Term("r"), [ Term("?x", True)]))), [])
+
+    def test_growing(self):
+        index = self.index
+        rnd = random.Random(5)
+        reference = FactIndex()
+        for i in range(5000):
+            row = (rnd.randint(0, 50), rnd.randint(0, 2000))
+            index.add_row(7, row)
+            reference.add_row(7, row)
+            if i == 100:
+                # an index made early has to follow all additions
+                index.lookup(7, 2, (0,), (3,))
+        for key in range(51):
+            self.assertEqual(sorted(index.lookup(7, 2, (0,), (key,))),
+                             sorted(reference.lookup(7, 2, (0,), (key,))))
+        self.assertEqual(sorted(index.lookup(7, 2, (), ())), sorted(reference.lookup(7, 2, (), ())))
+
+    def test_remove(self):
+        index = self.index
+        rnd = random.Random(3)
+        reference = FactIndex()
+        facts = [Atom(Term("p"), [ Term("n%d" % rnd.randint(0, 9)), Term("n%d" % rnd.randint(0, 30))])
+                 for i in range(300)]
+        for fact in facts:
+            index.add_fact(fact)
+            reference.add_fact(fact)
+        # an index made before the removals has to follow them
+        p, n1 = Term("p").id, Term("n1").id
+        index.lookup(p, 2, (0,), (n1,))
+        for fact in facts[:100]:
+            if fact in reference:
+                index.remove_fact(fact)
+                reference.remove_fact(fact)
+        self.assertFalse(facts[0] in index)
+        # removed facts can be added again
+        self.assertTrue(index.add_fact(facts[0]))
+        reference.add_fact(facts[0])
+
+        self.assertEqual(len(index), len(reference))
+        self.assertEqual(index.count_facts(p), reference.count_facts(p))
+        self.assertEqual(set(map(str, index.iter_facts())), set(map(str, reference.iter_facts())))
+        for key in range(10):
+            key = (Term("n%d" % key).id,)
+            self.assertEqual(sorted(index.lookup(p, 2, (0,), key)),
+                             sorted(reference.lookup(p, 2, (0,), key)))
+
+        rule = Rule(Atom(Term("q"), [ Term("?x", True)]),
+                    [Atom(Term("p"), [ Term("n1"), Term("?x", True)])])
+        self.assertEqual(set(map(str, index.get_resolutions(rule))),
+                         set(map(str, reference.get_resolutions(rule))))
+
+    def test_retract(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        edges = [Atom(Term("edge"), [ Term(x), Term(y)])
+                 for (x, y) in [("a", "b"), ("b", "c"), ("c", "d"), ("a", "c")]]
+        recursive = program.rules[1]
+        engine = Engine(program, fact_index=self.index)
+        full = Engine(program)
+        for e in (engine, full):
+            for edge in edges:
+                e.push_fact(edge)
+            self.assertTrue(e.retract_fact(edges[1]))
+            self.assertTrue(e.retract_rule(recursive))
+        self.assertEqual(set(map(str, engine.get_facts())), set(map(str, full.get_facts())))
+        self.assertEqual(len(self.index), len(full.get_facts()))
+
+    def test_close_removes_files(self):
+        index = MappedFactIndex()
+        index.add_fact(Atom(Term("p"), [ Term("a")]))
+        self.assertTrue(os.listdir(index.directory))
+        index.close()
+        self.assertFalse(os.path.exists(index.directory))
+
+        directory = tempfile.mkdtemp()
+        try:
+            index = MappedFactIndex(directory)
+            index.add_fact(Atom(Term("p"), [ Term("a")]))
+            index.close()
+            self.assertTrue(os.listdir(directory))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_engines(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        rnd = random.Random(7)
+        for i in range(60):
+            x, y = rnd.randint(0, 15), rnd.randint(0, 15)
+            fact = Atom(Term("edge"), [ Term("n%d" % x), Term("n%d" % y)])
+            program.add_fact(Rule(fact, []))
+        expected = set(map(str, Engine(program).get_facts()))
+
+        engine = Engine(program, fact_index=self.index)
+        self.assertEqual(set(map(str, engine.get_facts())), expected)
+        query = Atom(Term("path"), [ Term("n3"), Term("?x", True)])
+        self.assertEqual(set(map(str, engine.get_matching_facts(query))),
+                         set(map(str, Engine(program).get_matching_facts(query))))
+
+        index = MappedFactIndex()
+        try:
+            engine = SemiNaiveEngine(program, fact_index=index)
+            self.assertEqual(set(map(str, engine.get_facts())), expected)
+            # the facts are only in the mapped files, not in a set next to them
+            self.assertFalse(hasattr(engine, 'facts'))
+            self.assertEqual(len(index), len(expected))
+        finally:
+            index.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import pickle
 from eunomia.models import Program, Rule, Atom, Term
 
 class TestModels(unittest.TestCase):
@@ -76,7 +77,7 @@ class TestModels(unittest.TestCase):
 
         mapping = atom1.unify_with_ground(atom2)
         self.assertEqual(len(mapping), 1)
-        self.assertEqual(mapping['?x'].value, 'c') 
+        self.assertEqual(mapping[var1.id].value, 'c') 
 
         atom3 = Atom(predicate2, [ var1, var1 ])
 
@@ -86,15 +87,15 @@ class TestModels(unittest.TestCase):
         atom4 = Atom(predicate2, [ constant1, constant1 ])
         mapping = atom3.unify_with_ground(atom4)
         self.assertEqual(len(mapping), 1)
-        self.assertEqual(mapping['?x'].value, 'a') 
+        self.assertEqual(mapping[var1.id].value, 'a') 
 
 
         var2 = Term("?y", True)
         atom5 = Atom(predicate1, [ var1, var2 ])
         mapping = atom5.unify_with_ground(atom2)
         self.assertEqual(len(mapping), 2)
-        self.assertEqual(mapping['?x'].value, 'a') 
-        self.assertEqual(mapping['?y'].value, 'c') 
+        self.assertEqual(mapping[var1.id].value, 'a') 
+        self.assertEqual(mapping[var2.id].value, 'c') 
 
 
         #for key in mapping:
@@ -167,7 +168,7 @@ class TestModels(unittest.TestCase):
     def test_resolve_term(self):
         var = Term("?x", True)
         var2 = Term("?y", True)
-        mapping = { '?x': Term("a") }
+        mapping = { var.id: Term("a") }
 
         self.assertEqual(var.resolve(mapping), Term("a"))
         self.assertEqual(var2.resolve(mapping), var2)
@@ -213,32 +214,37 @@ class TestModels(unittest.TestCase):
         program.merge(program2)
         self.assertEqual(str(program), "p(a) :- p(a, ?x), q(b, ?y).\np(a) :- p(a, ?x).\np(a).\nr(a).\nr(a).")
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    def test_structural_hash(self):
+        atom1 = Atom(Term("p"), [ Term("a"), Term("?x", True) ])
+        atom2 = Atom(Term("p"), [ Term("a"), Term("?x", True) ])
+        self.assertEqual(atom1, atom2)
+        self.assertEqual(hash(atom1), hash(atom2))
+        self.assertEqual(atom1.hash(), atom2.hash())
+        self.assertEqual(len(set([atom1, atom2])), 1)
+
+        rule1 = Rule(atom1, [atom2])
+        rule2 = Rule(atom2, (atom1,))
+        self.assertEqual(rule1, rule2)
+        self.assertEqual(hash(rule1), hash(rule2))
+
+        # a variable is never equal to the constant with the same name
+        self.assertNotEqual(Term("c"), Term("c", True))
+
+    def test_immutable(self):
+        term = Term("a")
+        atom = Atom(Term("p"), [ term ])
+        rule = Rule(atom, [])
+        self.assertRaises(AttributeError, setattr, term, 'is_var', True)
+        self.assertRaises(AttributeError, setattr, atom, 'args', ())
+        self.assertRaises(AttributeError, setattr, rule, 'body', ())
+        self.assertRaises(AttributeError, setattr, rule, 'extra', 1)
+
+    def test_pickle(self):
+        atom = Atom(Term("p"), [ Term("a"), Term("?x", True) ])
+        rule = Rule(atom, [atom])
+        self.assertEqual(pickle.loads(pickle.dumps(rule)), rule)
+
+    def test_term_from_id(self):
+        term = Term("a")
+        self.assertEqual(Term.from_id(term.id), term)
+        self.assertEqual(Term.from_id(Term("?x", True).id, True), Term("?x", True))
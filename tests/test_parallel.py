@@ -0,0 +1,64 @@
+import unittest
+import random
+from eunomia.models import Program, Rule, Atom, Term
+from eunomia.engine import Engine
+from eunomia.parallel import ParallelEngine
+import eunomia.utils
+from tests.test_engine import EngineCases
+
+class TestParallelEngine(EngineCases, unittest.TestCase):
+
+    def setUp(self):
+        eunomia.utils.clear_tmp_parse_files()
+
+    def make_engine(self, program):
+        return ParallelEngine(program, workers=2)
+
+    def random_path_program(self, edges, nodes):
+        program = eunomia.utils.load_program('examples/path.lp')
+        rnd = random.Random(11)
+        for i in range(edges):
+            x, y = rnd.randint(0, nodes), rnd.randint(0, nodes)
+            fact = Atom(Term("edge"), [ Term("n%d" % x), Term("n%d" % y)])
+            program.add_fact(Rule(fact, []))
+        return program
+
+    def test_same_model_as_engine(self):
+        program = self.random_path_program(300, 60)
+        expected = Engine(program).get_facts()
+
+        engine = ParallelEngine(Program(), workers=3)
+        engine.PARALLEL_MINIMUM = 10
+        engine.push_program(program)
+        facts = engine.get_facts()
+        self.assertEqual(len(facts), len(expected))
+        self.assertEqual(set(map(str, facts)), set(map(str, expected)))
+
+        # and incrementally, with the workers started on the current model
+        fact = Atom(Term("edge"), [ Term("n61"), Term("n0")])
+        engine.push_fact(fact)
+        program.add_fact(Rule(fact, []))
+        self.assertEqual(set(map(str, engine.get_facts())),
+                         set(map(str, Engine(program).get_facts())))
+
+    def test_get_matching_facts(self):
+        program = self.random_path_program(300, 60)
+        expected = Engine(program)
+
+        engine = ParallelEngine(Program(), workers=2)
+        engine.PARALLEL_MINIMUM = 10
+        engine.push_program(program)
+        self.assertEqual(engine.count_facts(), len(expected.get_facts()))
+        self.assertEqual(engine.count_facts("path"), expected.count_facts("path"))
+
+        (x, y) = (Term("?x", True), Term("?y", True))
+        for query in [Atom(Term("path"), [ Term("n1"), x]),
+                      Atom(Term("path"), [x, x]),
+                      Atom(Term("edge"), [x, y])]:
+            facts = engine.get_matching_facts(query)
+            self.assertTrue(facts)
+            self.assertEqual(set(map(str, facts)),
+                             set(map(str, expected.get_matching_facts(query))))
+
+if __name__ == '__main__':
+    unittest.main()
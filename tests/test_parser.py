@@ -1,8 +1,11 @@
 import unittest
 from eunomia.parser import Parser
+import eunomia.parser
 from eunomia.models import Term, Atom, Rule, Program
 import eunomia.utils
 import os
+import shutil
+import tempfile
 
 class TestParser(unittest.TestCase):
     
@@ -29,7 +32,7 @@ class TestParser(unittest.TestCase):
         self.assertEqual(str(result1), "p(a)")
         self.assertEqual(type(result1), Atom)
         self.assertEqual(result1.predicate, Term("p"))
-        self.assertEqual(result1.args, [Term("a")])
+        self.assertEqual(result1.args, (Term("a"),))
 
     def test_parse_atom2(self):
         self.parser = Parser('atom')
@@ -37,7 +40,7 @@ class TestParser(unittest.TestCase):
         self.assertEqual(str(result1), "p(a, b)")
         self.assertEqual(type(result1), Atom)
         self.assertEqual(result1.predicate, Term("p"))
-        self.assertEqual(result1.args, [Term("a"), Term("b")])
+        self.assertEqual(result1.args, (Term("a"), Term("b")))
 
     def test_parse_atom3(self):
         # empty args
@@ -46,7 +49,7 @@ class TestParser(unittest.TestCase):
         self.assertEqual(str(result1), "p()")
         self.assertEqual(type(result1), Atom)
         self.assertEqual(result1.predicate, Term("p"))
-        self.assertEqual(result1.args, [])
+        self.assertEqual(result1.args, ())
 
 
     def test_parse_atoms(self):
@@ -60,7 +63,7 @@ class TestParser(unittest.TestCase):
         result1 = self.parser.parse("p(a, b).")
         self.assertEqual(type(result1), Rule)
         self.assertEqual(str(result1.head), "p(a, b)")
-        self.assertEqual(result1.body, [])
+        self.assertEqual(result1.body, ())
 
     def test_parse_rule(self):
         self.parser = Parser('rule')
@@ -105,3 +108,62 @@ class TestParser(unittest.TestCase):
 
 
 
+
+    def test_tables_are_shared(self):
+        self.assertIs(Parser().parser, Parser().parser)
+        self.assertIs(Parser('atom').parser, Parser('atom').parser)
+        self.assertIsNot(Parser().parser, Parser('atom').parser)
+
+        # parsing writes no tables or logs
+        Parser().parse("p(a, b).")
+        for filename in ['parser.out', 'parsetab.py', 'parselog.txt']:
+            self.assertFalse(os.path.isfile(filename))
+
+    def test_tables_are_not_read(self):
+        # table modules that fail when they are imported
+        paths = ['parsetab.py', os.path.join(os.path.dirname(eunomia.parser.__file__), 'parsetab.py')]
+        for path in paths:
+            with open(path, 'w') as f:
+                f.write("raise RuntimeError('parser tables were read')\n")
+        saved = dict(eunomia.parser._parsers)
+        try:
+            eunomia.parser._parsers.clear()
+            self.assertEqual(str(Parser().parse("p(a, b).").facts[0]), "p(a, b).")
+            self.assertEqual(str(Parser('atom').parse("p(?x)")), "p(?x)")
+        finally:
+            eunomia.parser._parsers.clear()
+            eunomia.parser._parsers.update(saved)
+            for path in paths:
+                for name in [path, path + 'c']:
+                    if os.path.isfile(name):
+                        os.remove(name)
+
+    def test_tables_are_cached(self):
+        directory = tempfile.mkdtemp()
+        saved = dict(eunomia.parser._parsers)
+        old = os.environ.get('EUNOMIA_CACHE')
+        os.environ['EUNOMIA_CACHE'] = directory
+        try:
+            eunomia.parser._parsers.clear()
+            Parser('atom')
+            (name,) = os.listdir(directory)
+            path = os.path.join(directory, name)
+            self.assertTrue('atom' in name)
+            with open(path, 'rb') as f:
+                tables = f.read()
+
+            # a damaged table file is made again
+            with open(path, 'wb') as f:
+                f.write(b'garbage')
+            eunomia.parser._parsers.clear()
+            self.assertEqual(str(Parser('atom').parse("p(?x)")), "p(?x)")
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), tables)
+        finally:
+            if old is None:
+                del os.environ['EUNOMIA_CACHE']
+            else:
+                os.environ['EUNOMIA_CACHE'] = old
+            eunomia.parser._parsers.clear()
+            eunomia.parser._parsers.update(saved)
+            shutil.rmtree(directory)
@@ -0,0 +1,134 @@
+import unittest
+from eunomia.models import Atom, Term
+from eunomia.index import FactIndex
+from eunomia.plan import signature, JoinPlan, Planner
+from eunomia.parser import Parser
+import eunomia.utils
+
+class TestPlan(unittest.TestCase):
+
+    def setUp(self):
+        eunomia.utils.clear_tmp_parse_files()
+        self.parser = Parser('rule')
+
+    def facts(self, text):
+        index = FactIndex()
+        for rule in Parser('rules').parse(text):
+            index.add_fact(rule.head)
+        return index
+
+    def test_signature(self):
+        rule1 = self.parser.parse("path(a, ?z) :- path(b, ?z).")
+        rule2 = self.parser.parse("path(c, ?y) :- path(d, ?y).")
+        shape1, params1 = signature(rule1)
+        shape2, params2 = signature(rule2)
+        self.assertEqual(shape1, shape2)
+        self.assertEqual(params1, [Term("a").id, Term("b").id])
+        self.assertEqual(params2, [Term("c").id, Term("d").id])
+
+        # repeated variables are part of the shape
+        rule3 = self.parser.parse("path(c, ?y) :- path(?y, ?y).")
+        self.assertNotEqual(signature(rule3)[0], shape1)
+
+    def test_steps(self):
+        rule = self.parser.parse("p(?x, ?z) :- q(?x, ?y, a), r(?y, ?z, ?z).")
+        plan = JoinPlan(signature(rule)[0])
+        self.assertEqual(len(plan.steps), 2)
+        (position, pred, arity, key_positions, key_slots, binds, checks) = plan.steps[0]
+        self.assertEqual((position, arity, key_positions, len(binds), checks), (0, 3, (2,), 2, ()))
+        (position, pred, arity, key_positions, key_slots, binds, checks) = plan.steps[1]
+        # ?y is bound by the first step, the second ?z is a check
+        self.assertEqual((position, key_positions, len(binds), len(checks)), (1, (0,), 1, 1))
+
+        # starting from the second atom
+        plan = JoinPlan(signature(rule)[0], 1)
+        self.assertEqual([step[0] for step in plan.steps], [1, 0])
+        self.assertEqual(plan.steps[1][3], (1, 2))
+
+    def test_derive(self):
+        facts = self.facts("q(a, b, c). q(b, c, c). r(b, d, d). r(c, d, e). r(c, f, f).")
+        rule = self.parser.parse("p(?x, ?z) :- q(?x, ?y, c), r(?y, ?z, ?z).")
+        result = Planner(facts).derive(rule)
+        self.assertEqual(set(map(str, result)), set(["p(a, d)", "p(b, f)"]))
+
+        # a partial rule with the same shape reuses the plan
+        planner = Planner(facts)
+        planner.derive(rule)
+        partial = self.parser.parse("p(?x, ?z) :- q(?x, ?y, b), r(?y, ?z, ?z).")
+        self.assertEqual(planner.derive(partial), [])
+        self.assertEqual(len(planner.plans), 1)
+
+    def test_run_with_seed(self):
+        facts = self.facts("e(a, b). e(b, c). e(c, d).")
+        rule = self.parser.parse("p(?x, ?z) :- e(?x, ?y), e(?y, ?z).")
+        planner = Planner(facts)
+        plan, params = planner.plan(rule, 1)
+        seed = (Term("b").id, Term("c").id)
+        rows = plan.run(facts, params, seed)
+        self.assertEqual([str(planner.to_atom(plan.head_pred, row)) for row in rows], ["p(a, c)"])
+
+        # facts to skip are only skipped after the first position
+        skip = { Term("e").id: set([(Term("a").id, Term("b").id)]) }
+        self.assertEqual(plan.run(facts, params, seed, skip), rows)
+        plan, params = planner.plan(rule, 0)
+        seed = (Term("b").id, Term("c").id)
+        skip = { Term("e").id: set([(Term("c").id, Term("d").id)]) }
+        self.assertEqual(plan.run(facts, params, seed, skip), [])
+        self.assertEqual(len(plan.run(facts, params, seed)), 1)
+
+    def test_cost_based_order(self):
+        text = " ".join(["big(n%d, m%d)." % (i, i % 10) for i in range(100)])
+        facts = self.facts(text + " small(m3, a). small(m4, b).")
+        rule = self.parser.parse("p(?x) :- big(?x, ?y), small(?y, a).")
+        planner = Planner(facts)
+        plan, params = planner.plan(rule)
+        # small has 2 facts, one of which has a: it goes first
+        self.assertEqual([step[0] for step in plan.steps], [1, 0])
+
+        explained = planner.explain(rule)
+        self.assertEqual([str(atom) for (atom, estimated, actual) in explained], ["small(?y, a)", "big(?x, ?y)"])
+        self.assertEqual([actual for (atom, estimated, actual) in explained], [1, 10])
+        self.assertEqual([estimated for (atom, estimated, actual) in explained], [1.0, 10.0])
+        self.assertEqual(len(planner.derive(rule)), 10)
+
+    def test_no_estimates_keeps_order(self):
+        rule = self.parser.parse("p(?x) :- big(?x, ?y), small(?y, a).")
+        plan = JoinPlan(signature(rule)[0])
+        self.assertEqual([step[0] for step in plan.steps], [0, 1])
+        self.assertEqual(plan.estimates, [])
+
+    def test_replan(self):
+        facts = self.facts("small(m3, a).")
+        rule = self.parser.parse("p(?x) :- big(?x, ?y), small(?y, a).")
+        planner = Planner(facts)
+        plan = planner.plan(rule)[0]
+        self.assertEqual([step[0] for step in plan.steps], [0, 1])
+        # big is empty: probing it first is cheapest, until it grows
+        for i in range(200):
+            facts.add_fact(Atom(Term("big"), [ Term("n%d" % i), Term("m3") ]))
+        self.assertTrue(planner.plan(rule)[0] is not plan)
+        self.assertEqual([step[0] for step in planner.plan(rule)[0].steps], [1, 0])
+
+
+    def test_query(self):
+        facts = self.facts("edge(a, b). edge(b, a). edge(b, c). path(a, b). path(b, a). path(a, c).")
+        planner = Planner(facts)
+        query = Parser('atoms').parse("edge(?x, ?y), path(?y, ?x)")
+        x, y = query[0].args
+        bindings = planner.query(query)
+        self.assertEqual(set([(str(b[x.id]), str(b[y.id])) for b in bindings]),
+                         set([("a", "b"), ("b", "a")]))
+        # the bindings make the atoms facts
+        for binding in bindings:
+            for atom in query:
+                self.assertEqual(facts.get_matching_facts(atom.resolve(binding)), [atom.resolve(binding)])
+
+        # constants and repeated variables
+        query = Parser('atoms').parse("edge(a, ?y), path(?y, ?y)")
+        self.assertEqual(planner.query(query), [])
+        query = Parser('atoms').parse("edge(?x, c), path(a, ?x)")
+        self.assertEqual([str(b[query[0].args[0].id]) for b in planner.query(query)], ["b"])
+
+        # without variables the answer is one empty binding, or none
+        self.assertEqual(planner.query(Parser('atoms').parse("edge(a, b), path(a, c)")), [{}])
+        self.assertEqual(planner.query(Parser('atoms').parse("edge(a, b), path(c, a)")), [])
@@ -0,0 +1,80 @@
+import unittest
+import random
+from eunomia.parser import Parser
+from eunomia.reader import read, read_program
+import eunomia.utils
+
+class TestReader(unittest.TestCase):
+
+    def setUp(self):
+        eunomia.utils.clear_tmp_parse_files()
+        self.parser = Parser()
+
+    def parse(self, text):
+        """
+        The rules of text with both the Parser and the reader, or None for a
+        syntax error.
+        """
+        try:
+            expected = self.parser.parse(text)
+        except SyntaxError:
+            expected = None
+        try:
+            actual = read_program(text.splitlines(True))
+        except SyntaxError:
+            actual = None
+        if expected is not None:
+            expected = (expected.rules, expected.facts)
+        if actual is not None:
+            actual = (actual.rules, actual.facts)
+        return expected, actual
+
+    def test_examples(self):
+        for filename in ['examples/path.lp', 'examples/ex_20150102.lp']:
+            with open(filename) as f:
+                text = f.read()
+            expected, actual = self.parse(text)
+            self.assertIsNotNone(expected)
+            self.assertEqual(actual, expected)
+
+    def test_same_language_as_parser(self):
+        cases = ['', 'p(,a).', 'p(,).', 'p(a,).', '?x(a).', 'p(a) :- .',
+                 'p(a) q(b).', 'p(a)-:q.', 'p(a):-q(b)', 'p(a b).', 'p().',
+                 'p(a).\r\nq(?).', 'p(a)..', 'p(a) :-\n q(?x),\n r(?x, b).',
+                 'p(a):- :-q(b).', 'p(a)%$:-q(b).', 'p(a). :- q(b).']
+        for text in cases:
+            expected, actual = self.parse(text)
+            self.assertEqual(actual, expected, text)
+
+    def test_random_token_strings(self):
+        rnd = random.Random(3)
+        pieces = ['p', 'q', '?x', '?y', 'a', '(', ')', ',', '.', ':-', ' ', '\n', '?', ':', '-']
+        # mostly well-formed programs with some noise, so both sides happen
+        rules = ['p(a).', 'q(?x, a) :- p(?x).', '?x(a, b).', 'p(,a) :- q(a, ?y), p(?y).', 'r().']
+        for i in range(300):
+            text = ' '.join([rnd.choice(rules) for k in range(rnd.randint(0, 4))])
+            for k in range(rnd.randint(0, 2)):
+                at = rnd.randint(0, len(text))
+                text = text[:at] + rnd.choice(pieces) + text[at:]
+            expected, actual = self.parse(text)
+            self.assertEqual(actual, expected, text)
+
+    def test_read_is_incremental(self):
+        consumed = []
+        def lines():
+            for i in range(3):
+                consumed.append(i)
+                yield 'edge(n%d, n%d).\n' % (i, i + 1)
+            raise AssertionError('read too far')
+
+        rules = read(lines())
+        self.assertEqual(str(next(rules)), 'edge(n0, n1).')
+        self.assertEqual(consumed, [0])
+
+    def test_error_after_rules(self):
+        rules = read(['p(a).\n', 'q(b) r(c).\n'])
+        self.assertEqual(str(next(rules)), 'p(a).')
+        self.assertRaises(SyntaxError, next, rules)
+
+if __name__ == '__main__':
+    unittest.main()
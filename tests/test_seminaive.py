@@ -0,0 +1,63 @@
+import unittest
+import random
+from eunomia.models import Rule, Atom, Term
+from eunomia.engine import Engine
+from eunomia.seminaive import SemiNaiveEngine
+from eunomia.parser import Parser
+import eunomia.utils
+from tests.test_engine import EngineCases
+
+class TestSemiNaiveEngine(EngineCases, unittest.TestCase):
+
+    def setUp(self):
+        eunomia.utils.clear_tmp_parse_files()
+
+    def make_engine(self, program):
+        return SemiNaiveEngine(program)
+
+    def test_push_rule_after_facts(self):
+        program = eunomia.utils.load_program('examples/ex_20150102.lp')
+        rules = program.rules
+        program.rules = []
+        engine = SemiNaiveEngine(program)
+        self.assertEqual(len(engine.get_facts()), 3)
+
+        engine.push_rules(rules)
+        expected = ['r(b)', 'p(b)', 'q(b)', 's(a)', 'r(a)', 's(b)']
+        self.assertEqual(set(map(str, engine.get_facts())), set(expected))
+
+    def test_same_model_as_engine(self):
+        program = eunomia.utils.load_program('examples/path.lp')
+        rnd = random.Random(7)
+        for i in range(60):
+            x, y = rnd.randint(0, 15), rnd.randint(0, 15)
+            fact = Atom(Term("edge"), [ Term("n%d" % x), Term("n%d" % y)])
+            program.add_fact(Rule(fact, []))
+
+        expected = set(map(str, Engine(program).get_facts()))
+        self.assertEqual(set(map(str, SemiNaiveEngine(program).get_facts())), expected)
+
+    def test_strata(self):
+        program = Parser().parse("""
+            e(a, b). e(b, c). e(c, a). e(c, d).
+            reach(?x, ?y) :- e(?x, ?y).
+            reach(?x, ?z) :- e(?x, ?y), back(?y, ?z).
+            back(?x, ?y) :- reach(?x, ?y).
+            end(?y) :- reach(?x, ?y), sink(?y).
+            sink(?x) :- e(?y, ?x), e(?x, ?z).
+            """)
+        engine = SemiNaiveEngine(program)
+        heads = [set([r.head.predicate.value for r in s[0]]) for s in engine.strata]
+        recursive = [s[2] for s in engine.strata]
+        self.assertEqual(len(heads), 3)
+        self.assertTrue(recursive[heads.index(set(['reach', 'back']))])
+        self.assertFalse(recursive[heads.index(set(['sink']))])
+        self.assertEqual(heads[-1], set(['end']))
+
+        expected = set(map(str, Engine(program).get_facts()))
+        self.assertEqual(set(map(str, engine.get_facts())), expected)
+
+        engine.push_fact(Atom(Term("e"), [ Term("d"), Term("a")]))
+        program.add_fact(Rule(Atom(Term("e"), [ Term("d"), Term("a")]), []))
+        expected = set(map(str, Engine(program).get_facts()))
+        self.assertEqual(set(map(str, engine.get_facts())), expected)
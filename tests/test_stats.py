@@ -0,0 +1,58 @@
+import unittest
+from eunomia.stats import Statistics
+from eunomia.parser import Parser
+import eunomia.utils
+
+class TestStatistics(unittest.TestCase):
+
+    def setUp(self):
+        eunomia.utils.clear_tmp_parse_files()
+        self.parser = Parser('rule')
+
+    def test_count(self):
+        stats = Statistics()
+        stats.count('facts new')
+        stats.count('facts new', 2)
+        stats.count('facts known', 0)
+        self.assertEqual(stats.counts, {'facts new': 3, 'facts known': 0})
+
+    def test_resolutions_per_source_rule(self):
+        stats = Statistics()
+        rule = self.parser.parse("p(?x, ?z) :- q(?x, ?y), r(?y, ?z).")
+        other = self.parser.parse("s(?x) :- q(?x, ?x).")
+        partial = self.parser.parse("p(a, ?z) :- r(b, ?z).")
+        fact = self.parser.parse("p(a, c).")
+
+        stats.resolved(rule, partial)
+        # resolutions of a partial rule count for the rule it came from
+        stats.resolved(partial, fact)
+        stats.derived(partial, 2)
+        stats.derived(other, 1)
+        stats.derived(other, 0)
+        self.assertEqual(stats.top_rules(), [(rule, 4), (other, 1)])
+        self.assertEqual(stats.top_rules(1), [(rule, 4)])
+
+        stats.reset()
+        self.assertEqual(stats.top_rules(), [])
+        self.assertEqual(stats.origins, {})
+
+    def test_max_rules(self):
+        stats = Statistics(max_rules=4)
+        rules = [self.parser.parse("p%d(?x) :- q(?x), r(?x)." % i) for i in range(10)]
+        partials = [self.parser.parse("p%d(a) :- r(a)." % i) for i in range(10)]
+        fact = self.parser.parse("q(a).")
+        for (i, rule) in enumerate(rules):
+            for k in range(i + 1):
+                stats.resolved(rule, partials[i])
+            stats.resolved(partials[i], fact)
+            self.assertTrue(len(stats.resolutions) <= 4)
+            self.assertTrue(len(stats.origins) <= 4)
+
+        # the rules with the most resolutions are kept, with their counts
+        self.assertEqual(stats.top_rules(1), [(rules[9], 11)])
+        self.assertEqual(stats.origins[partials[9]], rules[9])
+        self.assertFalse(partials[0] in stats.origins)
+
+
+if __name__ == '__main__':
+    unittest.main()
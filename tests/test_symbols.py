@@ -0,0 +1,27 @@
+import unittest
+from eunomia.symbols import SymbolTable, symbols
+from eunomia.models import Term
+
+class TestSymbols(unittest.TestCase):
+
+    def test_intern(self):
+        table = SymbolTable()
+        self.assertEqual(table.intern("a"), 0)
+        self.assertEqual(table.intern("b"), 1)
+        # interning again gives the same id
+        self.assertEqual(table.intern("a"), 0)
+        self.assertEqual(len(table), 2)
+        self.assertTrue("b" in table)
+        self.assertFalse("c" in table)
+
+    def test_name(self):
+        table = SymbolTable()
+        sid = table.intern("?x")
+        self.assertEqual(table.name(sid), "?x")
+
+    def test_terms_share_ids(self):
+        self.assertEqual(Term("a").id, Term("a").id)
+        self.assertNotEqual(Term("a").id, Term("b").id)
+        self.assertEqual(symbols.name(Term("a").id), "a")
+        self.assertEqual(Term("a").value, "a")
+
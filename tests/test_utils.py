@@ -1,6 +1,8 @@
 import unittest
 import eunomia.utils
+import eunomia.reader
 import os
+import tempfile
 
 class TestUtils(unittest.TestCase):
     
@@ -24,3 +26,23 @@ class TestUtils(unittest.TestCase):
         self.assertFalse(os.path.isfile('parsetab.pyc'))
 
 
+
+    def test_load_program(self):
+        with open('examples/path.lp') as f:
+            expected = eunomia.reader.read_program(f)
+        self.assertEqual(str(eunomia.utils.load_program('examples/path.lp')), str(expected))
+        self.assertEqual(eunomia.utils.load_program('examples/does_not_exist.lp'), None)
+
+    def test_load_program_reader(self):
+        # the file is read with eunomia.reader, which reports the line of an
+        # error (the Parser does not)
+        (fd, path) = tempfile.mkstemp(suffix='.lp')
+        with os.fdopen(fd, 'w') as f:
+            f.write('p(a).\nq(b) :- .\n')
+        try:
+            eunomia.utils.load_program(path)
+            self.fail('no SyntaxError')
+        except SyntaxError as e:
+            self.assertTrue('line 2' in str(e))
+        finally:
+            os.remove(path)